@@ -1,9 +1,48 @@
 '''
 Main file for running the application. Aggregates various projects together.
+"python -m flask run" serves it from a single process for development, see serve.py for production.
 '''
 
+import os
+
 from flask import Flask
-from restaurant_matcher.match_service.routes import match_service_blueprint
+from restaurant_matcher.data_management.dataset_holder import DatasetHolder
+from restaurant_matcher.data_management.dataset_registry import DatasetRegistry
+from restaurant_matcher.match_service.conditional_requests import DEFAULT_MAX_AGE
+from restaurant_matcher.match_service.metrics import Metrics
+from restaurant_matcher.match_service.query_cache import QueryCache
+from restaurant_matcher.match_service.routes import create_match_service_blueprint
+
+def create_app(check_interval=5, read_only=False):
+    '''
+    Loads the dataset and builds the app, configured by the MATCH_SERVICE_* environment variables
+    args:
+        check_interval: optional int, seconds between checks of the default dataset's files for changes,
+                        None leaves reloading it to the caller, see serve.py
+        read_only: optional bool, answer writes and reloads with a 405, for servers running several processes
+    return:
+        Flask, app serving the match service, app.extensions["dataset_registry"] holds its DatasetRegistry
+    '''
+    # loaded once per process, every request reads from the same snapshot
+    # a snapshot compiled by restaurant_matcher.data_management.snapshot skips parsing the csv files
+    engine = os.environ.get('MATCH_SERVICE_ENGINE', 'list')
+    dataset_holder = DatasetHolder(os.environ.get('MATCH_SERVICE_CUISINES_CSV', 'fixtures/cuisines.csv'),
+                                   os.environ.get('MATCH_SERVICE_RESTAURANTS_CSV', 'fixtures/restaurants.csv'),
+                                   check_interval=check_interval, engine=engine,
+                                   snapshot_path=os.environ.get('MATCH_SERVICE_SNAPSHOT'))
+    # the datasets of other regions are loaded on their first request, see DatasetRegistry
+    regions_memory_mb = os.environ.get('MATCH_SERVICE_REGIONS_MEMORY_MB')
+    dataset_registry = DatasetRegistry(dataset_holder, os.environ.get('MATCH_SERVICE_REGIONS_DIR'),
+                                       int(regions_memory_mb) * 2 ** 20 if regions_memory_mb else None, engine)
+    query_cache = QueryCache(max_entries=1024, ttl=300)
+    # requests slower than MATCH_SERVICE_SLOW_QUERY_MS are written to the slow query log
+    metrics = Metrics(slow_query_seconds=int(os.environ.get('MATCH_SERVICE_SLOW_QUERY_MS', 500)) / 1000)
+    # seconds clients and proxies may reuse a search response, after that they revalidate it with its ETag
+    max_age = int(os.environ.get('MATCH_SERVICE_MAX_AGE', DEFAULT_MAX_AGE))
+
+    app = Flask(__name__)
+    app.register_blueprint(create_match_service_blueprint(dataset_registry, query_cache, metrics, max_age,
+                                                          read_only))
+    app.extensions["dataset_registry"] = dataset_registry
 
-app = Flask(__name__)
-app.register_blueprint(match_service_blueprint)
+    return app
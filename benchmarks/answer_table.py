@@ -0,0 +1,51 @@
+'''
+Reports the build time and memory of the materialized answer table and compares its query latency against the list engine.
+Run from the repository root: python -m benchmarks.answer_table [--restaurants 100000]
+'''
+import argparse
+import os
+import tempfile
+
+from benchmarks.name_search import time_per_call
+from benchmarks.synthetic_data import write_restaurants_csv
+from restaurant_matcher.data_management.data_manager import DataManager
+from restaurant_matcher.data_management.materialized_data_manager import MaterializedDataManager
+
+QUERIES = [
+    {},
+    {'distance': '3'},
+    {'rating': '5', 'price': '15'},
+    {'cuisine': 'chinese', 'distance': '2'},
+    {'cuisine': 'an', 'rating': '4', 'distance': '5', 'price': '30'},
+    {'name': 'grill', 'rating': '3'},
+    {'name': 'hotspot bar', 'cuisine': 'thai'},
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--restaurants', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        restaurant_csv_path = os.path.join(directory, 'restaurants.csv')
+        write_restaurants_csv(restaurant_csv_path, args.restaurants, args.seed)
+        list_data_manager = DataManager('fixtures/cuisines.csv', restaurant_csv_path)
+        materialized_data_manager = MaterializedDataManager('fixtures/cuisines.csv', restaurant_csv_path)
+
+    report = materialized_data_manager.answer_table_report
+    print(f'{args.restaurants} restaurants, {report.combinations} combinations, {report.stored_ids} stored ids')
+    print(f'build: {report.build_seconds:.2f}s, table: {report.table_bytes / 2 ** 20:.1f} MiB '
+          f'({report.table_bytes / args.restaurants:.0f} bytes per restaurant)')
+    print(f'{"query":<60}{"matches":>10}{"list ms":>12}{"table ms":>12}')
+    for query in QUERIES:
+        matches = materialized_data_manager.return_filtered_results(query)
+        assert matches == list_data_manager.return_filtered_results(query)
+
+        list_ms = time_per_call(lambda: list_data_manager.return_filtered_results(query), args.repeat)
+        table_ms = time_per_call(lambda: materialized_data_manager.return_filtered_results(query), args.repeat)
+        print(f'{str(query):<60}{len(matches):>10}{list_ms:>12.3f}{table_ms:>12.3f}')
+
+if __name__ == '__main__':
+    main()
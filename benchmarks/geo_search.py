@@ -0,0 +1,69 @@
+'''
+Compares located queries answered from the grid index against ranking every located restaurant by its distance.
+Run from the repository root: python -m benchmarks.geo_search [--restaurants 1000000]
+'''
+import argparse
+import tempfile
+import time
+
+from benchmarks.name_search import time_per_call
+from benchmarks.synthetic_data import NEIGHBOURHOOD_CENTERS, generate_dataset
+from restaurant_matcher.data_management.data_manager import DataManager
+from restaurant_matcher.data_management.geo import MICRODEGREES, MISSING_COORDINATE, return_distance_km, return_distance_unit
+
+LATITUDE, LONGITUDE = NEIGHBOURHOOD_CENTERS[0]
+# (query params, limit)
+QUERIES = [
+    ({'radius': '0.5'}, None),
+    ({'radius': '2'}, None),
+    ({'radius': '2', 'rating': '5', 'cuisine': 'thai'}, None),
+    ({'distance': '10'}, None),
+    ({}, 10),
+    ({}, 100),
+    ({'rating': '5', 'price': '20'}, 10),
+]
+
+def return_scanned_results(data_manager, params, limit):
+    '''
+    Answers a located query without the grid, computing the distance of every located restaurant
+    '''
+    storage = data_manager.data_storage
+    latitude, longitude = float(params['lat']), float(params['lng'])
+    radius = data_manager.return_geo_radius(params)
+    matches = data_manager.return_match_predicate(params)
+    rank_keys = []
+    for restaurant_id, restaurant_latitude in enumerate(storage.latitude_column):
+        if restaurant_latitude == MISSING_COORDINATE:
+            continue
+        distance = return_distance_km(latitude, longitude, restaurant_latitude / MICRODEGREES,
+                                      storage.longitude_column[restaurant_id] / MICRODEGREES)
+        if (radius is None or distance <= radius) and matches(restaurant_id):
+            rank_keys.append(storage.return_rank_key(restaurant_id, return_distance_unit(distance)))
+
+    return [rank_key & 0xFFFFFFFF for rank_key in sorted(rank_keys)[:limit]]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--restaurants', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cuisine_csv_path, restaurant_csv_path = generate_dataset(directory, args.restaurants, args.seed, geo=True)
+        start = time.perf_counter()
+        data_manager = DataManager(cuisine_csv_path, restaurant_csv_path)
+        print(f'{args.restaurants} restaurants loaded in {time.perf_counter() - start:.1f}s, '
+              f'{len(data_manager.data_storage.geo_grid.cells)} grid cells')
+
+    print(f'{"query":<52}{"limit":>7}{"matches":>10}{"grid ms":>10}{"scan ms":>10}')
+    for extra_params, limit in QUERIES:
+        params = dict(extra_params, lat=str(LATITUDE), lng=str(LONGITUDE))
+        restaurant_ids = data_manager.return_geo_results(params, limit)
+        assert restaurant_ids == return_scanned_results(data_manager, params, limit)
+        grid_ms = time_per_call(lambda: data_manager.return_geo_results(params, limit), args.repeat)
+        scan_ms = time_per_call(lambda: return_scanned_results(data_manager, params, limit), args.repeat)
+        print(f'{str(extra_params):<52}{str(limit):>7}{len(restaurant_ids):>10}{grid_ms:>10.2f}{scan_ms:>10.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+'''
+Reports the memory DataStorage holds per restaurant, measured with tracemalloc.
+Run from the repository root: python -m benchmarks.memory [--restaurants 100000]
+'''
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from benchmarks.synthetic_data import write_restaurants_csv
+from restaurant_matcher.data_management.data_storage import DataStorage
+
+def measure_ingest(cuisine_csv_path, restaurant_csv_path):
+    '''
+    Returns the bytes still allocated by an ingested DataStorage
+    '''
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+
+    data_storage = DataStorage()
+    data_storage.ingest(cuisine_csv_path, restaurant_csv_path)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return data_storage, current - baseline, peak - baseline
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--restaurants', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        restaurant_csv_path = os.path.join(directory, 'restaurants.csv')
+        write_restaurants_csv(restaurant_csv_path, args.restaurants, args.seed)
+        data_storage, retained, peak = measure_ingest('fixtures/cuisines.csv', restaurant_csv_path)
+
+    print(f'{data_storage.restaurant_count} restaurants')
+    print(f'retained: {retained / data_storage.restaurant_count:.0f} bytes per restaurant ({retained / 2 ** 20:.1f} MiB)')
+    print(f'peak during ingest: {peak / data_storage.restaurant_count:.0f} bytes per restaurant ({peak / 2 ** 20:.1f} MiB)')
+
+if __name__ == '__main__':
+    main()
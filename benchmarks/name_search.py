@@ -0,0 +1,50 @@
+'''
+Compares the trigram name index against the previous full scan name match.
+Run from the repository root: python -m benchmarks.name_search [--restaurants 100000]
+'''
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_data import write_restaurants_csv
+from restaurant_matcher.data_management.data_manager import DataManager
+
+QUERIES = ['grill', 'Palace', 'tasty kitchen', 'hotspot bar', 'HARBOR', 'ch', 'no such place']
+
+def scan_restaurant_names(data_manager, name):
+    '''
+    The previous name match, lowercases and checks every stored name
+    '''
+    return [id for id, restaurant_name in enumerate(data_manager.data_storage.names) if name.lower() in restaurant_name.lower()]
+
+def time_per_call(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--restaurants', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        restaurant_csv_path = os.path.join(directory, 'restaurants.csv')
+        write_restaurants_csv(restaurant_csv_path, args.restaurants, args.seed)
+        data_manager = DataManager('fixtures/cuisines.csv', restaurant_csv_path)
+
+    print(f'{args.restaurants} restaurants, {len(data_manager.data_storage.name_trigrams)} trigrams')
+    print(f'{"query":<16}{"matches":>10}{"scan ms":>12}{"index ms":>12}')
+    for query in QUERIES:
+        matches = data_manager.return_filtered_restaurant_names(query)
+        assert matches == scan_restaurant_names(data_manager, query)
+
+        scan_ms = time_per_call(lambda: scan_restaurant_names(data_manager, query), args.repeat)
+        index_ms = time_per_call(lambda: data_manager.return_filtered_restaurant_names(query), args.repeat)
+        print(f'{query:<16}{len(matches):>10}{scan_ms:>12.3f}{index_ms:>12.3f}')
+
+if __name__ == '__main__':
+    main()
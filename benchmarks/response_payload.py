@@ -0,0 +1,51 @@
+'''
+Compares building a response body from dicts serialized per request against joining pre-encoded fragments.
+Run from the repository root: python -m benchmarks.response_payload [--restaurants 100000]
+'''
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.name_search import time_per_call
+from benchmarks.synthetic_data import write_restaurants_csv
+from restaurant_matcher.data_management.data_manager import DataManager
+
+RESULT_SIZES = [10, 1000, 100000]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--restaurants', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        restaurant_csv_path = os.path.join(directory, 'restaurants.csv')
+        write_restaurants_csv(restaurant_csv_path, args.restaurants, args.seed)
+        data_manager = DataManager('fixtures/cuisines.csv', restaurant_csv_path)
+
+    start = time.perf_counter()
+    data_manager.build_restaurant_fragments()
+    build_seconds = time.perf_counter() - start
+    encoded_bytes = sum(map(len, data_manager.restaurant_fragments.fragments))
+    print(f'{args.restaurants} restaurants, fragments built in {build_seconds:.2f}s, '
+          f'{encoded_bytes / args.restaurants:.0f} bytes of json per restaurant')
+
+    ranked_ids = data_manager.return_filtered_results({})
+    print(f'{"results":>10}{"dicts + json ms":>18}{"fragments ms":>15}{"name,price ms":>15}')
+    for result_size in RESULT_SIZES:
+        restaurant_ids = ranked_ids[:result_size]
+        expected = json.dumps(data_manager.return_restaurant_information(restaurant_ids)).encode()
+        assert data_manager.return_restaurant_json(restaurant_ids) == expected
+
+        dicts_ms = time_per_call(lambda: json.dumps(data_manager.return_restaurant_information(restaurant_ids)).encode(),
+                                 args.repeat)
+        fragments_ms = time_per_call(lambda: data_manager.return_restaurant_json(restaurant_ids), args.repeat)
+        projection_ms = time_per_call(lambda: data_manager.return_restaurant_json(restaurant_ids, ('name', 'price')),
+                                      args.repeat)
+        print(f'{len(restaurant_ids):>10}{dicts_ms:>18.3f}{fragments_ms:>15.3f}{projection_ms:>15.3f}')
+
+if __name__ == '__main__':
+    main()
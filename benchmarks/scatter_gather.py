@@ -0,0 +1,63 @@
+'''
+Compares the sharded engine's scatter-gather against the single process list engine on synthetic data.
+The speedup depends on the cores available, with one core the shards only add their messaging overhead.
+Run from the repository root: python -m benchmarks.scatter_gather [--restaurants 1000000] [--shards 2 4 8]
+'''
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.name_search import time_per_call
+from benchmarks.synthetic_data import generate_dataset
+from restaurant_matcher.data_management.data_manager import DataManager
+from restaurant_matcher.data_management.sharded_data_manager import ShardedDataManager
+
+QUERIES = [
+    {},
+    {'distance': '5'},
+    {'cuisine': 'an', 'rating': '3'},
+    {'name': 'grill'},
+    {'name': 'tasty kitchen', 'price': '30'},
+]
+PAGE_SIZE = 20
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--restaurants', type=int, default=100000)
+    parser.add_argument('--shards', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    print(f'{args.restaurants} restaurants, {os.cpu_count()} cores')
+    with tempfile.TemporaryDirectory() as directory:
+        cuisine_csv_path, restaurant_csv_path = generate_dataset(directory, args.restaurants, args.seed)
+        list_data_manager = DataManager(cuisine_csv_path, restaurant_csv_path)
+        sharded_data_managers = {}
+        for shard_count in args.shards:
+            start = time.perf_counter()
+            sharded_data_managers[shard_count] = ShardedDataManager(cuisine_csv_path, restaurant_csv_path,
+                                                                    shard_count=shard_count)
+            print(f'{shard_count} shards loaded in {time.perf_counter() - start:.1f}s')
+
+    print(f'{"query":<44}{"matches":>10}{"list ms":>10}' + ''.join(f'{f"{count} shards ms":>16}' for count in args.shards))
+    for query in QUERIES:
+        matches = list_data_manager.return_filtered_results(query)
+        row = f'{str(query):<44}{len(matches):>10}'
+        row += f'{time_per_call(lambda: list_data_manager.return_filtered_results(query), args.repeat):>10.2f}'
+        for sharded_data_manager in sharded_data_managers.values():
+            assert sharded_data_manager.return_filtered_results(query) == matches
+            row += f'{time_per_call(lambda: sharded_data_manager.return_filtered_results(query), args.repeat):>16.2f}'
+        print(row)
+
+    print(f'first page of {PAGE_SIZE}')
+    for query in QUERIES:
+        row = f'{str(query):<44}{"":>10}'
+        row += f'{time_per_call(lambda: list_data_manager.return_top_results(query, PAGE_SIZE), args.repeat):>10.2f}'
+        for sharded_data_manager in sharded_data_managers.values():
+            row += f'{time_per_call(lambda: sharded_data_manager.return_top_results(query, PAGE_SIZE), args.repeat):>16.2f}'
+        print(row)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+'''
+Load tests the pre-fork server of serve.py against the single process development server, over HTTP on synthetic data.
+Reports the throughput and latency of each, and the memory of every server process after the load:
+rss counts the shared pages in every process mapping them, pss splits them between those processes
+and private is what a process holds alone, copied or allocated after the fork.
+Workers only add throughput with as many cores as workers. Reads /proc, so it only runs on Linux.
+Run from the repository root: python -m benchmarks.serving_load [--restaurants 100000] [--workers 4] [--clients 8]
+'''
+import argparse
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+from benchmarks.suite import return_latency_summary, return_query_mix
+from benchmarks.synthetic_data import generate_dataset
+
+# smaps_rollup fields reported per process, private is the sum of the two private fields
+MEMORY_FIELDS = ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty')
+
+def return_server_commands(port, workers):
+    '''
+    return:
+        dict, server name to the command starting it
+    '''
+    serve_command = [sys.executable, 'serve.py', '--port', str(port), '--workers', str(workers), '--quiet']
+    return {
+        "flask run": [sys.executable, '-m', 'flask', 'run', '--port', str(port)],
+        f"serve.py {workers} workers, no freeze": serve_command + ['--no-freeze'],
+        f"serve.py {workers} workers": serve_command,
+    }
+
+def wait_until_ready(process, port, timeout=600):
+    '''
+    Polls the server until it answers, loading the dataset takes a while
+    raises:
+        RuntimeError, if the server exited or did not answer in time
+    '''
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with code {process.returncode} while loading')
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/match_service/?limit=1', timeout=5):
+                return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError(f'Server did not answer within {timeout}s')
+
+def run_client(port, queries, seconds):
+    '''
+    Client process loop, sends the queries one after the other, round robin, for the given time
+    return:
+        list[float], latency of every request in seconds
+    '''
+    latencies = []
+    deadline = time.monotonic() + seconds
+    index = 0
+    while time.monotonic() < deadline:
+        request_start = time.perf_counter()
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        connection.request('GET', '/match_service/?' + urlencode(queries[index % len(queries)]))
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        assert response.status == 200, response.status
+        latencies.append(time.perf_counter() - request_start)
+        index += 1
+
+    return latencies
+
+def return_process_memory(pid):
+    '''
+    return:
+        dict, rss, pss and private memory of the process in MiB
+    '''
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as read_obj:
+        for line in read_obj:
+            field, _, value = line.partition(':')
+            if field in MEMORY_FIELDS:
+                values[field] = int(value.split()[0]) / 1024
+
+    return {"rss": values['Rss'], "pss": values['Pss'], "private": values['Private_Clean'] + values['Private_Dirty']}
+
+def return_child_pids(pid):
+    '''
+    return:
+        list[int], pids of the processes whose parent is pid
+    '''
+    child_pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as read_obj:
+                # the command name is in parentheses and may hold spaces, the parent pid is the second field after it
+                fields = read_obj.read().rpartition(')')[2].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            child_pids.append(int(entry))
+
+    return sorted(child_pids)
+
+def measure_server(command, environment, port, query_mix, args):
+    '''
+    Starts a server, loads it with the client processes and reads the memory of its processes
+    return:
+        dict, latency summary and throughput
+        list[tuple], (process name, memory) of the server's processes
+    '''
+    process = subprocess.Popen(command, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(process, port)
+        queries = [dict(params, limit=args.limit) for params_list in query_mix.values() for params in params_list]
+        # every client starts at a different query so they do not all hit the same one at once
+        client_queries = [queries[client:] + queries[:client] for client in range(args.clients)]
+
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.clients) as pool:
+            client_latencies = pool.starmap(run_client, [(port, queries, args.seconds) for queries in client_queries])
+        elapsed = time.perf_counter() - start
+
+        latencies = [latency for latencies in client_latencies for latency in latencies]
+        load_results = return_latency_summary(latencies)
+        load_results["requests_per_second"] = round(len(latencies) / elapsed, 1)
+
+        memory = [("master" if return_child_pids(process.pid) else "process", return_process_memory(process.pid))]
+        memory += [(f"worker {index}", return_process_memory(pid))
+                   for index, pid in enumerate(return_child_pids(process.pid), 1)]
+    finally:
+        process.terminate()
+        process.wait()
+
+    return load_results, memory
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--restaurants', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--limit', type=int, default=20, help='page size of every request')
+    parser.add_argument('--engine', default='list')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    query_mix = return_query_mix(args.seed, 20)
+    print(f'{args.restaurants} restaurants, {os.cpu_count()} cores, {args.clients} clients for {args.seconds:g}s each')
+    with tempfile.TemporaryDirectory() as directory:
+        cuisine_csv_path, restaurant_csv_path = generate_dataset(directory, args.restaurants, args.seed)
+        environment = dict(os.environ, FLASK_APP='app', MATCH_SERVICE_ENGINE=args.engine,
+                           MATCH_SERVICE_CUISINES_CSV=cuisine_csv_path, MATCH_SERVICE_RESTAURANTS_CSV=restaurant_csv_path)
+
+        for server, command in return_server_commands(args.port, args.workers).items():
+            load_results, memory = measure_server(command, environment, args.port, query_mix, args)
+            print(f'\n{server}: {load_results["requests_per_second"]} requests/s, '
+                  f'p50 {load_results["p50_ms"]:.1f}ms, p99 {load_results["p99_ms"]:.1f}ms')
+            print(f'{"":<12}{"rss MiB":>10}{"pss MiB":>10}{"private MiB":>14}')
+            for name, process_memory in memory:
+                print(f'{name:<12}{process_memory["rss"]:>10.1f}{process_memory["pss"]:>10.1f}{process_memory["private"]:>14.1f}')
+            print(f'{"total":<12}{"":>10}{sum(process_memory["pss"] for _, process_memory in memory):>10.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+'''
+End to end benchmark suite over seeded synthetic datasets, writes a json report that can be diffed between commits.
+Measures ingest time, memory per restaurant, query latency percentiles per query class, order_results scaling
+and endpoint throughput.
+Run from the repository root:
+    python -m benchmarks.suite [--sizes 10000 100000 1000000] [--engine list] [--output results.json]
+    python -m benchmarks.suite --compare before.json after.json
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+
+from flask import Flask
+
+from benchmarks.memory import measure_ingest
+from benchmarks.synthetic_data import CUISINE_NAMES, NAME_WORDS, generate_dataset
+from restaurant_matcher.data_management.dataset_holder import DatasetHolder
+from restaurant_matcher.data_management.dataset_registry import DatasetRegistry
+from restaurant_matcher.data_management.engines import create_data_manager
+from restaurant_matcher.match_service.routes import create_match_service_blueprint
+
+PERCENTILES = (50, 90, 99)
+
+def return_query_mix(seed, queries_per_class):
+    '''
+    Builds the seeded queries of every query class, the same seed always gives the same queries
+    args:
+        seed: int, seed of the query values
+        queries_per_class: int, queries to build per class
+    return:
+        dict, query class to a list of request params
+    '''
+    randomizer = random.Random(seed)
+    cuisines = [name.lower() for name in CUISINE_NAMES] + ['an', 'ese']
+    names = [word.lower() for word in NAME_WORDS] + ['ch', 'grill 1', 'no such place']
+
+    def rating():
+        return str(randomizer.randint(1, 5))
+    def distance():
+        return str(randomizer.randint(1, 10))
+    def price():
+        return str(randomizer.randrange(10, 55, 5))
+
+    query_classes = {
+        "unfiltered": lambda: {},
+        "single_range": lambda: randomizer.choice([{"rating": rating()}, {"distance": distance()}, {"price": price()}]),
+        "cuisine": lambda: {"cuisine": randomizer.choice(cuisines), "distance": distance()},
+        "name": lambda: {"name": randomizer.choice(names)},
+        "all_params": lambda: {"name": randomizer.choice(names), "cuisine": randomizer.choice(cuisines),
+                               "rating": rating(), "distance": distance(), "price": price()},
+    }
+    return {query_class: [build_query() for _ in range(queries_per_class)]
+            for query_class, build_query in query_classes.items()}
+
+def return_latency_summary(latencies):
+    '''
+    args:
+        latencies: list[float], seconds per call
+    return:
+        dict, p50/p90/p99/max and mean latency in milliseconds
+    '''
+    latencies = sorted(latencies)
+    summary = {f"p{percentile}_ms": latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)] * 1000
+               for percentile in PERCENTILES}
+    summary["max_ms"] = latencies[-1] * 1000
+    summary["mean_ms"] = sum(latencies) / len(latencies) * 1000
+
+    return {key: round(value, 4) for key, value in summary.items()}
+
+def measure_queries(data_manager, query_mix):
+    '''
+    Times return_filtered_results plus encoding the response for every query of the mix
+    return:
+        dict, query class to its latency summary and mean result count
+    '''
+    query_results = {}
+    for query_class, queries in query_mix.items():
+        latencies = []
+        result_count = 0
+        for params in queries:
+            start = time.perf_counter()
+            restaurant_ids = data_manager.return_filtered_results(params)
+            data_manager.return_restaurant_json(restaurant_ids)
+            latencies.append(time.perf_counter() - start)
+            result_count += len(restaurant_ids)
+
+        query_results[query_class] = return_latency_summary(latencies)
+        query_results[query_class]["mean_results"] = round(result_count / len(queries), 1)
+
+    return query_results
+
+def measure_ordering(data_manager, seed, repeat=5):
+    '''
+    Times order_results on random subsets of a tenth, half and all of the restaurants
+    return:
+        dict, subset share to its latency summary
+    '''
+    randomizer = random.Random(seed)
+    restaurant_count = data_manager.data_storage.restaurant_count
+    ordering_results = {}
+    for share in (0.1, 0.5, 1.0):
+        restaurant_ids = set(randomizer.sample(range(restaurant_count), int(restaurant_count * share)))
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data_manager.order_results(restaurant_ids)
+            latencies.append(time.perf_counter() - start)
+        ordering_results[f"{int(share * 100)}_percent"] = return_latency_summary(latencies)
+
+    return ordering_results
+
+def measure_endpoint(cuisine_csv_path, restaurant_csv_path, engine, query_mix, limit):
+    '''
+    Sends the query mix through the search endpoint with Flask's test client, the query cache is left out
+    so every request runs its query
+    args:
+        limit: int, page size of every request, responses of unfiltered queries are otherwise the whole dataset
+    return:
+        dict, requests sent, requests per second and the latency summary
+    '''
+    dataset_holder = DatasetHolder(cuisine_csv_path, restaurant_csv_path, check_interval=None, engine=engine)
+    app = Flask(__name__)
+    app.register_blueprint(create_match_service_blueprint(DatasetRegistry(dataset_holder)))
+    client = app.test_client()
+
+    latencies = []
+    start = time.perf_counter()
+    for queries in query_mix.values():
+        for params in queries:
+            request_start = time.perf_counter()
+            response = client.get('/match_service/', query_string={**params, "limit": limit})
+            assert response.status_code == 200, response.data
+            latencies.append(time.perf_counter() - request_start)
+    elapsed = time.perf_counter() - start
+
+    endpoint_results = return_latency_summary(latencies)
+    endpoint_results["requests"] = len(latencies)
+    endpoint_results["requests_per_second"] = round(len(latencies) / elapsed, 1)
+
+    return endpoint_results
+
+def run_size(restaurant_count, args):
+    '''
+    Generates a dataset of restaurant_count restaurants and runs every measurement on it
+    return:
+        dict, measurements of this size
+    '''
+    query_mix = return_query_mix(args.seed, args.queries)
+    with tempfile.TemporaryDirectory() as directory:
+        cuisine_csv_path, restaurant_csv_path = generate_dataset(directory, restaurant_count, args.seed)
+
+        start = time.perf_counter()
+        data_manager = create_data_manager(cuisine_csv_path, restaurant_csv_path, args.engine)
+        ingest_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        data_manager.build_restaurant_fragments()
+        fragments_seconds = time.perf_counter() - start
+
+        # a second, storage only load under tracemalloc, which slows the ingest it measures
+        data_storage, retained, peak = measure_ingest(cuisine_csv_path, restaurant_csv_path)
+        del data_storage
+
+        size_results = {
+            "ingest_seconds": round(ingest_seconds, 3),
+            "fragments_seconds": round(fragments_seconds, 3),
+            "storage_bytes_per_restaurant": round(retained / restaurant_count, 1),
+            "peak_ingest_bytes_per_restaurant": round(peak / restaurant_count, 1),
+            "queries": measure_queries(data_manager, query_mix),
+            "order_results": measure_ordering(data_manager, args.seed),
+        }
+        del data_manager
+        size_results["endpoint"] = measure_endpoint(cuisine_csv_path, restaurant_csv_path, args.engine, query_mix,
+                                                    args.limit)
+
+    return size_results
+
+def return_metadata(args):
+    '''
+    return:
+        dict, what the report was run against, to tell apart reports of different commits and machines
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "engine": args.engine,
+        "seed": args.seed,
+        "queries_per_class": args.queries,
+        "limit": args.limit,
+    }
+
+def flatten_metrics(results, prefix=''):
+    '''
+    args:
+        results: dict, nested measurements
+    return:
+        dict, dotted metric path to its numeric value
+    '''
+    metrics = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            metrics.update(flatten_metrics(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)):
+            metrics[f'{prefix}{key}'] = value
+
+    return metrics
+
+def compare_reports(before_path, after_path):
+    '''
+    Prints every metric of two reports side by side with the relative change
+    '''
+    with open(before_path) as read_obj:
+        before = flatten_metrics(json.load(read_obj)["results"])
+    with open(after_path) as read_obj:
+        after = flatten_metrics(json.load(read_obj)["results"])
+
+    print(f'{"metric":<60}{"before":>14}{"after":>14}{"change":>10}')
+    for metric in sorted(before.keys() & after.keys()):
+        change = f'{(after[metric] - before[metric]) / before[metric] * 100:+.1f}%' if before[metric] else ''
+        print(f'{metric:<60}{before[metric]:>14}{after[metric]:>14}{change:>10}')
+    for metric in sorted(before.keys() ^ after.keys()):
+        print(f'{metric:<60} only in {"before" if metric in before else "after"}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--engine', default='list')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--queries', type=int, default=50, help='queries per query class')
+    parser.add_argument('--limit', type=int, default=20, help='page size of the endpoint requests')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two reports instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_reports(*args.compare)
+        return
+
+    report = {"metadata": return_metadata(args), "results": {}}
+    for restaurant_count in args.sizes:
+        print(f'{restaurant_count} restaurants...', flush=True)
+        report["results"][str(restaurant_count)] = run_size(restaurant_count, args)
+
+    # sorted keys and one value per line keep reports of two commits diffable
+    with open(args.output, 'w') as write_obj:
+        json.dump(report, write_obj, indent=2, sort_keys=True)
+        write_obj.write('\n')
+    print(f'Wrote {os.path.abspath(args.output)}')
+
+if __name__ == '__main__':
+    main()
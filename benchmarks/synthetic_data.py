@@ -0,0 +1,136 @@
+'''
+Generates seeded synthetic cuisines and restaurants csvs shaped like fixtures/, at any size.
+Run from the repository root: python -m benchmarks.synthetic_data data/ [--restaurants 1000000] [--seed 7] [--geo]
+'''
+import argparse
+import csv
+import os
+import random
+
+# same cuisines and ids as fixtures/cuisines.csv
+CUISINE_NAMES = ['American', 'Chinese', 'Thai', 'Italian', 'French', 'Japanese', 'Turkish', 'Korean', 'Vietnamese',
+                 'Indian', 'Spanish', 'Greek', 'Mexican', 'Malaysian', 'African', 'German', 'Indonesian', 'Russian',
+                 'Other']
+
+NAME_WORDS = ['Grill', 'Yummy', 'Chow', 'Tasty', 'Table', 'Palace', 'Kitchen', 'Delicious', 'Bar', 'Hotspot',
+              'Dished', 'Crisp', 'Place', 'Gusto', 'Fine', 'Wish', 'Whole', 'Tasteful', 'Story', 'Smash',
+              'Garden', 'Corner', 'House', 'Bistro', 'Eatery', 'Diner', 'Spoon', 'Fork', 'Oven', 'Harbor']
+# glued onto a word like the fixture names, ie: Deliciousgenix, Chowzilla
+NAME_SUFFIXES = ['genix', 'scape', 'zilla', 'ify', 'ly', 'hub', 'ster', 'opia']
+
+# share of restaurants per rating, most places are rated 3 or 4
+RATING_WEIGHTS = {1: 5, 2: 10, 3: 30, 4: 35, 5: 20}
+MIN_PRICE = 10
+PRICE_INCREASE = 5
+PRICE_STEPS = 9 # 10 -> 50
+# centers of the neighbourhoods located restaurants cluster around, in degrees, and how spread out they are
+NEIGHBOURHOOD_CENTERS = [(40.7359, -73.9911), (40.7580, -73.9855), (40.7128, -74.0060), (40.6782, -73.9442),
+                         (40.7282, -73.7949), (40.8116, -73.9465), (40.7060, -73.9330), (40.7433, -73.9196)]
+NEIGHBOURHOOD_SPREAD = 0.02
+UNLOCATED_SHARE = 0.02 # restaurants written without coordinates
+
+def write_cuisines_csv(path):
+    '''
+    Writes CUISINE_NAMES as a cuisines csv, ids start at 1
+    args:
+        path: str, file path
+    '''
+    with open(path, 'w', newline='') as write_obj:
+        writer = csv.writer(write_obj)
+        writer.writerow(['id', 'name'])
+        for cuisine_id, name in enumerate(CUISINE_NAMES, 1):
+            writer.writerow([cuisine_id, name])
+
+def return_restaurant_name(randomizer, index):
+    '''
+    Builds a name from a few repeated words, some restaurants are chains sharing one name
+    args:
+        randomizer: random.Random, seeded generator
+        index: int, position of the restaurant in the csv
+    return:
+        str, restaurant name
+    '''
+    words = randomizer.sample(NAME_WORDS, randomizer.randint(1, 3))
+    if randomizer.random() < 0.3:
+        words[0] += randomizer.choice(NAME_SUFFIXES).lower()
+    name = ' '.join(words)
+
+    # one in ten restaurants belongs to a chain, the rest get a unique suffix
+    if randomizer.random() < 0.1:
+        return name
+    return f'{name} {index:x}'
+
+def return_coordinates(randomizer):
+    '''
+    Places a restaurant in one of the neighbourhoods, dense in their middle
+    args:
+        randomizer: random.Random, seeded generator
+    return:
+        list[str], latitude and longitude, both blank for an unlocated restaurant
+    '''
+    if randomizer.random() < UNLOCATED_SHARE:
+        return ['', '']
+    latitude, longitude = randomizer.choice(NEIGHBOURHOOD_CENTERS)
+    return [f'{randomizer.gauss(latitude, NEIGHBOURHOOD_SPREAD):.6f}', f'{randomizer.gauss(longitude, NEIGHBOURHOOD_SPREAD):.6f}']
+
+def write_restaurants_csv(path, restaurant_count, seed, geo=False):
+    '''
+    Writes a restaurants csv with popular and rare cuisines, mostly middling ratings
+    and prices that rise a little with the rating
+    args:
+        path: str, file path
+        restaurant_count: int, rows to write
+        seed: int, same seed and count give the same file
+        geo: optional bool, adds latitude and longitude columns, the other columns keep the values they have without them
+    '''
+    randomizer = random.Random(seed)
+    cuisine_ids = list(range(1, len(CUISINE_NAMES) + 1))
+    # a long tail, the first cuisines are the most common
+    cuisine_weights = [1 / rank ** 0.8 for rank in cuisine_ids]
+    ratings = list(RATING_WEIGHTS)
+    rating_weights = list(RATING_WEIGHTS.values())
+    # a generator of its own, so the rows do not change with the coordinates
+    geo_randomizer = random.Random(seed + 1)
+
+    with open(path, 'w', newline='') as write_obj:
+        writer = csv.writer(write_obj)
+        writer.writerow(['name', 'customer_rating', 'distance', 'price', 'cuisine_id'] + (['latitude', 'longitude'] if geo else []))
+        for index in range(restaurant_count):
+            rating = randomizer.choices(ratings, rating_weights)[0]
+            price_step = min(max(round(randomizer.gauss(2 + (rating - 3) / 2, 1.5)), 0), PRICE_STEPS - 1)
+            row = [return_restaurant_name(randomizer, index), rating, randomizer.randint(1, 10),
+                   MIN_PRICE + price_step * PRICE_INCREASE, randomizer.choices(cuisine_ids, cuisine_weights)[0]]
+            writer.writerow(row + return_coordinates(geo_randomizer) if geo else row)
+
+def generate_dataset(directory, restaurant_count, seed, geo=False):
+    '''
+    Writes a cuisines.csv and restaurants.csv pair
+    args:
+        directory: str, existing directory to write into
+        restaurant_count: int, restaurant rows to write
+        seed: int, same seed and count give the same files
+        geo: optional bool, locates the restaurants, see write_restaurants_csv
+    return:
+        tuple, cuisine csv path and restaurant csv path
+    '''
+    cuisine_csv_path = os.path.join(directory, 'cuisines.csv')
+    restaurant_csv_path = os.path.join(directory, 'restaurants.csv')
+    write_cuisines_csv(cuisine_csv_path)
+    write_restaurants_csv(restaurant_csv_path, restaurant_count, seed, geo)
+
+    return cuisine_csv_path, restaurant_csv_path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('directory')
+    parser.add_argument('--restaurants', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--geo', action='store_true', help='add latitude and longitude columns')
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    cuisine_csv_path, restaurant_csv_path = generate_dataset(args.directory, args.restaurants, args.seed, args.geo)
+    print(f'Wrote {cuisine_csv_path} and {args.restaurants} restaurants to {restaurant_csv_path}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+'''
+Querier that answers the same questions as DataManager using bitwise operations over the bitmap indexes
+'''
+from .bitmaps import bitmap_to_ids, count_bitmap, ids_to_bitmap, union_bitmaps
+from .data_manager import DataManager
+from .trigrams import normalize_name
+
+class BitmapDataManager(DataManager):
+
+    def __init__(self, cuisine_csv_path=None, restaurant_csv_path=None, snapshot_path=None):
+        super().__init__(cuisine_csv_path, restaurant_csv_path, snapshot_path)
+
+        self.param_key_to_bitmaps_map = {
+            "rating": self.data_storage.rating_bitmaps,
+            "distance": self.data_storage.distance_bitmaps,
+            "price": self.data_storage.price_bitmaps,
+        }
+
+    def return_cuisine_bitmap(self, cuisine):
+        '''
+        Returns a bitmap of the restaurants serving any cuisine matching the given name
+        args:
+            cuisine: str, cuisine name to match
+        output:
+            int, bitmap of restaurant ids
+        '''
+        cuisine_bitmaps = self.data_storage.cuisine_bitmaps
+        return union_bitmaps(cuisine_bitmaps[name] for name in self.return_matching_cuisine_names(cuisine))
+
+    def return_tier_bitmaps(self, key, params):
+        '''
+        Returns the bitmaps of the stored values within the range of a param, in ranked order
+        ie: rating = 3, bitmaps will be those of 5 -> 4 -> 3
+        args:
+            key: str, one of self.match_importance
+            params: dict, hashed version of request args
+        output:
+            list[int], bitmaps per value
+        '''
+        bitmaps = self.param_key_to_bitmaps_map[key]
+        values = self.return_range_values(key, self.return_range_param(params, key))
+
+        return [bitmaps[value] for value in values if value in bitmaps]
+
+    def return_query_plan(self, params):
+        '''
+        Every filter is a bitmap over the whole dataset so the order only matters for the name
+        args:
+            params: dict, hashed version of request args
+        return:
+            list[PlanStep], steps in evaluation order
+        '''
+        return self.return_fixed_query_plan(params, "bitmap")
+
+    def return_matching_bitmap(self, params, memo=None, version=None, trace=None, name_first=False):
+        '''
+        ANDs the filters of a query, each filter is an OR across the values in its range
+        args:
+            params: dict, hashed version of request args, without a location
+            memo: optional dict, filter bitmaps shared by the queries of a batch, see return_batch_filtered_results
+            version: optional int, data_version to read at, defaults to the current one
+            trace: optional list, gets the number of restaurants left after every step, see explain_query
+            name_first: optional bool, whether to filter by the name param, otherwise it is left to the caller
+        returns:
+            int, bitmap of the matching ingested restaurant ids, 0 as soon as a filter leaves none
+        '''
+        if version is None:
+            version = self.data_storage.data_version
+        matched_bitmap = self.data_storage.all_restaurants_bitmap
+        if name_first:
+            def return_name_bitmap():
+                # only visible ids, a restaurant being written may not be counted in restaurant_count yet
+                name_restaurant_ids = self.return_visible_ids(set(self.return_filtered_restaurant_names(params["name"])), version)
+                return ids_to_bitmap(name_restaurant_ids, self.data_storage.restaurant_count)
+
+            matched_bitmap &= self.return_memoized(memo, ("name", normalize_name(params["name"])), return_name_bitmap)
+            if trace is not None:
+                trace.append(count_bitmap(matched_bitmap))
+            if not matched_bitmap:
+                return 0
+
+        if "cuisine" in params:
+            matched_bitmap &= self.return_memoized(memo, ("cuisine", params["cuisine"].lower()),
+                                                   lambda: self.return_cuisine_bitmap(params["cuisine"]))
+            if trace is not None:
+                trace.append(count_bitmap(matched_bitmap))
+
+        for key in self.match_importance:
+            tier_key = (key, self.return_range_param(params, key))
+            matched_bitmap &= self.return_memoized(memo, tier_key,
+                                                   lambda: union_bitmaps(self.return_tier_bitmaps(key, params)))
+            if trace is not None:
+                trace.append(count_bitmap(matched_bitmap))
+            if not matched_bitmap:
+                return 0
+
+        return matched_bitmap
+
+    def return_matching_ids(self, params, memo=None, version=None, trace=None):
+        '''
+        Filters the restaurants without ordering them.
+        args:
+            params: dict, hashed version of request args, without a location
+            memo: optional dict, filter bitmaps shared by the queries of a batch, see return_batch_filtered_results
+            version: optional int, data_version to read at, defaults to the current one
+            trace: optional list, gets the number of restaurants left after every step, see explain_query
+        returns:
+            set, matching restaurant ids visible at version
+        '''
+        storage = self.data_storage
+        if version is None:
+            version = storage.data_version
+        # restaurants written after ingest are not in the bitmaps, they are checked one by one
+        written_ids = range(len(storage.ranked_ids), storage.restaurant_count)
+        written_matches = set()
+        if written_ids:
+            matches = self.return_match_predicate(params, version)
+            written_matches = {restaurant_id for restaurant_id in written_ids if matches(restaurant_id)}
+
+        # a rare name is cheaper to look up first, otherwise it is checked last against the few remaining ids
+        name_first = "name" in params and self.is_selective_name(params["name"])
+        matched_bitmap = self.return_matching_bitmap(params, memo, version, trace, name_first)
+        if not matched_bitmap:
+            return written_matches
+
+        unique_restaurant_ids = bitmap_to_ids(matched_bitmap)
+        if "name" in params and not name_first:
+            unique_restaurant_ids = self.return_filtered_restaurant_names(params["name"], unique_restaurant_ids)
+            if trace is not None:
+                trace.append(len(unique_restaurant_ids))
+
+        return self.return_visible_ids(set(unique_restaurant_ids), version) | written_matches
+
+    def return_facet_value_counts(self, params, version=None):
+        '''
+        Counts the matches of every value by ANDing the match bitmap with the value's bitmap,
+        without decoding the matching ids
+        args:
+            params: dict, hashed version of request args
+            version: optional int, data_version to read at, defaults to the current one
+        return:
+            list[dict], cuisine id, rating, distance and price counts
+        '''
+        storage = self.data_storage
+        # a name filter, a location or written restaurants leave matches that are not a plain bitmap
+        if "lat" in params or "name" in params or storage.created_versions or storage.deleted_versions:
+            return super().return_facet_value_counts(params, version)
+
+        matched_bitmap = self.return_matching_bitmap(params, version=version)
+        cuisine_name_to_ids = {name: cuisine_id for cuisine_id, name in storage.cuisine_ids.items()}
+        facet_counts = []
+        for bitmaps in (storage.cuisine_bitmaps, storage.rating_bitmaps, storage.distance_bitmaps, storage.price_bitmaps):
+            counts = {value: count_bitmap(matched_bitmap & bitmap) for value, bitmap in bitmaps.items()}
+            facet_counts.append({value: count for value, count in counts.items() if count})
+        facet_counts[0] = {cuisine_name_to_ids[name]: count for name, count in facet_counts[0].items()}
+
+        return facet_counts
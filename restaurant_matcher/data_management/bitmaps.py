@@ -0,0 +1,61 @@
+'''
+Helpers for treating python ints as bitsets of restaurant ids. Bit n is set when restaurant id n is a member.
+'''
+
+# bit positions set in every possible byte value, used to decode a bitmap one byte at a time
+BYTE_TO_POSITIONS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+def ids_to_bitmap(restaurant_ids, size):
+    '''
+    Packs restaurant ids into a single bitmap
+    args:
+        restaurant_ids: iterable[int], restaurant ids to set
+        size: int, total number of restaurants, upper bound of the ids
+    return:
+        int, bitmap with a bit set for every given id
+    '''
+    packed = bytearray((size + 7) // 8)
+    for id in restaurant_ids:
+        packed[id >> 3] |= 1 << (id & 7)
+
+    return int.from_bytes(packed, 'little')
+
+def bitmap_to_ids(bitmap):
+    '''
+    Unpacks a bitmap into its restaurant ids
+    args:
+        bitmap: int, bitmap of restaurant ids
+    return:
+        list[int], restaurant ids in ascending order
+    '''
+    restaurant_ids = []
+    packed = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for index, byte in enumerate(packed):
+        if byte:
+            offset = index << 3
+            restaurant_ids.extend([offset + bit for bit in BYTE_TO_POSITIONS[byte]])
+
+    return restaurant_ids
+
+def count_bitmap(bitmap):
+    '''
+    args:
+        bitmap: int, bitmap of restaurant ids
+    return:
+        int, number of restaurant ids set
+    '''
+    return bin(bitmap).count('1')
+
+def union_bitmaps(bitmaps):
+    '''
+    ORs bitmaps together
+    args:
+        bitmaps: iterable[int], bitmaps to combine
+    return:
+        int, bitmap of ids present in any of the given bitmaps
+    '''
+    result = 0
+    for bitmap in bitmaps:
+        result |= bitmap
+
+    return result
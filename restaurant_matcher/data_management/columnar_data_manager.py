@@ -0,0 +1,184 @@
+'''
+Querier that answers the same questions as DataManager with vectorized NumPy masks over ColumnarDataStorage.
+Requires the optional numpy dependency.
+'''
+import numpy as np
+
+from .columnar_data_storage import ColumnarDataStorage
+from .data_manager import DataManager
+from .trigrams import normalize_name
+
+class ColumnarDataManager(DataManager):
+
+    data_storage_class = ColumnarDataStorage
+    # the NumPy columns are fixed size views, writes need a reload
+    supports_writes = False
+
+    def return_cuisine_mask(self, cuisine):
+        '''
+        Returns a mask of the restaurants serving any cuisine matching the given name
+        args:
+            cuisine: str, cuisine name to match
+        output:
+            np.ndarray[bool], True for every matching restaurant id
+        '''
+        cuisine_column = self.data_storage.cuisine_column
+        mask = np.zeros(cuisine_column.shape, dtype=bool)
+        # a handful of equality checks is much cheaper than np.isin on a large column
+        for name in self.return_matching_cuisine_names(cuisine):
+            mask |= cuisine_column == self.data_storage.cuisine_codes[name]
+
+        return mask
+
+    def return_query_plan(self, params):
+        '''
+        Every filter is a mask over the whole dataset so the order only matters for the name
+        args:
+            params: dict, hashed version of request args
+        return:
+            list[PlanStep], steps in evaluation order
+        '''
+        return self.return_fixed_query_plan(params, "mask")
+
+    def return_mask(self, params, memo=None, trace=None):
+        '''
+        Returns a mask of the restaurants matching all the provided parameters
+        args:
+            params: dict, hashed version of request args
+            memo: optional dict, filter masks shared by the queries of a batch, see return_batch_filtered_results
+            trace: optional list, gets the number of restaurants left after every filter, see explain_query
+        output:
+            np.ndarray[bool], True for every matching restaurant id
+        '''
+        storage = self.data_storage
+        mask = np.ones(storage.restaurant_count, dtype=bool)
+        # a rare name is cheaper to look up first, otherwise it is checked last against the few remaining ids
+        name_first = "name" in params and self.is_selective_name(params["name"])
+        if name_first:
+            def return_name_mask():
+                name_mask = np.zeros(storage.restaurant_count, dtype=bool)
+                name_mask[self.return_filtered_restaurant_names(params["name"])] = True
+                return name_mask
+
+            mask &= self.return_memoized(memo, ("name", normalize_name(params["name"])), return_name_mask)
+            if trace is not None:
+                trace.append(int(mask.sum()))
+
+        if "cuisine" in params:
+            mask &= self.return_memoized(memo, ("cuisine", params["cuisine"].lower()),
+                                         lambda: self.return_cuisine_mask(params["cuisine"]))
+            if trace is not None:
+                trace.append(int(mask.sum()))
+
+        # same ranges as the list engine, a lower and an upper bound compared against the whole column
+        range_columns = {"distance": storage.distance_column, "rating": storage.rating_column,
+                         "price": storage.price_column}
+        for key in self.match_importance:
+            low, high = self.return_range_bounds(key, self.return_range_param(params, key))
+            mask &= self.return_memoized(memo, (key, low, high),
+                                         lambda: (range_columns[key] >= low) & (range_columns[key] <= high))
+            if trace is not None:
+                trace.append(int(mask.sum()))
+
+        if "name" in params and not name_first:
+            candidate_ids = np.flatnonzero(mask).tolist()
+            if candidate_ids:
+                mask[:] = False
+                mask[self.return_filtered_restaurant_names(params["name"], candidate_ids)] = True
+            if trace is not None:
+                trace.append(int(mask.sum()))
+
+        return mask
+
+    def return_filtered_results(self, params, memo=None, version=None, trace=None, stage_timer=None):
+        '''
+        Provides logical filtering and sorting based on provided parameters.
+        Filters are ANDed boolean masks, ordering follows the ranking precomputed at ingest.
+        args:
+            params: dict, hashed version of request args
+            memo: optional dict, filter masks shared by the queries of a batch, see return_batch_filtered_results
+            version: optional int, unused, this engine can not be written to
+            trace: optional list, gets the number of restaurants left after every filter, see explain_query
+            stage_timer: optional StageTimer, marks the end of the filter and order stages, see match_service.metrics
+        returns:
+            list[int], an ordered array of restaurant ids
+        '''
+        if "lat" in params:
+            # located queries are answered from the grid, see DataManager.return_geo_results
+            return super().return_filtered_results(params, memo, version, trace, stage_timer)
+
+        mask = self.return_mask(params, memo, trace)
+        if stage_timer is not None:
+            stage_timer.mark("filter")
+        restaurant_ids = self.order_results_by_columns(mask, self.return_sort_priority(params)).tolist()
+        if stage_timer is not None:
+            stage_timer.mark("order")
+
+        return restaurant_ids
+
+    def return_facet_value_counts(self, params, version=None):
+        '''
+        Counts the masked values of every column, no restaurant id is materialized
+        args:
+            params: dict, hashed version of request args
+            version: optional int, unused, this engine can not be written to
+        return:
+            list[dict], cuisine id, rating, distance and price counts, value to number of matching restaurants
+        '''
+        if "lat" in params:
+            return super().return_facet_value_counts(params, version)
+
+        storage = self.data_storage
+        mask = self.return_mask(params)
+        return [{int(value): int(count) for value, count in zip(*np.unique(column[mask], return_counts=True))}
+                for column in (storage.cuisine_column, storage.rating_column, storage.distance_column, storage.price_column)]
+
+    def return_top_results(self, params, limit, start_position=0):
+        '''
+        Scans the ranking in chunks and stops at the first chunk that completes the page
+        args:
+            params: dict, hashed version of request args
+            limit: int, maximum number of restaurant ids to return
+            start_position: optional int, position in the ranking to resume from
+        returns:
+            list[int], ordered array of at most limit restaurant ids
+            int, position to resume from for the next page, None if there are no more results
+        '''
+        if "lat" in params:
+            return super().return_top_results(params, limit, start_position)
+
+        mask = self.return_mask(params)
+        _, ranked_id_column = self.data_storage.return_ranking_columns(self.return_sort_priority(params))
+        chunk_size = max(limit * 64, 4096)
+        restaurant_ids = []
+
+        for chunk_start in range(start_position, ranked_id_column.size, chunk_size):
+            chunk = ranked_id_column[chunk_start:chunk_start + chunk_size]
+            matched_positions = np.flatnonzero(mask[chunk])[:limit - len(restaurant_ids)]
+            restaurant_ids.extend(chunk[matched_positions].tolist())
+
+            if len(restaurant_ids) == limit:
+                next_position = chunk_start + int(matched_positions[-1]) + 1
+                return restaurant_ids, next_position if next_position < ranked_id_column.size else None
+
+        return restaurant_ids, None
+
+    def order_results_by_columns(self, mask, priority=None):
+        '''
+        Orders the masked restaurant ids by closest distance, then highest rating, then cheapest price
+        args:
+            mask: np.ndarray[bool], True for every restaurant id to return
+            priority: optional tuple, sort priority to order by instead, see return_sort_priority
+        return:
+            np.ndarray[int], ordered restaurant ids
+        '''
+        storage = self.data_storage
+        rank_column, ranked_id_column = storage.return_ranking_columns(priority)
+        restaurant_ids = np.flatnonzero(mask)
+        result_count = restaurant_ids.size
+
+        # large results are read straight off the ranking, small ones are cheaper to sort by rank
+        if result_count * max(result_count.bit_length(), 1) >= storage.restaurant_count:
+            return ranked_id_column[mask[ranked_id_column]]
+
+        return restaurant_ids[np.argsort(rank_column[restaurant_ids], kind='stable')]
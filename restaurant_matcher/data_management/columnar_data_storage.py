@@ -0,0 +1,69 @@
+'''
+DataStorage that additionally keeps the restaurant data as compact NumPy columns indexed by restaurant id.
+Requires the optional numpy dependency.
+'''
+import numpy as np
+
+from .csv_ingest import DEFAULT_CHUNK_SIZE
+from .data_storage import DataStorage
+from .tables import DetailsTable
+
+class ColumnarDataStorage(DataStorage):
+
+    def __init__(self):
+        super().__init__()
+        self.cuisine_codes = {} # cuisine name to its integer code used in self.cuisine_column
+        self.rank_column = np.empty(0, dtype=np.int32) # restaurant id to its position in the precomputed ranking
+        self.ranked_id_column = np.empty(0, dtype=np.int32) # restaurant ids in ranked order
+
+    def ingest(self, cuisine_csv_path, restaurant_csv_path, chunk_size=DEFAULT_CHUNK_SIZE, progress_callback=None):
+        '''
+        Starts the data ingestion and lays the parsed data out in columns
+        args:
+            cuisine_csv_path: str, file path
+            restaurant_csv_path: str, file path
+            chunk_size: optional int, most restaurant rows parsed at once
+            progress_callback: optional callable, called with an IngestProgress after every chunk
+        '''
+        super().ingest(cuisine_csv_path, restaurant_csv_path, chunk_size, progress_callback)
+        self.build_columns()
+
+    def load_snapshot(self, snapshot_path):
+        '''
+        Loads a compiled snapshot, the columns are views over the mapped file
+        args:
+            snapshot_path: str, file path
+        '''
+        super().load_snapshot(snapshot_path)
+        self.build_columns()
+
+    def build_columns(self):
+        '''
+        Swaps the typed columns for NumPy arrays over the same memory, position n holds the value for restaurant id n
+        '''
+        self.cuisine_codes = {name: id for id, name in self.cuisine_ids.items()}
+
+        # zero copy views over the typed columns, or over the mapped snapshot
+        self.rating_column = np.frombuffer(self.rating_column, dtype=np.int8)
+        self.distance_column = np.frombuffer(self.distance_column, dtype=np.int16)
+        self.price_column = np.frombuffer(self.price_column, dtype=np.int16)
+        self.cuisine_column = np.frombuffer(self.cuisine_column, dtype=np.int16)
+        self.restaurant_details = DetailsTable(self.return_columns())
+
+        self.rank_column = np.frombuffer(self.rank_positions, dtype=np.int32)
+        self.ranked_id_column = np.frombuffer(self.ranked_ids, dtype=np.int32)
+
+    def return_ranking_columns(self, priority=None):
+        '''
+        Returns the precomputed ranking of a sort priority as NumPy arrays over the same memory, see return_ranking
+        args:
+            priority: optional tuple, DEFAULT_RANK_PRIORITY in any order, None for the default one
+        return:
+            np.ndarray[int], restaurant id to its position in the ranking
+            np.ndarray[int], restaurant ids in ranked order
+        '''
+        ranked_ids, rank_positions = self.return_ranking(priority)
+        if ranked_ids is self.ranked_ids:
+            return self.rank_column, self.ranked_id_column
+
+        return np.frombuffer(rank_positions, dtype=np.int32), np.frombuffer(ranked_ids, dtype=np.int32)
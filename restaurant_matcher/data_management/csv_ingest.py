@@ -0,0 +1,246 @@
+'''
+Streams the restaurants csv in bounded chunks so parsing never holds more than one chunk of rows.
+Every chunk is validated and converted in bulk, rows that can not be stored are rejected instead of
+failing the whole ingest.
+'''
+import csv
+import io
+from array import array
+from collections import namedtuple
+
+from .geo import GEO_CSV_COLUMNS, MISSING_COORDINATE, parse_coordinate
+from .tables import COLUMN_TYPECODES
+
+DEFAULT_CHUNK_SIZE = 10000
+MAX_REJECTED_ROW_SAMPLES = 100 # rejected rows kept for reporting, the count covers all of them
+
+# csv header to the restaurant_details key of its typed column
+NUMERIC_CSV_COLUMNS = {
+    "cuisine_id": "cuisine_id",
+    "customer_rating": "rating",
+    "distance": "distance",
+    "price": "price",
+}
+RESTAURANT_CSV_COLUMNS = ("name",) + tuple(NUMERIC_CSV_COLUMNS)
+
+def return_typecode_bounds(typecode):
+    '''
+    args:
+        typecode: str, signed integer array typecode
+    return:
+        tuple, smallest and largest value an array of the typecode can hold
+    '''
+    bits = array(typecode).itemsize * 8
+    return -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+
+# restaurant_details key to the smallest and largest value its column can hold
+COLUMN_BOUNDS = {key: return_typecode_bounds(typecode) for key, typecode in COLUMN_TYPECODES.items()}
+# restaurant_details key to the smallest and largest value a restaurant may have, ratings are 1 to 5 stars
+# and distances and prices start at 1, the same lower bounds the match service validators search from
+VALUE_BOUNDS = dict(COLUMN_BOUNDS, rating=(1, 5), distance=(1, COLUMN_BOUNDS["distance"][1]),
+                    price=(1, COLUMN_BOUNDS["price"][1]))
+
+def return_rejection_reason(values, cuisine_ids):
+    '''
+    Checks converted restaurant values can be stored
+    args:
+        values: dict, restaurant_details key to int value for every typed column, coordinates are not checked here
+        cuisine_ids: collection[int], cuisine ids a restaurant may reference
+    return:
+        str, why the values can not be stored, None if they can
+    '''
+    for key, (min_value, max_value) in VALUE_BOUNDS.items():
+        value = values[key]
+        if not min_value <= value <= max_value:
+            return f'{key} {value} is out of range'
+
+    if values["cuisine_id"] not in cuisine_ids:
+        return f'cuisine_id {values["cuisine_id"]} is unknown'
+
+    return None
+
+# rows_read: int, data rows read so far, blank lines are not counted
+# rows_accepted: int, rows stored so far
+# rows_rejected: int, rows skipped so far
+# bytes_read: int, bytes of the file consumed so far
+# total_bytes: int, size of the file
+IngestProgress = namedtuple('IngestProgress', ['rows_read', 'rows_accepted', 'rows_rejected', 'bytes_read', 'total_bytes'])
+
+# line_number: int, line of the csv file the row ends on
+# reason: str, why the row was rejected
+RejectedRow = namedtuple('RejectedRow', ['line_number', 'reason'])
+
+# names: list[str], restaurant names of the accepted rows
+# columns: dict, restaurant_details key to the converted values of the accepted rows,
+#     plus "latitude" and "longitude" in microdegrees when the csv locates its restaurants
+# rejected_rows: list[RejectedRow], rows of the chunk that were skipped
+RestaurantChunk = namedtuple('RestaurantChunk', ['names', 'columns', 'rejected_rows'])
+
+class RestaurantCsvReader:
+    '''
+    Reads a restaurants csv opened in binary mode as validated chunks of restaurants
+    '''
+
+    def __init__(self, read_obj, cuisine_ids, chunk_size=DEFAULT_CHUNK_SIZE):
+        '''
+        args:
+            read_obj: file, restaurants csv opened with 'rb'
+            cuisine_ids: collection[int], cuisine ids a row may reference
+            chunk_size: int, most rows parsed at once
+        raises:
+            ValueError, if the header is missing one of RESTAURANT_CSV_COLUMNS
+        '''
+        self.read_obj = read_obj
+        self.cuisine_ids = frozenset(cuisine_ids)
+        self.chunk_size = chunk_size
+        self.csv_reader = csv.reader(io.TextIOWrapper(read_obj, encoding='utf-8-sig', newline=''))
+
+        header = next(self.csv_reader, [])
+        missing_columns = [column for column in RESTAURANT_CSV_COLUMNS if column not in header]
+        if missing_columns:
+            raise ValueError(f'restaurants csv is missing the columns {", ".join(missing_columns)}')
+        self.width = len(header)
+        self.name_index = header.index("name")
+        self.numeric_indexes = {key: header.index(column) for column, key in NUMERIC_CSV_COLUMNS.items()}
+        # the coordinate columns are optional, a csv without both of them has no located restaurants
+        self.geo_indexes = {}
+        if all(column in header for column in GEO_CSV_COLUMNS):
+            self.geo_indexes = {column: header.index(column) for column in GEO_CSV_COLUMNS}
+
+    @property
+    def bytes_read(self):
+        '''
+        Bytes of the file consumed so far, includes the few kilobytes the decoder reads ahead
+        '''
+        return self.read_obj.tell()
+
+    def __iter__(self):
+        '''
+        output:
+            RestaurantChunk, for every chunk_size rows of the file
+        '''
+        rows = []
+        line_numbers = []
+        for row in self.csv_reader:
+            if not row:
+                continue
+            rows.append(row)
+            line_numbers.append(self.csv_reader.line_num)
+
+            if len(rows) == self.chunk_size:
+                yield self.convert(rows, line_numbers)
+                rows = []
+                line_numbers = []
+
+        if rows:
+            yield self.convert(rows, line_numbers)
+
+    def convert(self, rows, line_numbers):
+        '''
+        Converts a chunk in bulk, falling back to row by row only when the chunk holds invalid rows
+        args:
+            rows: list[list[str]], csv rows
+            line_numbers: list[int], line each row ends on
+        return:
+            RestaurantChunk
+        '''
+        chunk = self.convert_chunk(rows)
+        if chunk is None:
+            chunk = self.convert_rows(rows, line_numbers)
+        return chunk
+
+    def convert_chunk(self, rows):
+        '''
+        Converts a whole chunk column by column, the common case where every row is valid
+        args:
+            rows: list[list[str]], csv rows
+        return:
+            RestaurantChunk, or None if any row is invalid and the rows need checking one by one
+        '''
+        if any(len(row) != self.width for row in rows):
+            return None
+
+        fields = list(zip(*rows))
+        names = list(fields[self.name_index])
+        if not all(names):
+            return None
+
+        columns = {}
+        try:
+            for key, index in self.numeric_indexes.items():
+                columns[key] = list(map(int, fields[index]))
+        except ValueError:
+            return None
+
+        for key, values in columns.items():
+            min_value, max_value = VALUE_BOUNDS[key]
+            if min(values) < min_value or max(values) > max_value:
+                return None
+        if not self.cuisine_ids.issuperset(columns["cuisine_id"]):
+            return None
+
+        try:
+            for key, index in self.geo_indexes.items():
+                columns[key] = [parse_coordinate(key, text) for text in fields[index]]
+        except ValueError:
+            return None
+        if self.geo_indexes and any((latitude == MISSING_COORDINATE) != (longitude == MISSING_COORDINATE)
+                                    for latitude, longitude in zip(columns["latitude"], columns["longitude"])):
+            return None
+
+        return RestaurantChunk(names, columns, [])
+
+    def convert_rows(self, rows, line_numbers):
+        '''
+        Converts a chunk row by row, keeping the valid rows and rejecting the rest
+        args:
+            rows: list[list[str]], csv rows
+            line_numbers: list[int], line each row ends on
+        return:
+            RestaurantChunk
+        '''
+        chunk = RestaurantChunk([], {key: [] for key in list(self.numeric_indexes) + list(self.geo_indexes)}, [])
+        for row, line_number in zip(rows, line_numbers):
+            values, reason = self.convert_row(row)
+            if reason:
+                chunk.rejected_rows.append(RejectedRow(line_number, reason))
+                continue
+
+            chunk.names.append(row[self.name_index])
+            for key, value in values.items():
+                chunk.columns[key].append(value)
+
+        return chunk
+
+    def convert_row(self, row):
+        '''
+        args:
+            row: list[str], csv row
+        return:
+            tuple, (restaurant_details key to converted value, None) or (None, rejection reason)
+        '''
+        if len(row) != self.width:
+            return None, f'expected {self.width} fields, got {len(row)}'
+        if not row[self.name_index]:
+            return None, 'name is empty'
+
+        values = {}
+        for key, index in self.numeric_indexes.items():
+            try:
+                values[key] = int(row[index])
+            except ValueError:
+                return None, f'{key} {row[index]!r} is not an integer'
+
+        reason = return_rejection_reason(values, self.cuisine_ids)
+        if reason:
+            return None, reason
+
+        for key, index in self.geo_indexes.items():
+            try:
+                values[key] = parse_coordinate(key, row[index])
+            except ValueError:
+                return None, f'{key} {row[index]!r} is not a coordinate in range'
+        if self.geo_indexes and (values["latitude"] == MISSING_COORDINATE) != (values["longitude"] == MISSING_COORDINATE):
+            return None, 'latitude and longitude must both be set or both be blank'
+
+        return values, None
@@ -2,24 +2,113 @@
 Acts as a querier to make sense of the csv data
 '''
 import json
+from bisect import bisect_left
+from collections import Counter, namedtuple
 from csv import DictReader
+from heapq import heappush, heapreplace, merge
 
-from .data_storage import DataStorage
+from .csv_ingest import COLUMN_BOUNDS
+from .data_storage import DEFAULT_RANK_PRIORITY, RANK_KEY_ID_MASK, DataStorage
+from .fragments import RestaurantFragments
+from .geo import MICRODEGREES, return_distance_km, return_distance_unit
+from .trigrams import normalize_name, return_trigrams
+
+# predicate: str, request param the step filters on
+# value: str, the param's value, None for the default range of a range param that was left out
+# access: str, how the step finds its restaurants, "index" reads the postings of the matching values,
+#     "scan" checks every candidate left by the earlier steps, "bitmap" and "mask" AND a whole dataset filter,
+#     "grid" reads the grid cells around a location
+# matching_rows: int, estimated restaurants the predicate keeps on its own
+# estimated_rows: int, estimated restaurants left after the step, predicates are assumed independent
+PlanStep = namedtuple('PlanStep', ['predicate', 'value', 'access', 'matching_rows', 'estimated_rows'])
+
+# lowest and highest value the api accepts per range param, a range left open ends at these
+RANGE_BOUNDS = {"rating": (1, 5), "distance": (1, 10), "price": (10, 50)}
+# param bounding the other end of each range, rating on its own is a minimum, distance and price are maximums
+RANGE_BOUND_PARAMS = {"rating": "rating_max", "distance": "distance_min", "price": "price_min"}
 
 class DataManager:
 
-    def __init__(self, cuisine_csv_path, restaurant_csv_path):
-        self.data_storage = DataStorage()
-        # Setup data
-        self.data_storage.ingest(cuisine_csv_path, restaurant_csv_path)
+    # storage backend the data is ingested into, engines may swap in a subclass
+    data_storage_class = DataStorage
+    # whether restaurants can be upserted and deleted while the engine serves queries
+    supports_writes = True
+
+    def __init__(self, cuisine_csv_path=None, restaurant_csv_path=None, snapshot_path=None, data_storage=None):
+        if data_storage is not None:
+            # already ingested, ie: a shard built by ShardedDataManager
+            self.data_storage = data_storage
+        else:
+            # Setup data, a compiled snapshot skips parsing the csv files
+            self.data_storage = self.data_storage_class()
+            if snapshot_path:
+                self.data_storage.load_snapshot(snapshot_path)
+            else:
+                self.data_storage.ingest(cuisine_csv_path, restaurant_csv_path)
 
         self.param_key_to_store_map = {
             "rating": self.return_filtered_ratings,
             "distance": self.return_filtered_distances,
             "price": self.return_filtered_prices,
         }
+        self.param_key_to_index_map = {
+            "cuisine": "cuisines",
+            "rating": "ratings",
+            "distance": "distances",
+            "price": "prices",
+        }
         # ranking of importance of criterias
         self.match_importance = ["distance", "rating", "price"]
+        # a name whose rarest trigram is in at most this share of restaurants is matched before the other filters
+        self.selective_name_ratio = 0.05
+        self.restaurant_fragments = None # RestaurantFragments, built by build_restaurant_fragments
+
+    def return_rating_range(self, rating='1', max_rating='5'):
+        '''
+        Returns the stored rating values between the given minimum and maximum rating, from highest to lowest
+        ie: rating = 3, values will be 5 -> 4 -> 3
+        args:
+            rating: str, minimum rating
+            max_rating: optional str, maximum rating
+        output:
+            list[int], rating values in ranked order
+        '''
+        return self.return_range_values("rating", f'{rating}..{max_rating}')
+
+    def return_distance_range(self, distance='10', min_distance='1'):
+        '''
+        Returns the stored distance values between the given minimum and maximum distance, from closest
+        ie: distance = 3, values will be 1 -> 2 -> 3
+        args:
+            distance: str, maximum distance
+            min_distance: optional str, minimum distance
+        output:
+            list[int], distance values in ranked order
+        '''
+        return self.return_range_values("distance", f'{min_distance}..{distance}')
+
+    def return_price_range(self, price='50', min_price='10'):
+        '''
+        Returns the stored price values between the given minimum and maximum price, from cheapest
+        ie: price = 20, values will be 10 -> 15 -> 20, or 10 -> 12 -> 20 if 12 is also a stored price
+        args:
+            price: str, maximum price
+            min_price: optional str, minimum price
+        output:
+            list[int], price values in ranked order
+        '''
+        return self.return_range_values("price", f'{min_price}..{price}')
+
+    def return_matching_cuisine_names(self, cuisine):
+        '''
+        Returns the stored cuisine names that contain the given cuisine, case insensitive
+        args:
+            cuisine: str, cuisine name to match
+        output:
+            list[str], matching cuisine names
+        '''
+        cuisine_names = self.data_storage.cuisines.keys()
+        return [name for name in cuisine_names if cuisine.lower() in name.lower()]
 
     def return_filtered_ratings(self, restaurant_ids=[], rating='1'):
         '''
@@ -33,13 +122,13 @@ class DataManager:
             matching_restaurants: list[list], array of arrays of perserve hierarchy
         '''
         matching_restaurants = []
-        max_rating = 5
+        restaurant_id_set = set(restaurant_ids) # constant time membership checks
 
-        for rate in range(max_rating, int(rating)-1, -1):
-            matched_restaurants = self.data_storage.ratings.get(str(rate))
+        for rate in self.return_rating_range(rating):
+            matched_restaurants = self.data_storage.ratings.get(rate)
             if matched_restaurants:
                 if restaurant_ids:
-                    filtered_ids = [id for id in matched_restaurants if id in restaurant_ids]
+                    filtered_ids = [id for id in matched_restaurants if id in restaurant_id_set]
                     if filtered_ids:
                         matching_restaurants.append(filtered_ids)
                 else:
@@ -59,13 +148,13 @@ class DataManager:
             matching_restaurants: list[list], array of arrays of perserve hierarchy
         '''
         matching_restaurants = []
-        min_distance = 1
+        restaurant_id_set = set(restaurant_ids) # constant time membership checks
 
-        for mile in range(min_distance, int(distance)+1):
-            matched_restaurants = self.data_storage.distances.get(str(mile))
+        for mile in self.return_distance_range(distance):
+            matched_restaurants = self.data_storage.distances.get(mile)
             if matched_restaurants:
                 if restaurant_ids:
-                    filtered_ids = [id for id in matched_restaurants if id in restaurant_ids]
+                    filtered_ids = [id for id in matched_restaurants if id in restaurant_id_set]
                     if filtered_ids:
                         matching_restaurants.append(filtered_ids)
                 else:
@@ -85,14 +174,13 @@ class DataManager:
             matching_restaurants: list[list], array of arrays of perserve hierarchy
         '''
         matching_restaurants = []
-        min_price = 10
-        price_increase = 5
+        restaurant_id_set = set(restaurant_ids) # constant time membership checks
 
-        for price in range(min_price, int(price)+1, price_increase):
-            matched_restaurants = self.data_storage.prices.get(str(price))
+        for price in self.return_price_range(price):
+            matched_restaurants = self.data_storage.prices.get(price)
             if matched_restaurants:
                 if restaurant_ids:
-                    filtered_ids = [id for id in matched_restaurants if id in restaurant_ids]
+                    filtered_ids = [id for id in matched_restaurants if id in restaurant_id_set]
                     if filtered_ids:
                         matching_restaurants.append(filtered_ids)
                 else:
@@ -109,8 +197,7 @@ class DataManager:
             matching_restaurants: list[int], array of restaurant ids
         '''
         matching_restaurants = []
-        cuisine_names = self.data_storage.cuisines.keys()
-        matching_cuisines = [name for name in cuisine_names if cuisine.lower() in name.lower()]
+        matching_cuisines = self.return_matching_cuisine_names(cuisine)
         if matching_cuisines:
             for matched_cuisine in matching_cuisines:
                 cuisine_restaurant_ids = self.data_storage.cuisines.get(matched_cuisine)
@@ -118,106 +205,891 @@ class DataManager:
 
         return matching_restaurants
 
+    def return_name_postings(self, normalized_name):
+        '''
+        Returns the trigram index postings of every trigram in the name, rarest first
+        args:
+            normalized_name: str, normalized restaurant name to match
+        return:
+            list[list[int]], restaurant id postings, None if the name is too short for the index
+        '''
+        trigrams = return_trigrams(normalized_name)
+        if not trigrams:
+            return None
+
+        name_trigrams = self.data_storage.name_trigrams
+        return sorted((name_trigrams.get(trigram, []) for trigram in trigrams), key=len)
+
+    def is_selective_name(self, name):
+        '''
+        Whether a name narrows the results enough to be matched before any other filter
+        args:
+            name: str, restaurant name to match
+        return:
+            bool, True if the trigram index estimates few matches
+        '''
+        postings = self.return_name_postings(normalize_name(name))
+        if postings is None:
+            return False
+
+        return len(postings[0]) <= self.selective_name_ratio * self.data_storage.restaurant_count
+
     def return_filtered_restaurant_names(self, name, restaurant_ids=[]):
         '''
-        Returns the restaurant ids whose restaurants names are substrings of given name
+        Returns the restaurant ids whose restaurants names contain the given name, case insensitive.
+        Candidates come from intersecting the trigram postings and are verified against the full name.
         args:
             name: str, restaurant name to match
             restaurant_ids: optional list[str], additional match param
         return:
             list[int], array of restaurant ids
         '''
-        if restaurant_ids:
-            restaurants = [(id, self.data_storage.names.get(id)) for id in restaurant_ids]
-        else:
-            restaurants = self.data_storage.names.items()
+        normalized_name = normalize_name(name)
+        normalized_names = self.data_storage.normalized_names
+        postings = self.return_name_postings(normalized_name)
 
-        return [restaurant[0] for restaurant in restaurants if name in restaurant[1].lower()]
+        if postings is not None and not (restaurant_ids and len(restaurant_ids) <= len(postings[0])):
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(posting)
 
-    def order_results(self, unique_restaurant_ids, ranked_results, existing_sort_params):
+            if restaurant_ids:
+                restaurant_ids = [id for id in restaurant_ids if id in candidates]
+            else:
+                restaurant_ids = sorted(candidates)
+        elif not restaurant_ids:
+            # too short for the index, every name has to be checked
+            restaurant_ids = range(self.data_storage.restaurant_count)
+
+        return [id for id in restaurant_ids if normalized_name in normalized_names[id]]
+
+    def order_results(self, unique_restaurant_ids, priority=None):
         '''
-        Takes previously filtered information and sorts it to order the results to fit the business logic required
+        Orders previously filtered restaurant ids to fit the business logic required,
+        closest distance -> highest rating -> cheapest price, using the ranking precomputed at ingest
         args:
             unique_restaurant_ids: set, previously filtered restaurant_ids left to sort
-            ranked_results: dict, key/val of previously filtered parameters and the parameter specific filtered restaurant_ids
-            existing_sort_params: list[str], ordered array of sort hierarchy
+            priority: optional tuple, sort priority to order by instead, see return_sort_priority
+        return:
+            list[int], ordered restaurant ids
+        '''
+        storage = self.data_storage
+        ranked_count = len(storage.ranked_ids)
+        # restaurants written after ingest are not part of the precomputed ranking
+        written_ids = [id for id in unique_restaurant_ids if id >= ranked_count] if storage.extra_rank_keys else []
+        if not written_ids:
+            return self.order_ranked_results(unique_restaurant_ids, priority)
+
+        ordered_ids = self.order_ranked_results(unique_restaurant_ids.difference(written_ids), priority)
+        return_rank_key = lambda restaurant_id: storage.return_rank_key(restaurant_id, priority=priority)
+        written_ids.sort(key=return_rank_key)
+
+        return list(merge(ordered_ids, written_ids, key=return_rank_key))
+
+    def order_ranked_results(self, unique_restaurant_ids, priority=None):
+        '''
+        Orders restaurant ids that are all part of the ranking precomputed at ingest
+        args:
+            unique_restaurant_ids: set, restaurant ids to sort
+            priority: optional tuple, sort priority to order by instead, see return_sort_priority
+        return:
+            list[int], ordered restaurant ids
         '''
-        if not existing_sort_params:
-            return list(unique_restaurant_ids)
+        ranked_ids, rank_positions = self.data_storage.return_ranking(priority)
+        result_count = len(unique_restaurant_ids)
 
-        relevance_order = []
+        # walking the full ranking is linear, sorting is cheaper while the result set is small
+        if result_count * max(result_count.bit_length(), 1) < len(ranked_ids):
+            return sorted(unique_restaurant_ids, key=rank_positions.__getitem__)
 
-        # Sort in order of importance: distance -> rating -> price
-        while unique_restaurant_ids and existing_sort_params:
-            key = existing_sort_params[0]
-            criteria_filtered_ids = ranked_results[key]
-            # loop through each depth to determine order
-            # depth ie: [[1,2,3], [8,4,5], [12], [44]]
-            for depth in criteria_filtered_ids:
-                found_in_level = unique_restaurant_ids & set(depth)
-                unique_restaurant_ids = unique_restaurant_ids - found_in_level
-                # if tied relevancy sort via next order criteria
-                if len(found_in_level) > 1:
-                    found_in_level = self.order_results(set(found_in_level), ranked_results, existing_sort_params[1:])
+        return [id for id in ranked_ids if id in unique_restaurant_ids]
 
-                relevance_order = relevance_order + list(found_in_level)
+    def return_visible_ids(self, unique_restaurant_ids, version):
+        '''
+        Drops the restaurants a reader pinned to version must not see, added after it or deleted by then
+        args:
+            unique_restaurant_ids: set, filtered restaurant ids
+            version: int, data_version read before filtering
+        return:
+            set, visible restaurant ids
+        '''
+        storage = self.data_storage
+        # checked after filtering, any id written after version already has its version recorded
+        if not storage.created_versions and not storage.deleted_versions:
+            return unique_restaurant_ids
 
-        return relevance_order
+        return {id for id in unique_restaurant_ids if storage.is_visible(id, version)}
 
-    def return_filtered_results(self, params):
+    def return_range_param(self, params, key):
         '''
-        Provides logical filtering and sorting based on provided parameters
+        Folds a range param and the param bounding its other end into one value, as the query plan shows it
+        ie: rating=3 gives '3', rating=3&rating_max=4 gives '3..4', price_min=20 gives '20..50'
         args:
             params: dict, hashed version of request args
+            key: str, one of self.match_importance
+        return:
+            str, value for return_range_bounds, None when neither param is given
+        '''
+        bound_key = RANGE_BOUND_PARAMS[key]
+        value = params[key].lower() if key in params else None
+        if bound_key not in params:
+            return value
+
+        low, high = self.return_range_bounds(key, value)
+        if key == "rating":
+            high = int(params[bound_key])
+        else:
+            low = int(params[bound_key])
+
+        return f'{low}..{high}'
+
+    def return_range_bounds(self, key, value=None):
+        '''
+        args:
+            key: str, one of self.match_importance
+            value: optional str, see return_range_param, None for the param's default range
+        return:
+            tuple, (lowest, highest) int value the range filter keeps
+        '''
+        low, high = RANGE_BOUNDS[key]
+        if value is None:
+            return low, high
+        if '..' in value:
+            low, high = value.split('..')
+            return int(low), int(high)
+        if key == "rating":
+            return int(value), high
+
+        return low, int(value)
+
+    def return_range_values(self, key, value):
+        '''
+        Looks the values within a range filter up in the sorted values of its param
+        args:
+            key: str, one of self.match_importance
+            value: str, see return_range_param, None for the param's default range
+        return:
+            list[int], stored values the range filter keeps, in ranked order
+        '''
+        values = self.data_storage.return_values_between(key, *self.return_range_bounds(key, value))
+        # the highest rating ranks first
+        return values[::-1] if key == "rating" else values
+
+    def return_sort_priority(self, params):
+        '''
+        Reads the order the results are ranked in, the params the sort param leaves out follow in
+        self.match_importance order
+        ie: sort=price gives cheapest price -> closest distance -> highest rating
+        args:
+            params: dict, hashed version of request args
+        return:
+            tuple, every param of self.match_importance, most important first
+        '''
+        if "sort" not in params:
+            return DEFAULT_RANK_PRIORITY
+
+        sort_keys = params["sort"].lower().split(",")
+        return tuple(sort_keys + [key for key in self.match_importance if key not in sort_keys])
+
+    def return_query_predicates(self, params):
+        '''
+        Lists the filters a query applies, the range filters apply their default range when left out
+        args:
+            params: dict, hashed version of request args
+        return:
+            list[tuple], (predicate, value) per filter, name -> cuisine -> self.match_importance
+        '''
+        predicates = [(key, params[key]) for key in ("name", "cuisine") if key in params]
+        predicates.extend((key, self.return_range_param(params, key)) for key in self.match_importance)
+
+        return predicates
+
+    def estimate_matching_rows(self, predicate, value):
+        '''
+        Estimates how many restaurants a single filter keeps, from the value counts collected at ingest
+        args:
+            predicate: str, request param the filter applies
+            value: str, the param's value, None for the default range of a range param
+        return:
+            int, estimated restaurant count
+        '''
+        storage = self.data_storage
+        if predicate == "name":
+            # the rarest trigram bounds the matches, names too short for the index match anything
+            postings = self.return_name_postings(normalize_name(value))
+            if postings is None:
+                return storage.live_restaurant_count
+            return min(len(postings[0]), storage.live_restaurant_count)
+
+        value_counts = storage.value_counts[predicate]
+        if predicate == "cuisine":
+            values = self.return_matching_cuisine_names(value)
+        else:
+            values = self.return_range_values(predicate, value)
+
+        return sum(value_counts.get(value, 0) for value in values)
+
+    def return_plan(self, predicates, estimated_rows=None):
+        '''
+        Estimates the restaurants left after every step of an evaluation order
+        args:
+            predicates: list[tuple], (predicate, value, access) per step in evaluation order, an access of None
+                picks whichever of "index" and "scan" touches fewer restaurant ids
+            estimated_rows: optional int, restaurants left by steps before these, None if these are the first
+        return:
+            list[PlanStep]
+        '''
+        live_count = max(self.data_storage.live_restaurant_count, 1)
+        plan = []
+        for predicate, value, access in predicates:
+            matching_rows = self.estimate_matching_rows(predicate, value)
+            if access is None:
+                access = "index" if estimated_rows is None or matching_rows < estimated_rows else "scan"
+            if estimated_rows is None:
+                estimated_rows = matching_rows
+            else:
+                estimated_rows = estimated_rows * matching_rows // live_count
+            plan.append(PlanStep(predicate, value, access, matching_rows, estimated_rows))
+
+        return plan
+
+    def return_query_plan(self, params):
+        '''
+        Orders the filters of a query cheapest first. The filter estimated to keep the fewest restaurants
+        is read from its index, every later one reads its index or checks the remaining candidates.
+        The ranking does not depend on the plan, results are ordered once every filter has run.
+        args:
+            params: dict, hashed version of request args
+        return:
+            list[PlanStep], steps in evaluation order
+        '''
+        if "lat" in params:
+            return self.return_geo_query_plan(params)
+
+        live_count = self.data_storage.live_restaurant_count
+        estimates = []
+        for order, (predicate, value) in enumerate(self.return_query_predicates(params)):
+            matching_rows = self.estimate_matching_rows(predicate, value)
+            # a default range every restaurant falls in filters nothing
+            if value is None and matching_rows >= live_count:
+                continue
+            estimates.append((matching_rows, order, predicate, value))
+
+        return self.return_plan([(predicate, value, None) for _, _, predicate, value in sorted(estimates)])
+
+    def return_fixed_query_plan(self, params, access):
+        '''
+        Plan of the engines that AND every filter over the whole dataset in a fixed order.
+        A rare name is looked up first, otherwise it is checked last against the remaining ids.
+        args:
+            params: dict, hashed version of request args
+            access: str, how the engine applies the other filters
+        return:
+            list[PlanStep], steps in evaluation order
+        '''
+        if "lat" in params:
+            return self.return_geo_query_plan(params)
+
+        predicates = [(predicate, value, access) for predicate, value in self.return_query_predicates(params)
+                      if predicate != "name"]
+        if "name" in params:
+            if self.is_selective_name(params["name"]):
+                predicates.insert(0, ("name", params["name"], "index"))
+            else:
+                predicates.append(("name", params["name"], "scan"))
+
+        return self.return_plan(predicates)
+
+    def apply_plan_step(self, step, restaurant_ids):
+        '''
+        Narrows the candidates of the earlier steps down to the restaurants matching a step
+        args:
+            step: PlanStep, step to apply
+            restaurant_ids: list[int], candidates left by the earlier steps, None before the first step
+        return:
+            list[int], matching restaurant ids
+        '''
+        storage = self.data_storage
+        if step.predicate == "name":
+            if step.access == "scan":
+                name = normalize_name(step.value)
+                return [id for id in restaurant_ids if name in storage.normalized_names[id]]
+            return self.return_filtered_restaurant_names(step.value, restaurant_ids or [])
+
+        if step.predicate == "cuisine":
+            values = self.return_matching_cuisine_names(step.value)
+            column = storage.cuisine_column
+            column_values = {id for id, name in storage.cuisine_ids.items() if name in values}
+        else:
+            values = self.return_range_values(step.predicate, step.value)
+            column = storage.return_columns()[step.predicate]
+            column_values = set(values)
+
+        if step.access == "scan":
+            return [id for id in restaurant_ids if column[id] in column_values]
+
+        index = getattr(storage, self.param_key_to_index_map[step.predicate])
+        matched_ids = [id for value in values for id in index.get(value, ())]
+        if restaurant_ids is None:
+            return matched_ids
+
+        restaurant_id_set = set(restaurant_ids) # constant time membership checks
+        return [id for id in matched_ids if id in restaurant_id_set]
+
+    def return_filtered_results(self, params, memo=None, version=None, trace=None, stage_timer=None):
+        '''
+        Provides logical filtering and sorting based on provided parameters.
+        Filters run in the order picked by return_query_plan.
+        args:
+            params: dict, hashed version of request args
+            memo: optional dict, intermediate results shared by the queries of a batch, see return_batch_filtered_results
+            version: optional int, data_version to read at, defaults to the current one
+            trace: optional list, gets the number of restaurants left after every step, see explain_query
+            stage_timer: optional StageTimer, marks the end of the filter and order stages, see match_service.metrics
         returns:
             list[int], an ordered array of restaurant ids
         '''
-        unique_restaurant_ids = []
-        ranked_results = {}
-        # cuisine as a top level filter if valid
+        # pinned before any index is read so a concurrent write is either fully visible or not at all
+        if version is None:
+            version = self.data_storage.data_version
+        if "lat" in params:
+            restaurant_ids = self.return_geo_results(params, version=version, trace=trace)
+            # ranked as the grid is read, there is no order stage
+            if stage_timer is not None:
+                stage_timer.mark("filter")
+            return restaurant_ids
+
+        unique_restaurant_ids = self.return_matching_ids(params, memo, version, trace)
+        if stage_timer is not None:
+            stage_timer.mark("filter")
+        restaurant_ids = self.order_results(unique_restaurant_ids, self.return_sort_priority(params))
+        if stage_timer is not None:
+            stage_timer.mark("order")
+
+        return restaurant_ids
+
+    def return_matching_ids(self, params, memo=None, version=None, trace=None):
+        '''
+        Filters the restaurants without ordering them, engines filter their own way by overriding this
+        args:
+            params: dict, hashed version of request args, without a location
+            memo: optional dict, intermediate results shared by the queries of a batch, see return_batch_filtered_results
+            version: optional int, data_version to read at, defaults to the current one
+            trace: optional list, gets the number of restaurants left after every step, see explain_query
+        returns:
+            set, matching restaurant ids visible at version
+        '''
+        if version is None:
+            version = self.data_storage.data_version
+        unique_restaurant_ids = None
+        # every step narrows the previous one, queries sharing the earlier steps share those results
+        stage_key = ()
+        for step in self.return_query_plan(params):
+            if step.predicate == "name":
+                stage_key += (("name", normalize_name(step.value)),)
+            else:
+                stage_key += ((step.predicate, step.value.lower() if step.value is not None else None),)
+            unique_restaurant_ids = self.return_memoized(memo, stage_key,
+                                                         lambda: self.apply_plan_step(step, unique_restaurant_ids))
+            if trace is not None:
+                trace.append(len(unique_restaurant_ids))
+            if not unique_restaurant_ids:
+                return set()
+
+        if unique_restaurant_ids is None:
+            # no filter narrows the results
+            unique_restaurant_ids = range(self.data_storage.restaurant_count)
+
+        return self.return_visible_ids(set(unique_restaurant_ids), version)
+
+    def return_facet_counts(self, params, version=None):
+        '''
+        Counts the restaurants matching a query per cuisine, rating, distance and price value,
+        without ordering or serializing them
+        args:
+            params: dict, hashed version of request args
+            version: optional int, data_version to read at, defaults to the current one
+        return:
+            dict, facet to each of its values to the number of matching restaurants, see return_facets
+        '''
+        return self.return_facets(*self.return_facet_value_counts(params, version))
+
+    def return_facet_value_counts(self, params, version=None):
+        '''
+        Counts the restaurants matching a query per value, engines count their own way by overriding this
+        args:
+            params: dict, hashed version of request args
+            version: optional int, data_version to read at, defaults to the current one
+        return:
+            list[dict], cuisine id, rating, distance and price counts, value to number of matching restaurants
+        '''
+        if version is None:
+            version = self.data_storage.data_version
+        if "lat" in params:
+            # the distances are the ones computed from the location, held in the rank keys
+            rank_keys = self.return_geo_keys(params, self.return_match_predicate(params, version))
+            min_distance = COLUMN_BOUNDS['distance'][0]
+            return self.count_facets([rank_key & RANK_KEY_ID_MASK for rank_key in rank_keys],
+                                     [(rank_key >> 56) + min_distance for rank_key in rank_keys])
+
+        return self.count_facets(self.return_matching_ids(params, version=version))
+
+    def count_facets(self, restaurant_ids, distances=None):
+        '''
+        Counts every combination of values in one pass over the restaurants, the facets are summed from the combinations
+        args:
+            restaurant_ids: collection[int], matching restaurant ids
+            distances: optional list[int], distance of every restaurant to count instead of its distance column
+        return:
+            list[Counter], cuisine id, rating, distance and price counts
+        '''
+        storage = self.data_storage
+        if distances is None:
+            distances = map(storage.distance_column.__getitem__, restaurant_ids)
+        # at most cuisines * ratings * distances * prices combinations, far fewer than restaurants
+        combination_counts = Counter(zip(map(storage.cuisine_column.__getitem__, restaurant_ids),
+                                         map(storage.rating_column.__getitem__, restaurant_ids),
+                                         distances, map(storage.price_column.__getitem__, restaurant_ids)))
+
+        facet_counts = [Counter(), Counter(), Counter(), Counter()]
+        for combination, count in combination_counts.items():
+            for counts, value in zip(facet_counts, combination):
+                counts[value] += count
+
+        return facet_counts
+
+    def return_facets(self, cuisine_counts, rating_counts, distance_counts, price_counts):
+        '''
+        Lays out facet counts the way the api returns them, values are strings like in a restaurant
+        args:
+            cuisine_counts: dict, cuisine id to count
+            rating_counts, distance_counts, price_counts: dict, value to count
+        return:
+            dict, "cuisines" most common first, "ratings" highest first, "distances" and "prices" lowest first,
+                values without a matching restaurant are left out
+        '''
+        cuisine_ids = self.data_storage.cuisine_ids
+        return {
+            "cuisines": {cuisine_ids[cuisine_id]: count for cuisine_id, count
+                         in sorted(cuisine_counts.items(), key=lambda item: (-item[1], cuisine_ids[item[0]]))},
+            "ratings": {str(value): count for value, count in sorted(rating_counts.items(), reverse=True)},
+            "distances": {str(value): count for value, count in sorted(distance_counts.items())},
+            "prices": {str(value): count for value, count in sorted(price_counts.items())},
+        }
+
+    def explain_query(self, params):
+        '''
+        Runs a query and reports how it was evaluated, for debugging slow queries
+        args:
+            params: dict, hashed version of request args
+        return:
+            dict, "plan" lists every step with its estimated and actual restaurants left after it,
+                steps after one that left no restaurants do not run and have no actual count
+        '''
+        plan = self.return_query_plan(params)
+        trace = []
+        restaurant_ids = self.return_filtered_results(params, trace=trace)
+        steps = []
+        for position, step in enumerate(plan):
+            actual_rows = trace[position] if position < len(trace) else None
+            steps.append(dict(step._asdict(), actual_rows=actual_rows))
+
+        return {"plan": steps, "result_rows": len(restaurant_ids)}
+
+    def return_batch_filtered_results(self, params_list):
+        '''
+        Answers several queries at once. Every query reads the same data_version and intermediate results
+        such as a cuisine or distance expansion are computed once for all the queries that need them.
+        args:
+            params_list: list[dict], hashed versions of request args
+        returns:
+            list[list[int]], an ordered array of restaurant ids per query, in the order of params_list
+        '''
+        version = self.data_storage.data_version
+        memo = {}
+        results = {} # identical queries, up to case, are only run once
+        answers = []
+        for params in params_list:
+            params_key = tuple(sorted((key, value.lower()) for key, value in params.items()))
+            if params_key not in results:
+                results[params_key] = self.return_filtered_results(params, memo, version)
+            answers.append(results[params_key])
+
+        return answers
+
+    def return_memoized(self, memo, key, compute):
+        '''
+        Returns compute(), computed once per key when a batch memo is given
+        args:
+            memo: dict, intermediate results of a batch, None outside of a batch
+            key: tuple, identifies the intermediate result
+            compute: function, computes the intermediate result
+        '''
+        if memo is None:
+            return compute()
+        if key not in memo:
+            memo[key] = compute()
+
+        return memo[key]
+
+    def return_match_predicate(self, params, version=None):
+        '''
+        Builds a check for a single restaurant against all the provided parameters,
+        matching exactly what return_filtered_results would return
+        args:
+            params: dict, hashed version of request args
+            version: optional int, data_version the reader pinned, defaults to the current one
+        return:
+            function, takes a restaurant id and returns whether it matches
+        '''
+        storage = self.data_storage
+        if version is None:
+            version = storage.data_version
+        is_visible = storage.is_visible if storage.created_versions or storage.deleted_versions else None
+        allowed_ratings = set(self.return_range_values("rating", self.return_range_param(params, "rating")))
+        # a located query applies the distance to the computed distance instead, see return_geo_keys
+        allowed_distances = None
+        if "lat" not in params:
+            allowed_distances = set(self.return_range_values("distance", self.return_range_param(params, "distance")))
+        allowed_prices = set(self.return_range_values("price", self.return_range_param(params, "price")))
+        allowed_cuisine_ids = None
         if "cuisine" in params:
-            unique_restaurant_ids = self.return_filtered_cuisine(params["cuisine"])
+            matching_cuisines = set(self.return_matching_cuisine_names(params["cuisine"]))
+            allowed_cuisine_ids = {id for id, name in storage.cuisine_ids.items() if name in matching_cuisines}
+        cuisine_column = storage.cuisine_column
+        rating_column = storage.rating_column
+        distance_column = storage.distance_column
+        price_column = storage.price_column
+        normalized_names = storage.normalized_names
+        name = normalize_name(params["name"]) if "name" in params else None
+
+        def matches(restaurant_id):
+            return ((allowed_distances is None or distance_column[restaurant_id] in allowed_distances)
+                    and rating_column[restaurant_id] in allowed_ratings
+                    and price_column[restaurant_id] in allowed_prices
+                    and (allowed_cuisine_ids is None or cuisine_column[restaurant_id] in allowed_cuisine_ids)
+                    and (name is None or name in normalized_names[restaurant_id])
+                    and (is_visible is None or is_visible(restaurant_id, version)))
+
+        return matches
+
+    def return_top_results(self, params, limit, start_position=0):
+        '''
+        Walks the precomputed ranking of the query's sort priority and stops as soon as limit matching restaurants are found,
+        so nothing past the requested page is filtered, ordered or serialized
+        args:
+            params: dict, hashed version of request args
+            limit: int, maximum number of restaurant ids to return
+            start_position: optional int, position in the ranking to resume from
+        returns:
+            list[int], ordered array of at most limit restaurant ids
+            int, position to resume from for the next page, None if there are no more results
+        '''
+        if "lat" in params:
+            return self.return_geo_top_results(params, limit, start_position)
+
+        storage = self.data_storage
+        version = storage.data_version
+        priority = self.return_sort_priority(params)
+        written_rank_keys = storage.return_extra_rank_keys()
+        matches = self.return_match_predicate(params, version)
+        if written_rank_keys:
+            if priority != DEFAULT_RANK_PRIORITY:
+                written_rank_keys = sorted(storage.return_rank_key(rank_key & RANK_KEY_ID_MASK, priority=priority)
+                                           for rank_key in written_rank_keys)
+            return self.return_merged_top_results(matches, limit, start_position, written_rank_keys, priority)
+
+        ranked_ids, _ = storage.return_ranking(priority)
+        restaurant_ids = []
+
+        for position in range(start_position, len(ranked_ids)):
+            if matches(ranked_ids[position]):
+                restaurant_ids.append(ranked_ids[position])
+                if len(restaurant_ids) == limit:
+                    next_position = position + 1
+                    return restaurant_ids, next_position if next_position < len(ranked_ids) else None
 
-        # subsequent filters will create "AND queries
-        for key in self.match_importance:
-            filter_method = self.param_key_to_store_map.get(key)
+        return restaurant_ids, None
 
-            if key in params:
-                restaurant_ids = filter_method(unique_restaurant_ids, params[key].lower())
+    def return_merged_top_results(self, matches, limit, start_position, written_rank_keys, priority=None):
+        '''
+        return_top_results for once restaurants were written after ingest. Positions count through the
+        precomputed ranking merged with the written restaurants, deleted restaurants keep their position.
+        args:
+            matches: function, return_match_predicate of the query
+            limit: int, maximum number of restaurant ids to return
+            start_position: int, position in the merged ranking to resume from
+            written_rank_keys: list[int], sorted rank keys of the restaurants written after ingest
+            priority: optional tuple, sort priority the rank keys were packed with, see return_sort_priority
+        returns:
+            list[int], ordered array of at most limit restaurant ids
+            int, position to resume from for the next page, None if there are no more results
+        '''
+        storage = self.data_storage
+        ranked_ids, _ = storage.return_ranking(priority)
+        return_rank_key = lambda restaurant_id: storage.return_rank_key(restaurant_id, priority=priority)
+        ranked_count = len(ranked_ids)
+        written_count = len(written_rank_keys)
+        total_count = ranked_count + written_count
+
+        def merged_position(ranked_position):
+            if ranked_position == ranked_count:
+                return total_count
+            return ranked_position + bisect_left(written_rank_keys, return_rank_key(ranked_ids[ranked_position]))
+
+        # the first ranked restaurant at or past start_position, the written ones make up the difference
+        low, high = 0, ranked_count
+        while low < high:
+            middle = (low + high) // 2
+            if merged_position(middle) >= start_position:
+                high = middle
+            else:
+                low = middle + 1
+        ranked_position = low
+        written_position = min(max(start_position - ranked_position, 0), written_count)
+
+        restaurant_ids = []
+        ranked_key = return_rank_key(ranked_ids[ranked_position]) if ranked_position < ranked_count else None
+        while ranked_position < ranked_count or written_position < written_count:
+            if ranked_key is None or (written_position < written_count and written_rank_keys[written_position] < ranked_key):
+                restaurant_id = written_rank_keys[written_position] & RANK_KEY_ID_MASK
+                written_position += 1
             else:
-                restaurant_ids = filter_method(unique_restaurant_ids)
+                restaurant_id = ranked_ids[ranked_position]
+                ranked_position += 1
+                ranked_key = return_rank_key(ranked_ids[ranked_position]) if ranked_position < ranked_count else None
+
+            if matches(restaurant_id):
+                restaurant_ids.append(restaurant_id)
+                if len(restaurant_ids) == limit:
+                    next_position = ranked_position + written_position
+                    return restaurant_ids, next_position if next_position < total_count else None
+
+        return restaurant_ids, None
+
+    def return_geo_radius(self, params):
+        '''
+        args:
+            params: dict, hashed version of request args, with "lat" and "lng"
+        return:
+            float, kilometres from the location a restaurant may be, the smaller of the radius and distance params,
+                None if neither is given
+        '''
+        radiuses = [float(params[key]) for key in ("radius", "distance") if key in params]
+        return min(radiuses) if radiuses else None
+
+    def return_geo_rings(self, params):
+        '''
+        args:
+            params: dict, hashed version of request args, with "lat" and "lng"
+        output:
+            tuple, (ring, restaurant id arrays) for every grid ring around the location that may hold a restaurant in range
+        '''
+        grid = self.data_storage.geo_grid
+        latitude = float(params["lat"])
+        radius = self.return_geo_radius(params)
+        center_cell = grid.return_cell(latitude, float(params["lng"]))
+        last_ring = grid.return_last_ring(center_cell)
+        if radius is not None:
+            last_ring = min(last_ring, grid.return_radius_ring(latitude, radius))
+
+        return grid.return_rings(center_cell, last_ring)
+
+    def return_geo_keys(self, params, matches=None, limit=None, priority=None):
+        '''
+        Reads the grid rings around a location, closest first, until no restaurant past them can be part of the
+        answer: the rings are past the radius, or with a limit, past the limit-th best restaurant found so far
+        args:
+            params: dict, hashed version of request args, with "lat" and "lng"
+            matches: optional function, return_match_predicate of the query, every restaurant in range matches if None
+            limit: optional int, only keep the best limit restaurants
+            priority: optional tuple, sort priority to pack the rank keys with, see return_sort_priority
+        return:
+            list[int], sorted rank keys of the matching restaurants, ranked by the distance computed from the location
+        '''
+        storage = self.data_storage
+        grid = storage.geo_grid
+        latitude_column = storage.latitude_column
+        longitude_column = storage.longitude_column
+        return_rank_key = storage.return_rank_key
+        latitude, longitude = float(params["lat"]), float(params["lng"])
+        radius = self.return_geo_radius(params)
+        min_distance = COLUMN_BOUNDS['distance'][0]
+        rank_keys = [] # every matching key without a limit, the negated best limit keys in a max heap with one
+        # the rings only bound the rank keys while the distance is ranked first
+        is_ranked_by_distance = priority is None or priority[0] == "distance"
+
+        for ring, ring_ids in self.return_geo_rings(params):
+            # the limit-th key so far ranks before any restaurant this far out could
+            if limit is not None and len(rank_keys) == limit and ring and is_ranked_by_distance:
+                bound = grid.return_ring_bound_km(latitude, ring - 1)
+                if (-rank_keys[0] >> 56) + min_distance < return_distance_unit(bound):
+                    break
+
+            for restaurant_ids in ring_ids:
+                for restaurant_id in restaurant_ids:
+                    distance = return_distance_km(latitude, longitude, latitude_column[restaurant_id] / MICRODEGREES,
+                                                  longitude_column[restaurant_id] / MICRODEGREES)
+                    if (radius is not None and distance > radius) or (matches is not None and not matches(restaurant_id)):
+                        continue
+
+                    rank_key = return_rank_key(restaurant_id, return_distance_unit(distance), priority)
+                    if limit is None:
+                        rank_keys.append(rank_key)
+                    elif len(rank_keys) < limit:
+                        heappush(rank_keys, -rank_key)
+                    elif rank_key < -rank_keys[0]:
+                        heapreplace(rank_keys, -rank_key)
+
+        if limit is not None:
+            rank_keys = [-rank_key for rank_key in rank_keys]
+        rank_keys.sort()
+
+        return rank_keys
+
+    def return_geo_query_plan(self, params):
+        '''
+        A located query reads the grid around the location and checks the other filters against every restaurant in range
+        args:
+            params: dict, hashed version of request args, with "lat" and "lng"
+        return:
+            list[PlanStep], steps in evaluation order
+        '''
+        storage = self.data_storage
+        radius = self.return_geo_radius(params)
+        # the restaurants in the rings read, an upper bound of the ones in range
+        matching_rows = sum(len(restaurant_ids) for _, ring_ids in self.return_geo_rings(params) for restaurant_ids in ring_ids)
+        matching_rows = min(matching_rows, storage.live_restaurant_count)
+
+        geo_value = f'{params["lat"]},{params["lng"]}' + (f' within {radius:g}km' if radius is not None else '')
+        live_count = storage.live_restaurant_count
+        predicates = []
+        for predicate, value in self.return_query_predicates(params):
+            # the distance is part of the radius, a default range every restaurant falls in filters nothing
+            if predicate == "distance" or (value is None and self.estimate_matching_rows(predicate, value) >= live_count):
+                continue
+            predicates.append((predicate, value, "scan"))
 
+        return [PlanStep("geo", geo_value, "grid", matching_rows, matching_rows)] + self.return_plan(predicates, matching_rows)
+
+    def return_geo_results(self, params, limit=None, version=None, trace=None):
+        '''
+        Provides the restaurants of a located query, ranked with the distance computed from the location.
+        Restaurants without coordinates never match a located query.
+        args:
+            params: dict, hashed version of request args, with "lat" and "lng"
+            limit: optional int, only return the best limit restaurants
+            version: optional int, data_version to read at, defaults to the current one
+            trace: optional list, gets the number of restaurants left after every step, see explain_query
+        returns:
+            list[int], an ordered array of restaurant ids
+        '''
+        if trace is None:
+            rank_keys = self.return_geo_keys(params, self.return_match_predicate(params, version), limit,
+                                             self.return_sort_priority(params))
+            return [rank_key & RANK_KEY_ID_MASK for rank_key in rank_keys]
+
+        # explained one step at a time, the query itself checks every filter per restaurant at once
+        rank_keys = self.return_geo_keys(params, priority=self.return_sort_priority(params))
+        restaurant_ids = [rank_key & RANK_KEY_ID_MASK for rank_key in rank_keys]
+        trace.append(len(restaurant_ids))
+        for step in self.return_geo_query_plan(params)[1:]:
             if not restaurant_ids:
-                return None
+                return []
+            restaurant_ids = self.apply_plan_step(step, restaurant_ids)
+            trace.append(len(restaurant_ids))
 
-            ranked_results[key] = restaurant_ids
-            unique_restaurant_ids = [id for sublist in restaurant_ids for id in sublist]
+        if version is None:
+            version = self.data_storage.data_version
+        visible_ids = self.return_visible_ids(set(restaurant_ids), version)
+        return [id for id in restaurant_ids if id in visible_ids][:limit]
 
-        if "name" in params:
-            unique_restaurant_ids = self.return_filtered_restaurant_names(params["name"], unique_restaurant_ids)
+    def return_geo_top_results(self, params, limit, start_position=0):
+        '''
+        return_top_results of a located query, positions count through the restaurants ranked from the location
+        args:
+            params: dict, hashed version of request args, with "lat" and "lng"
+            limit: int, maximum number of restaurant ids to return
+            start_position: optional int, position in the ranking to resume from
+        returns:
+            list[int], ordered array of at most limit restaurant ids
+            int, position to resume from for the next page, None if there are no more results
+        '''
+        end_position = start_position + limit
+        restaurant_ids = self.return_geo_results(params, end_position)
+        if len(restaurant_ids) == end_position:
+            return restaurant_ids[start_position:], end_position
+
+        return restaurant_ids[start_position:], None
+
+    def return_distance_texts(self, restaurant_ids, location):
+        '''
+        args:
+            restaurant_ids: list[int], ids of located restaurants
+            location: tuple, latitude and longitude in degrees
+        return:
+            list[str], kilometres from the location to every restaurant, sent in place of the distance column
+        '''
+        storage = self.data_storage
+        latitude, longitude = location
+        distances = []
+        for id in restaurant_ids:
+            distance_km = return_distance_km(latitude, longitude, storage.latitude_column[id] / MICRODEGREES,
+                                             storage.longitude_column[id] / MICRODEGREES)
+            distances.append(f'{distance_km:.2f}')
 
-        return self.order_results(set(unique_restaurant_ids), ranked_results, self.match_importance)
+        return distances
 
-    def return_restaurant_information(self, restaurant_ids):
+    def return_restaurant_information(self, restaurant_ids, location=None):
         '''
         Returns all available information about specified restaurants
         args:
             restaurant_ids: list[int], restaurants ids
+            location: optional tuple, latitude and longitude in degrees of a located query,
+                the distance is then the one computed from it
         return:
             restaurants: list[dict], array of hashes of all requested restaurants' properties
         '''
+        storage = self.data_storage
+        distances = self.return_distance_texts(restaurant_ids, location) if location is not None else None
         restaurants = []
-        for id in restaurant_ids:
-            restaurants_data = self.data_storage.restaurant_details[id]
-
+        for index, id in enumerate(restaurant_ids):
+            # values are sent as strings, the way they are written in the csv
             whole_restaurant_info = {
-                "name": self.data_storage.names[id],
-                "cuisine": self.data_storage.cuisine_ids[restaurants_data["cuisine_id"]],
-                "rating": restaurants_data["rating"],
-                "distance": restaurants_data["distance"],
-                "price": restaurants_data["price"]
+                "name": storage.names[id],
+                "cuisine": storage.cuisine_ids[storage.cuisine_column[id]],
+                "rating": str(storage.rating_column[id]),
+                "distance": distances[index] if distances is not None else str(storage.distance_column[id]),
+                "price": str(storage.price_column[id])
             }
 
             restaurants.append(whole_restaurant_info)
 
         return restaurants
+
+    def build_restaurant_fragments(self):
+        '''
+        Encodes every restaurant's json object once, see return_restaurant_json
+        '''
+        self.restaurant_fragments = RestaurantFragments(self.data_storage)
+
+    def return_restaurant_json(self, restaurant_ids, fields=None, location=None):
+        '''
+        Returns the same information as return_restaurant_information, already encoded as a json array
+        args:
+            restaurant_ids: list[int], restaurants ids
+            fields: optional tuple, RESTAURANT_FIELDS to include, all of them if None
+            location: optional tuple, latitude and longitude in degrees of a located query,
+                the distance is then the one computed from it
+        return:
+            bytes, json array of the restaurants
+        '''
+        if self.restaurant_fragments is None:
+            self.build_restaurant_fragments()
+        distances = None
+        if location is not None and (fields is None or "distance" in fields):
+            distances = self.return_distance_texts(restaurant_ids, location)
+
+        return self.restaurant_fragments.return_json_array(restaurant_ids, fields, distances)
@@ -1,9 +1,52 @@
 '''
 Parses csv files into memory. Acts as a database stand in.
 '''
-import json
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import permutations
 from csv import DictReader
 
+from .bitmaps import ids_to_bitmap
+from .csv_ingest import (COLUMN_BOUNDS, DEFAULT_CHUNK_SIZE, MAX_REJECTED_ROW_SAMPLES, IngestProgress, RestaurantCsvReader,
+                         return_rejection_reason)
+from .geo import MISSING_COORDINATE, GeoGrid
+from .snapshot import read_snapshot
+from .tables import COLUMN_TYPECODES, GEO_TYPECODE, ID_TYPECODE, DetailsTable
+from .trigrams import normalize_name, return_trigrams
+
+RANK_KEY_ID_MASK = 0xFFFFFFFF # low bits of a rank key holding the restaurant id
+# params a restaurant is ranked by, most significant first, see DataManager.match_importance
+DEFAULT_RANK_PRIORITY = ('distance', 'rating', 'price')
+# bits a param takes in a rank key, enough for every value its column's typecode holds
+RANK_FIELD_BITS = {key: (COLUMN_BOUNDS[key][1] - COLUMN_BOUNDS[key][0]).bit_length() for key in DEFAULT_RANK_PRIORITY}
+
+def return_rank_shifts(priority):
+    '''
+    Lays the params of a sort priority out in a rank key, the first one in the highest bits
+    ie: the default priority puts price at bit 32, rating at bit 48 and distance at bit 56
+    args:
+        priority: tuple, DEFAULT_RANK_PRIORITY in any order
+    return:
+        dict, param to the lowest bit of its field
+    '''
+    rank_shifts = {}
+    shift = RANK_KEY_ID_MASK.bit_length()
+    for key in reversed(priority):
+        rank_shifts[key] = shift
+        shift += RANK_FIELD_BITS[key]
+
+    return rank_shifts
+
+# every sort priority to the layout of its rank keys
+RANK_SHIFTS = {priority: return_rank_shifts(priority) for priority in permutations(DEFAULT_RANK_PRIORITY)}
+
+class SharedRestaurantName(Exception):
+    '''
+    Raised for a write naming a restaurant when several live restaurants have that name, ie: the branches of a chain,
+    a write can not tell which one it is for
+    '''
+
 class DataStorage:
 
     def __init__(self):
@@ -12,19 +55,117 @@ class DataStorage:
         self.ratings = {} # ratings to its restaurant ids
         self.distances = {} # distances to its restaurant ids
         self.prices = {} # prices to its restaurant ids
-        self.names = {} # restaurant id to their real name
-        self.restaurant_details = {} # data for each restaurant
+        self.names = [] # restaurant id to their real name
+        # typed columns, position n holds the value for restaurant id n
+        self.cuisine_column = array(COLUMN_TYPECODES['cuisine_id'])
+        self.rating_column = array(COLUMN_TYPECODES['rating'])
+        self.distance_column = array(COLUMN_TYPECODES['distance'])
+        self.price_column = array(COLUMN_TYPECODES['price'])
+        self.restaurant_details = DetailsTable(self.return_columns()) # data for each restaurant, read off the columns
+        # restaurant coordinates in microdegrees, MISSING_COORDINATE for restaurants without a location
+        self.latitude_column = array(GEO_TYPECODE)
+        self.longitude_column = array(GEO_TYPECODE)
+        self.geo_grid = GeoGrid() # located restaurant ids by grid cell, built by build_geo_index
         self.restaurant_count = 0
+        # bitmap versions of the indexes above over the ingested restaurants, bit n set for restaurant id n.
+        # Written restaurants are left out, adding one bit to an int copies the whole bitmap.
+        self.cuisine_bitmaps = {}
+        self.rating_bitmaps = {}
+        self.distance_bitmaps = {}
+        self.price_bitmaps = {}
+        self.all_restaurants_bitmap = 0
+        self.ranked_ids = [] # every restaurant id in closest distance -> highest rating -> cheapest price order
+        self.rank_positions = [] # restaurant id to its position in self.ranked_ids
+        self.rankings = {} # other sort priorities to their (ranked ids, rank positions), built by return_ranking
+        self.normalized_names = [] # restaurant id to its name normalized for matching
+        self.name_trigrams = {} # name trigram to the ascending ids of restaurants whose name contains it
+        self.snapshot_mmap = None # mapped snapshot file backing the data, if loaded from a snapshot
+        self.ingest_progress = None # IngestProgress of the finished csv ingest, None if loaded from a snapshot
+        self.rejected_rows = [] # first MAX_REJECTED_ROW_SAMPLES RejectedRows skipped by the csv ingest
+        # written rows are never changed in place, an update adds a new row and marks the old one deleted.
+        # Readers pin data_version and only see rows created at or before it and not deleted by then.
+        self.data_version = 0 # increases by one on every upsert or delete
+        self.created_versions = {} # restaurant id to the data_version that added it, ingested rows are version 0
+        self.deleted_versions = {} # restaurant id to the data_version that deleted or replaced it
+        self.extra_rank_keys = [] # rank keys of the restaurants added after ingest, in write order, see return_rank_key
+        self.sorted_extra_rank_keys = (0, []) # how many of extra_rank_keys were sorted and the sorted keys
+        self.live_ids_by_name = None # restaurant name to its live id, built by the first write
+        self.shared_names = set() # names of several live restaurants, left out of live_ids_by_name
+        # cardinality statistics for the query planner, kept up to date by writes
+        self.value_counts = {} # filter param to each of its values to the number of live restaurants with it
+        self.sorted_values = {} # range param to the distinct values stored for it, ascending, see return_values_between
+        self.live_restaurant_count = 0 # restaurants not deleted or replaced
 
-    def ingest(self, cuisine_csv_path, restaurant_csv_path):
+    def ingest(self, cuisine_csv_path, restaurant_csv_path, chunk_size=DEFAULT_CHUNK_SIZE, progress_callback=None):
         '''
-        Starts the data ingestion
+        Starts the data ingestion, the restaurants are streamed in chunks of chunk_size rows
         args:
             cuisine_csv_path: str, file path
             restaurant_csv_path: str, file path
+            chunk_size: optional int, most restaurant rows parsed at once
+            progress_callback: optional callable, called with an IngestProgress after every chunk
         '''
         self.parse_cuisines_from_csv(cuisine_csv_path)
-        self.parse_restaurants_from_csv(restaurant_csv_path)
+        self.parse_restaurants_from_csv(restaurant_csv_path, chunk_size, progress_callback)
+        self.build_bitmaps()
+        self.build_rankings()
+        self.build_statistics()
+        self.build_geo_index()
+
+    def ingest_rows(self, cuisine_ids, names, columns):
+        '''
+        Builds the storage from rows that were already validated, ie: a partition of another storage
+        args:
+            cuisine_ids: dict, cuisine id to cuisine name
+            names: list[str], restaurant names
+            columns: dict, restaurant_details key to the values of every restaurant in names
+        '''
+        self.cuisine_ids = dict(cuisine_ids)
+        self.cuisines = {name: array(ID_TYPECODE) for name in self.cuisine_ids.values()}
+        self.append_restaurants(names, columns)
+        self.build_bitmaps()
+        self.build_rankings()
+        self.build_statistics()
+        self.build_geo_index()
+
+    def load_snapshot(self, snapshot_path):
+        '''
+        Loads everything ingest would build from a compiled snapshot, see snapshot.py.
+        The data is read straight from the mapped file so processes share the pages.
+        args:
+            snapshot_path: str, file path
+        '''
+        loaded = read_snapshot(snapshot_path)
+        for attribute, value in loaded.items():
+            setattr(self, attribute, value)
+        self.restaurant_details = DetailsTable(self.return_columns())
+        self.build_statistics()
+        if "geo_grid" not in loaded:
+            self.build_geo_index()
+
+    def return_columns(self):
+        '''
+        Returns the typed columns by their restaurant_details key
+        return:
+            dict, restaurant_details key to its column
+        '''
+        return {
+            'cuisine_id': self.cuisine_column,
+            'rating': self.rating_column,
+            'distance': self.distance_column,
+            'price': self.price_column,
+        }
+
+    def return_geo_columns(self):
+        '''
+        Returns the coordinate columns, kept apart from return_columns as they are not part of a response
+        return:
+            dict, coordinate key to its column
+        '''
+        return {
+            'latitude': self.latitude_column,
+            'longitude': self.longitude_column,
+        }
 
     def parse_cuisines_from_csv(self, cuisine_csv_path):
         '''
@@ -35,28 +176,264 @@ class DataStorage:
         with open(cuisine_csv_path, 'r') as read_obj:
             csv_dict_reader = DictReader(read_obj)
             for row in csv_dict_reader:
-                self.cuisines[row['name']] = []
-                self.cuisine_ids[row['id']] = row['name']
+                self.cuisines[row['name']] = array(ID_TYPECODE)
+                self.cuisine_ids[int(row['id'])] = row['name']
 
-    def parse_restaurants_from_csv(self, restaurant_csv_path):
+    def parse_restaurants_from_csv(self, restaurant_csv_path, chunk_size=DEFAULT_CHUNK_SIZE, progress_callback=None):
         '''
-        Transforms the restaurants.csv data into readable dicts
+        Streams the restaurants.csv data into typed columns and indexes, rejecting rows that can not be stored
         args:
             restaurant_csv_path: str, file path
+            chunk_size: optional int, most rows parsed at once
+            progress_callback: optional callable, called with an IngestProgress after every chunk
         '''
-        with open(restaurant_csv_path, 'r') as read_obj:
-            csv_dict_reader = DictReader(read_obj)
-            for row in csv_dict_reader:
-                current_restaurant_id = self.set_ids_to_restaurants(row['name'])
-                self.match_restaurant_to_cuisine(current_restaurant_id, row['cuisine_id'])
-                self.match_restaurant_to_rating(current_restaurant_id, row['customer_rating'])
-                self.match_restaurant_to_distances(current_restaurant_id, row['distance'])
-                self.match_restaurant_to_prices(current_restaurant_id, row['price'])
-                self.restaurant_details[current_restaurant_id] = {
-                    'cuisine_id': row['cuisine_id'], 'rating': row['customer_rating'],
-                    'distance': row['distance'], 'price': row['price']
-                }
+        rows_rejected = 0
+        with open(restaurant_csv_path, 'rb') as read_obj:
+            total_bytes = os.fstat(read_obj.fileno()).st_size
+            csv_reader = RestaurantCsvReader(read_obj, self.cuisine_ids, chunk_size)
+            for chunk in csv_reader:
+                self.append_restaurants(chunk.names, chunk.columns)
+
+                rows_rejected += len(chunk.rejected_rows)
+                free_samples = MAX_REJECTED_ROW_SAMPLES - len(self.rejected_rows)
+                self.rejected_rows.extend(chunk.rejected_rows[:free_samples])
+
+                self.ingest_progress = IngestProgress(self.restaurant_count + rows_rejected, self.restaurant_count,
+                                                      rows_rejected, csv_reader.bytes_read, total_bytes)
+                if progress_callback:
+                    progress_callback(self.ingest_progress)
+
+        if self.ingest_progress is None:
+            self.ingest_progress = IngestProgress(0, 0, 0, total_bytes, total_bytes)
+
+    def append_restaurants(self, names, columns):
+        '''
+        Appends validated restaurants to the typed columns and indexes, ids continue from the last restaurant
+        args:
+            names: list[str], restaurant names
+            columns: dict, restaurant_details key to the values of every restaurant in names,
+                the restaurants are not located if it has no "latitude" and "longitude"
+        '''
+        for key, column in self.return_columns().items():
+            column.extend(columns[key])
+        for key, column in self.return_geo_columns().items():
+            column.extend(columns[key] if key in columns else array(GEO_TYPECODE, [MISSING_COORDINATE]) * len(names))
+
+        rows = zip(names, columns['cuisine_id'], columns['rating'], columns['distance'], columns['price'])
+        for name, cuisine_id, rating, distance, price in rows:
+            current_restaurant_id = self.set_ids_to_restaurants(name)
+            self.match_restaurant_to_cuisine(current_restaurant_id, cuisine_id)
+            self.match_restaurant_to_rating(current_restaurant_id, rating)
+            self.match_restaurant_to_distances(current_restaurant_id, distance)
+            self.match_restaurant_to_prices(current_restaurant_id, price)
+            self.match_restaurant_to_trigrams(current_restaurant_id, name)
 
+    def build_bitmaps(self):
+        '''
+        Builds a bitmap per indexed value from the restaurant id lists
+        '''
+        size = self.restaurant_count
+        index_to_bitmaps = [
+            (self.cuisines, self.cuisine_bitmaps),
+            (self.ratings, self.rating_bitmaps),
+            (self.distances, self.distance_bitmaps),
+            (self.prices, self.price_bitmaps),
+        ]
+        for index, bitmaps in index_to_bitmaps:
+            bitmaps.clear()
+            for value, restaurant_ids in index.items():
+                bitmaps[value] = ids_to_bitmap(restaurant_ids, size)
+
+        self.all_restaurants_bitmap = (1 << size) - 1
+
+    def build_rankings(self):
+        '''
+        Precomputes the position of every restaurant in the business ranking, which mirrors
+        DataManager.match_importance: closest distance -> highest rating -> cheapest price.
+        '''
+        self.ranked_ids, self.rank_positions = self.build_ranking(DEFAULT_RANK_PRIORITY, self.restaurant_count)
+        self.rankings = {}
+
+    def build_ranking(self, priority, ranked_count):
+        '''
+        Sorts the restaurants by a sort priority, full ties keep ascending id order so the ranking is deterministic.
+        Restaurants are sorted one value of the first param at a time so only that many sort keys are held at once.
+        args:
+            priority: tuple, DEFAULT_RANK_PRIORITY in any order
+            ranked_count: int, restaurants to rank, the ones with a higher id were written after ingest
+        return:
+            array, restaurant ids in ranked order
+            array, restaurant id to its position in the ranked ids
+        '''
+        first_key = priority[0]
+        index = {"distance": self.distances, "rating": self.ratings, "price": self.prices}[first_key]
+        ranked_ids = array(ID_TYPECODE)
+        # the highest rating ranks first, the lowest distance and price do
+        for value in sorted(index, reverse=first_key == "rating"):
+            restaurant_ids = index[value]
+            # postings are ascending, the written restaurants are at their end
+            restaurant_ids = restaurant_ids[:bisect_left(restaurant_ids, ranked_count)]
+            rank_keys = sorted(self.return_rank_key(restaurant_id, priority=priority) for restaurant_id in restaurant_ids)
+            ranked_ids.extend(rank_key & RANK_KEY_ID_MASK for rank_key in rank_keys)
+
+        rank_positions = array(ID_TYPECODE, bytes(ranked_ids.itemsize * ranked_count))
+        for position, restaurant_id in enumerate(ranked_ids):
+            rank_positions[restaurant_id] = position
+
+        return ranked_ids, rank_positions
+
+    def return_ranking(self, priority=None):
+        '''
+        Returns the precomputed ranking of a sort priority. Only the default one is built at ingest,
+        the others are built on their first request and kept, they rank the same restaurants.
+        args:
+            priority: optional tuple, DEFAULT_RANK_PRIORITY in any order, None for the default one
+        return:
+            array, restaurant ids in ranked order, the restaurants written after ingest are not part of it
+            array, restaurant id to its position in the ranked ids
+        '''
+        if priority is None or priority == DEFAULT_RANK_PRIORITY:
+            return self.ranked_ids, self.rank_positions
+
+        ranking = self.rankings.get(priority)
+        if ranking is None:
+            # concurrent readers may both build it, either result is the same
+            ranking = self.rankings.setdefault(priority, self.build_ranking(priority, len(self.ranked_ids)))
+
+        return ranking
+
+    def build_geo_index(self):
+        '''
+        Buckets every located restaurant into the grid cell of its coordinates
+        '''
+        self.geo_grid = GeoGrid()
+        for restaurant_id, latitude in enumerate(self.latitude_column):
+            if latitude != MISSING_COORDINATE:
+                self.geo_grid.add(restaurant_id, latitude, self.longitude_column[restaurant_id])
+
+    def build_statistics(self):
+        '''
+        Counts the restaurants per cuisine, rating, distance and price from the index postings,
+        the query planner estimates how many restaurants a filter keeps from these counts.
+        Also sorts the values of every range param, see return_values_between.
+        '''
+        index_by_param = {
+            "cuisine": self.cuisines,
+            "rating": self.ratings,
+            "distance": self.distances,
+            "price": self.prices,
+        }
+        self.value_counts = {param: {value: len(restaurant_ids) for value, restaurant_ids in index.items()}
+                             for param, index in index_by_param.items()}
+        self.sorted_values = {param: sorted(index_by_param[param]) for param in DEFAULT_RANK_PRIORITY}
+        self.live_restaurant_count = self.restaurant_count - len(self.deleted_versions)
+
+    def count_restaurant_values(self, restaurant_id, change):
+        '''
+        Adds change to the value counts of every value of a restaurant
+        args:
+            restaurant_id: int, restaurant's corresponding id value
+            change: int, 1 for a restaurant that became live, -1 for one that was deleted or replaced
+        '''
+        param_values = [
+            ("cuisine", self.cuisine_ids[self.cuisine_column[restaurant_id]]),
+            ("rating", self.rating_column[restaurant_id]),
+            ("distance", self.distance_column[restaurant_id]),
+            ("price", self.price_column[restaurant_id]),
+        ]
+        for param, value in param_values:
+            counts = self.value_counts[param]
+            counts[value] = counts.get(value, 0) + change
+
+        self.live_restaurant_count += change
+
+    def return_values_between(self, param, low, high):
+        '''
+        Looks up the stored values of a range param within the given bounds
+        ie: prices 10, 15, 20, 35 between 12 and 30 are 15 -> 20
+        args:
+            param: str, one of DEFAULT_RANK_PRIORITY
+            low: int, lowest value to keep
+            high: int, highest value to keep
+        return:
+            list[int], stored values in ascending order, including values every restaurant with them was deleted from
+        '''
+        values = self.sorted_values[param]
+        return values[bisect_left(values, low):bisect_right(values, high)]
+
+    def add_sorted_values(self, values):
+        '''
+        Adds the values of a written restaurant to the sorted values that do not hold them yet
+        args:
+            values: dict, restaurant_details key to int value
+        '''
+        for param in DEFAULT_RANK_PRIORITY:
+            sorted_values = self.sorted_values[param]
+            position = bisect_left(sorted_values, values[param])
+            if position == len(sorted_values) or sorted_values[position] != values[param]:
+                # readers take the list reference once, so it is swapped rather than changed in place
+                self.sorted_values[param] = sorted_values[:position] + [values[param]] + sorted_values[position:]
+
+    def return_rank_key(self, restaurant_id, distance=None, priority=None):
+        '''
+        Packs a restaurant's place in the ranking into one int, sorting the keys sorts the restaurants
+        closest distance -> highest rating -> cheapest price -> id
+        args:
+            restaurant_id: int, restaurant's corresponding id value
+            distance: optional int, distance to rank by instead of the restaurant's distance column,
+                ie: one computed from a location, see geo.return_distance_unit
+            priority: optional tuple, DEFAULT_RANK_PRIORITY in any order to rank by instead, see RANK_SHIFTS
+        return:
+            int, rank key, restaurant_id is rank_key & RANK_KEY_ID_MASK
+        '''
+        if distance is None:
+            distance = self.distance_column[restaurant_id]
+        if priority is not None and priority != DEFAULT_RANK_PRIORITY:
+            rank_shifts = RANK_SHIFTS[priority]
+            return ((int(distance) - COLUMN_BOUNDS['distance'][0]) << rank_shifts['distance']
+                    | (COLUMN_BOUNDS['rating'][1] - int(self.rating_column[restaurant_id])) << rank_shifts['rating']
+                    | (int(self.price_column[restaurant_id]) - COLUMN_BOUNDS['price'][0]) << rank_shifts['price']
+                    | restaurant_id)
+
+        # converted as the columns may be NumPy arrays, see ColumnarDataStorage, whose integers can not hold the key
+        return ((int(distance) - COLUMN_BOUNDS['distance'][0]) << 56
+                | (COLUMN_BOUNDS['rating'][1] - int(self.rating_column[restaurant_id])) << 48
+                | (int(self.price_column[restaurant_id]) - COLUMN_BOUNDS['price'][0]) << 32
+                | restaurant_id)
+
+    def return_extra_rank_keys(self):
+        '''
+        Returns the rank keys of the restaurants added after ingest in order,
+        the first reader after a write sorts the new keys in so the write itself does not
+        return:
+            list[int], sorted rank keys, see return_rank_key
+        '''
+        written_count = len(self.extra_rank_keys)
+        sorted_count, sorted_keys = self.sorted_extra_rank_keys
+        if sorted_count < written_count:
+            # the keys sorted before are still in order, sorting them again only merges in the new ones
+            sorted_keys = sorted_keys + self.extra_rank_keys[sorted_count:written_count]
+            sorted_keys.sort()
+            # readers take the list reference once, so the sorted keys are swapped rather than changed in place
+            self.sorted_extra_rank_keys = (written_count, sorted_keys)
+
+        return sorted_keys
+
+    def match_restaurant_to_trigrams(self, current_restaurant_id, restaurant_name):
+        '''
+        Normalizes a restaurant name once and indexes it by its trigrams
+        args:
+            current_restaurant_id: int, restaurant's corresponding id value
+            restaurant_name: str, name of the restaurant
+        '''
+        normalized_name = normalize_name(restaurant_name)
+        # names that are already normalized share the one string
+        self.normalized_names.append(restaurant_name if normalized_name == restaurant_name else normalized_name)
+        for trigram in return_trigrams(normalized_name):
+            if trigram in self.name_trigrams:
+                self.name_trigrams[trigram].append(current_restaurant_id)
+            else:
+                self.name_trigrams[trigram] = array(ID_TYPECODE, [current_restaurant_id])
 
     def set_ids_to_restaurants(self, restaurant_name):
         '''
@@ -67,7 +444,7 @@ class DataStorage:
             curr_count: int, argsed restaurant's corresponding id value
         '''
         curr_count = self.restaurant_count
-        self.names[curr_count] = restaurant_name
+        self.names.append(restaurant_name)
         self.restaurant_count += 1
         return curr_count
 
@@ -91,7 +468,7 @@ class DataStorage:
         if customer_rating in self.ratings:
             self.ratings[customer_rating].append(current_restaurant_id)
         else:
-            self.ratings[customer_rating] = [current_restaurant_id]
+            self.ratings[customer_rating] = array(ID_TYPECODE, [current_restaurant_id])
 
     def match_restaurant_to_distances(self, current_restaurant_id, distance):
         '''
@@ -103,7 +480,7 @@ class DataStorage:
         if distance in self.distances:
             self.distances[distance].append(current_restaurant_id)
         else:
-            self.distances[distance] = [current_restaurant_id]
+            self.distances[distance] = array(ID_TYPECODE, [current_restaurant_id])
 
     def match_restaurant_to_prices(self, current_restaurant_id, price):
         '''
@@ -115,4 +492,164 @@ class DataStorage:
         if price in self.prices:
             self.prices[price].append(current_restaurant_id)
         else:
-            self.prices[price] = [current_restaurant_id]
+            self.prices[price] = array(ID_TYPECODE, [current_restaurant_id])
+
+    def is_visible(self, restaurant_id, version):
+        '''
+        Whether a restaurant existed at the given data_version
+        args:
+            restaurant_id: int, restaurant's corresponding id value
+            version: int, data_version pinned by the reader
+        return:
+            bool, True if the restaurant was created at or before version and not deleted by then
+        '''
+        return (self.created_versions.get(restaurant_id, 0) <= version
+                and self.deleted_versions.get(restaurant_id, version + 1) > version)
+
+    def make_writable(self):
+        '''
+        Copies data that is still read straight from a mapped snapshot into growable arrays and lists.
+        Runs once, on the first write, ingested data is already writable.
+        '''
+        if self.live_ids_by_name is not None:
+            return
+
+        if self.snapshot_mmap is not None:
+            columns = self.return_columns()
+            self.cuisine_column = array(COLUMN_TYPECODES['cuisine_id'], columns['cuisine_id'])
+            self.rating_column = array(COLUMN_TYPECODES['rating'], columns['rating'])
+            self.distance_column = array(COLUMN_TYPECODES['distance'], columns['distance'])
+            self.price_column = array(COLUMN_TYPECODES['price'], columns['price'])
+            self.latitude_column = array(GEO_TYPECODE, self.latitude_column)
+            self.longitude_column = array(GEO_TYPECODE, self.longitude_column)
+            self.names = list(self.names.values())
+            self.normalized_names = list(self.normalized_names.values())
+            for index in [self.cuisines, self.ratings, self.distances, self.prices, self.name_trigrams]:
+                for value, restaurant_ids in index.items():
+                    index[value] = array(ID_TYPECODE, restaurant_ids)
+            self.geo_grid.cells = {cell: array(ID_TYPECODE, restaurant_ids)
+                                   for cell, restaurant_ids in self.geo_grid.cells.items()}
+            self.restaurant_details = DetailsTable(self.return_columns())
+
+        live_ids_by_name = {}
+        shared_names = set()
+        for restaurant_id, name in enumerate(self.names):
+            if self.is_visible(restaurant_id, self.data_version):
+                if name in live_ids_by_name:
+                    shared_names.add(name)
+                live_ids_by_name[name] = restaurant_id
+        for name in shared_names:
+            del live_ids_by_name[name]
+        # writes never add a live restaurant under a name that already has one, so no name becomes shared later
+        self.shared_names = shared_names
+        self.live_ids_by_name = live_ids_by_name
+
+    def return_live_id(self, restaurant_name):
+        '''
+        Looks up the current row of a restaurant for a write, the lookup is built on first use
+        args:
+            restaurant_name: str, name of a restaurant
+        return:
+            int, id of the current row of the restaurant, None if there is no such restaurant
+        raises:
+            SharedRestaurantName, if several restaurants have that name
+        '''
+        self.make_writable()
+        if restaurant_name in self.shared_names:
+            raise SharedRestaurantName(f"Several restaurants are named '{restaurant_name}', writes can not tell them apart")
+        return self.live_ids_by_name.get(restaurant_name)
+
+    def return_cuisine_id(self, cuisine_name):
+        '''
+        args:
+            cuisine_name: str, cuisine name, case insensitive
+        return:
+            int, key value for self.cuisine_ids, None if there is no such cuisine
+        '''
+        for cuisine_id, name in self.cuisine_ids.items():
+            if name.lower() == cuisine_name.lower():
+                return cuisine_id
+
+        return None
+
+    def upsert_restaurant(self, restaurant_name, values):
+        '''
+        Adds a restaurant, or replaces the restaurant with the same name, and indexes it.
+        Every index update is an append, or an insert into the few distinct values of a param,
+        so it costs the same regardless of the dataset size and of the writes before it.
+        Expects a single writer at a time, readers need no locking.
+        args:
+            restaurant_name: str, name of the restaurant, identifies it for later writes
+            values: dict, restaurant_details key to int value, keys left out keep the replaced restaurant's value,
+                "latitude" and "longitude" in microdegrees locate it, a new restaurant without them is not located
+        return:
+            int, id of the restaurant's new row
+        raises:
+            ValueError, if the values are incomplete for a new restaurant or can not be stored
+            SharedRestaurantName, if several restaurants have that name
+        '''
+        if not restaurant_name:
+            raise ValueError('name is empty')
+
+        previous_id = self.return_live_id(restaurant_name)
+        if previous_id is not None:
+            columns = dict(self.return_columns(), **self.return_geo_columns())
+            values = dict({key: columns[key][previous_id] for key in columns}, **values)
+
+        missing_keys = [key for key in COLUMN_TYPECODES if key not in values]
+        if missing_keys:
+            raise ValueError(f'{", ".join(missing_keys)} required for a new restaurant')
+        reason = return_rejection_reason(values, self.cuisine_ids)
+        if reason:
+            raise ValueError(reason)
+
+        version = self.data_version + 1
+        restaurant_id = self.restaurant_count
+        # the row is complete and marked as created in a future version before any index can return its id
+        for key, column in self.return_columns().items():
+            column.append(values[key])
+        for key, column in self.return_geo_columns().items():
+            column.append(values.get(key, MISSING_COORDINATE))
+        self.created_versions[restaurant_id] = version
+        self.match_restaurant_to_trigrams(restaurant_id, restaurant_name)
+        self.set_ids_to_restaurants(restaurant_name)
+
+        self.match_restaurant_to_cuisine(restaurant_id, values['cuisine_id'])
+        self.match_restaurant_to_rating(restaurant_id, values['rating'])
+        self.match_restaurant_to_distances(restaurant_id, values['distance'])
+        self.match_restaurant_to_prices(restaurant_id, values['price'])
+        self.add_sorted_values(values)
+        if self.latitude_column[restaurant_id] != MISSING_COORDINATE:
+            self.geo_grid.add(restaurant_id, self.latitude_column[restaurant_id], self.longitude_column[restaurant_id])
+
+        # sorted by the first reader that needs them, see return_extra_rank_keys
+        self.extra_rank_keys.append(self.return_rank_key(restaurant_id))
+
+        if previous_id is not None:
+            self.deleted_versions[previous_id] = version
+            self.count_restaurant_values(previous_id, -1)
+        self.count_restaurant_values(restaurant_id, 1)
+        self.live_ids_by_name[restaurant_name] = restaurant_id
+        # publishes the write, readers pinning this version see the new row and not the replaced one
+        self.data_version = version
+
+        return restaurant_id
+
+    def delete_restaurant(self, restaurant_name):
+        '''
+        Removes a restaurant. Its ids stay in the indexes and are skipped by readers until the next reload.
+        args:
+            restaurant_name: str, name of the restaurant
+        raises:
+            KeyError, if there is no restaurant with that name
+            SharedRestaurantName, if several restaurants have that name
+        '''
+        restaurant_id = self.return_live_id(restaurant_name)
+        if restaurant_id is None:
+            raise KeyError(restaurant_name)
+
+        version = self.data_version + 1
+        self.deleted_versions[restaurant_id] = version
+        self.count_restaurant_values(restaurant_id, -1)
+        del self.live_ids_by_name[restaurant_name]
+        self.data_version = version
@@ -0,0 +1,229 @@
+'''
+Keeps one process wide, read-only snapshot of the restaurant data that every request shares.
+'''
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from .engines import create_data_manager
+
+reload_logger = logging.getLogger(__name__)
+
+# version: int, increases by one on every successful (re)load and every write
+# data_manager: DataManager, fully ingested querier for this version, writes are applied to it in place
+# loaded_at: float, unix timestamp of when the data was loaded from the source files
+# modified_at: float, unix timestamp of the load or of the latest write since
+DatasetSnapshot = namedtuple('DatasetSnapshot', ['version', 'data_manager', 'loaded_at', 'modified_at'])
+
+class WritesNotSupported(Exception):
+    '''
+    Raised for a write to a dataset whose engine can only be reloaded from its source files
+    '''
+
+class DatasetHolder:
+
+    def __init__(self, cuisine_csv_path=None, restaurant_csv_path=None, check_interval=5, engine="list",
+                 snapshot_path=None, first_version=1):
+        '''
+        Loads the dataset once and publishes it as the current snapshot
+        args:
+            cuisine_csv_path: str, file path
+            restaurant_csv_path: str, file path
+            check_interval: optional int, seconds between checks of the source files for changes,
+                            None disables the file watching
+            engine: optional str, query engine to build snapshots with, see engines.DATA_MANAGER_ENGINES
+            snapshot_path: optional str, compiled snapshot to load and watch instead of the csv files
+            first_version: optional int, version of the first load, ie: past the versions of a dataset this one replaces
+        '''
+        self.cuisine_csv_path = cuisine_csv_path
+        self.restaurant_csv_path = restaurant_csv_path
+        self.check_interval = check_interval
+        self.engine = engine
+        self.snapshot_path = snapshot_path
+        self.first_version = first_version
+        self.reload_lock = threading.Lock() # only taken by reloads and writes, readers never lock
+        self.snapshot = None
+        self.writes_since_load = 0 # writes a reload from the source files would drop
+        self.file_signature = None
+        self.next_check = 0
+        self.reload()
+
+    def current(self):
+        '''
+        Returns the currently published snapshot. Callers should hold on to the returned snapshot
+        for the whole request so a concurrent reload cannot change the data underneath them.
+        A due check of the source files runs in the background, requests keep getting the current snapshot
+        until a reload swaps in the new one.
+        return:
+            DatasetSnapshot, the current snapshot
+        '''
+        if self.check_interval is not None and time.monotonic() >= self.next_check:
+            self.start_reload_check()
+
+        return self.snapshot
+
+    def reload(self):
+        '''
+        Builds a brand new snapshot from the source files and swaps it in. The previous snapshot
+        is left untouched so in-flight requests can finish with it.
+        return:
+            DatasetSnapshot, the newly published snapshot
+        '''
+        with self.reload_lock:
+            return self._reload()
+
+    def reload_if_changed(self):
+        '''
+        Reloads the snapshot if a source file changed since the last load. Skips the check
+        if another thread is already reloading.
+        return:
+            bool, whether a new snapshot was published
+        '''
+        if not self.reload_lock.acquire(blocking=False):
+            return False
+
+        try:
+            return self._reload_if_changed()
+        finally:
+            self.reload_lock.release()
+
+    def start_reload_check(self):
+        '''
+        Runs reload_if_changed on a background thread, only one check or reload runs at a time
+        return:
+            threading.Thread, the started check, None if another thread is already checking or reloading
+        '''
+        if not self.reload_lock.acquire(blocking=False):
+            return None
+
+        # the lock is handed over to the check, which releases it once done
+        self.next_check = time.monotonic() + (self.check_interval or 0)
+        reload_check = threading.Thread(target=self.run_reload_check, name='dataset-reload-check', daemon=True)
+        try:
+            reload_check.start()
+        except RuntimeError:
+            self.reload_lock.release()
+            raise
+
+        return reload_check
+
+    def run_reload_check(self):
+        '''
+        Body of the background check, a failed reload keeps the current snapshot and is retried on the next check,
+        expects self.reload_lock to be held and releases it
+        '''
+        try:
+            self._reload_if_changed()
+        except Exception:
+            reload_logger.exception('Reloading the dataset failed, still serving version %d', self.snapshot.version)
+        finally:
+            self.reload_lock.release()
+
+    def upsert_restaurant(self, restaurant_name, values):
+        '''
+        Adds or replaces a restaurant and publishes the change as a new version.
+        Writes are kept in memory only, a reload from the source files replaces them.
+        args:
+            restaurant_name: str, name of the restaurant
+            values: dict, restaurant_details key to int value, see DataStorage.upsert_restaurant
+        return:
+            DatasetSnapshot, the newly published snapshot
+        raises:
+            WritesNotSupported, if the engine can not be written to
+            ValueError, if the values can not be stored
+            SharedRestaurantName, if several restaurants have that name
+        '''
+        with self.reload_lock:
+            data_storage = self.return_writable_storage()
+            data_storage.upsert_restaurant(restaurant_name, values)
+            return self.publish_write()
+
+    def delete_restaurant(self, restaurant_name):
+        '''
+        Removes a restaurant and publishes the change as a new version
+        args:
+            restaurant_name: str, name of the restaurant
+        return:
+            DatasetSnapshot, the newly published snapshot
+        raises:
+            WritesNotSupported, if the engine can not be written to
+            KeyError, if there is no restaurant with that name
+            SharedRestaurantName, if several restaurants have that name
+        '''
+        with self.reload_lock:
+            data_storage = self.return_writable_storage()
+            data_storage.delete_restaurant(restaurant_name)
+            return self.publish_write()
+
+    def return_writable_storage(self):
+        '''
+        Returns the storage of the current snapshot for a write, expects self.reload_lock to be held
+        '''
+        data_manager = self.snapshot.data_manager
+        if not data_manager.supports_writes:
+            raise WritesNotSupported(f"The '{self.engine}' engine does not support writes, reload the source files instead")
+
+        return data_manager.data_storage
+
+    def publish_write(self):
+        '''
+        Bumps the version after a write so results cached for the previous version are dropped,
+        expects self.reload_lock to be held
+        '''
+        self.snapshot = self.snapshot._replace(version=self.snapshot.version + 1, modified_at=time.time())
+        self.writes_since_load += 1
+
+        return self.snapshot
+
+    def read_file_signature(self):
+        '''
+        Returns the modification time and size of the source files
+        return:
+            tuple, comparable file signature
+        '''
+        if self.snapshot_path:
+            paths = (self.snapshot_path,)
+        else:
+            paths = (self.cuisine_csv_path, self.restaurant_csv_path)
+
+        signature = []
+        for path in paths:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+
+        return tuple(signature)
+
+    def _reload_if_changed(self):
+        '''
+        Reloads the snapshot if a source file changed since the last load, expects self.reload_lock to be held
+        return:
+            bool, whether a new snapshot was published
+        '''
+        self.next_check = time.monotonic() + (self.check_interval or 0)
+        if self.read_file_signature() == self.file_signature:
+            return False
+        self._reload()
+
+        return True
+
+    def _reload(self):
+        '''
+        Does the actual load, expects self.reload_lock to be held
+        '''
+        file_signature = self.read_file_signature()
+        data_manager = create_data_manager(self.cuisine_csv_path, self.restaurant_csv_path, self.engine,
+                                           self.snapshot_path)
+        # encoded before the snapshot is published so no request pays for it
+        data_manager.build_restaurant_fragments()
+        version = self.snapshot.version + 1 if self.snapshot else self.first_version
+
+        # a single reference assignment, readers see either the old or the new snapshot
+        loaded_at = time.time()
+        self.snapshot = DatasetSnapshot(version, data_manager, loaded_at, loaded_at)
+        self.writes_since_load = 0
+        self.file_signature = file_signature
+        self.next_check = time.monotonic() + (self.check_interval or 0)
+
+        return self.snapshot
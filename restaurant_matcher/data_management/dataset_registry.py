@@ -0,0 +1,244 @@
+'''
+Serves the datasets of several regions from one process. A region's dataset is loaded on its first request,
+and the least recently used regions are evicted once the loaded ones hold more than the memory budget.
+'''
+import gc
+import os
+import re
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+
+from .dataset_holder import DatasetHolder
+
+# region names double as directory names, anything else could reach outside the regions directory
+REGION_PATTERN = re.compile(r'[a-z0-9_-]{1,64}')
+# objects shared by every dataset rather than held by one, not counted in its size
+SHARED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+
+def estimate_memory(root):
+    '''
+    Adds up the size of every object reachable from root, each object counted once
+    args:
+        root: object, ie: a DataManager
+    return:
+        int, bytes
+    '''
+    seen_ids = set()
+    pending = [root]
+    total = 0
+    while pending:
+        item = pending.pop()
+        if id(item) in seen_ids or isinstance(item, SHARED_TYPES):
+            continue
+        seen_ids.add(id(item))
+        # pages of a memory mapped snapshot belong to the file cache, only the map object itself is counted
+        total += sys.getsizeof(item)
+        pending.extend(gc.get_referents(item))
+
+    return total
+
+class RegionLoad:
+    '''
+    A load in progress, the requests arriving for the region meanwhile wait for it instead of loading it again
+    '''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.dataset_holder = None # DatasetHolder once loaded
+        self.error = None # exception the load raised, if it failed
+
+class DatasetRegistry:
+
+    def __init__(self, default_dataset_holder, regions_directory=None, memory_budget=None, engine="list",
+                 check_interval=5):
+        '''
+        A region's files are either <regions_directory>/<region>/data.snapshot, compiled by
+        restaurant_matcher.data_management.snapshot, or <regions_directory>/<region>/cuisines.csv and restaurants.csv
+        args:
+            default_dataset_holder: DatasetHolder, dataset of requests without a region, always loaded
+            regions_directory: optional str, directory holding a directory per region, None serves no region
+            memory_budget: optional int, bytes the loaded regions may hold together, None never evicts
+            engine: optional str, query engine to build the regions with, see engines.DATA_MANAGER_ENGINES
+            check_interval: optional int, seconds between checks of a region's files for changes, see DatasetHolder
+        '''
+        self.default_dataset_holder = default_dataset_holder
+        self.regions_directory = regions_directory
+        self.memory_budget = memory_budget
+        self.engine = engine
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.dataset_holders = OrderedDict() # region to its DatasetHolder, least recently used first
+        self.dataset_bytes = {} # region to the estimated size of its dataset when it was loaded
+        self.region_loads = {} # region to its RegionLoad while it is being loaded
+        # evicted region to the last version it served, a region loaded again continues past it so
+        # nothing cached for the evicted dataset is mistaken for the new one
+        self.evicted_versions = {}
+        self.loads = 0
+        self.load_failures = 0
+        self.load_seconds = 0
+        self.evictions = 0
+
+    def return_region_paths(self, region):
+        '''
+        args:
+            region: str, lowercased region name
+        return:
+            dict, DatasetHolder keyword arguments locating the region's files
+        raises:
+            KeyError, if the region has no files
+        '''
+        if self.regions_directory is None or not REGION_PATTERN.fullmatch(region):
+            raise KeyError(region)
+
+        region_directory = os.path.join(self.regions_directory, region)
+        snapshot_path = os.path.join(region_directory, 'data.snapshot')
+        if os.path.isfile(snapshot_path):
+            return {"snapshot_path": snapshot_path}
+        cuisine_csv_path = os.path.join(region_directory, 'cuisines.csv')
+        restaurant_csv_path = os.path.join(region_directory, 'restaurants.csv')
+        if os.path.isfile(cuisine_csv_path) and os.path.isfile(restaurant_csv_path):
+            return {"cuisine_csv_path": cuisine_csv_path, "restaurant_csv_path": restaurant_csv_path}
+
+        raise KeyError(region)
+
+    def return_dataset_holder(self, region=None):
+        '''
+        Returns a region's dataset, loading it if it is not loaded. Requests arriving while it loads wait for
+        that load rather than starting their own.
+        args:
+            region: optional str, region name, case insensitive, None for the default dataset
+        return:
+            DatasetHolder, the region's dataset
+        raises:
+            KeyError, if the region is unknown
+            RuntimeError, if the region's files could not be loaded
+        '''
+        if region is None:
+            return self.default_dataset_holder
+
+        region = region.lower()
+        with self.lock:
+            dataset_holder = self.dataset_holders.get(region)
+            if dataset_holder is not None:
+                self.dataset_holders.move_to_end(region)
+                # a region whose writes a reload dropped can be evicted again
+                self.evict_over_budget()
+                return dataset_holder
+            region_load = self.region_loads.get(region)
+            if region_load is None:
+                region_paths = self.return_region_paths(region)
+                first_version = self.evicted_versions.get(region, 0) + 1
+                region_load = self.region_loads[region] = RegionLoad()
+                is_loading = True
+            else:
+                is_loading = False
+
+        if not is_loading:
+            region_load.done.wait()
+            if region_load.error is not None:
+                raise region_load.error
+            return region_load.dataset_holder
+
+        start = time.perf_counter()
+        try:
+            dataset_holder = DatasetHolder(check_interval=self.check_interval, engine=self.engine,
+                                           first_version=first_version, **region_paths)
+            dataset_bytes = estimate_memory(dataset_holder.current().data_manager)
+        except Exception as error:
+            with self.lock:
+                del self.region_loads[region]
+                self.load_failures += 1
+            # the next request for the region tries again
+            region_load.error = RuntimeError(f"Region '{region}' failed to load: {error!r}")
+            region_load.done.set()
+            raise region_load.error from error
+
+        with self.lock:
+            self.dataset_holders[region] = dataset_holder
+            self.dataset_bytes[region] = dataset_bytes
+            del self.region_loads[region]
+            self.loads += 1
+            self.load_seconds += time.perf_counter() - start
+            self.evict_over_budget()
+        region_load.dataset_holder = dataset_holder
+        region_load.done.set()
+
+        return dataset_holder
+
+    def evict_over_budget(self):
+        '''
+        Drops the least recently used regions until the loaded ones fit in the memory budget,
+        the most recently used one always stays. Expects self.lock to be held.
+        Regions holding writes are never evicted, loading them again would lose the writes, a reload drops them anyway.
+        Requests still reading an evicted dataset finish on it, its memory is freed after them.
+        '''
+        if self.memory_budget is None:
+            return
+
+        for region in list(self.dataset_holders)[:-1]:
+            if sum(self.dataset_bytes.values()) <= self.memory_budget:
+                return
+            dataset_holder = self.dataset_holders[region]
+            if dataset_holder.writes_since_load:
+                continue
+            del self.dataset_holders[region]
+            self.evicted_versions[region] = dataset_holder.snapshot.version
+            del self.dataset_bytes[region]
+            self.evictions += 1
+
+    def reload(self, region=None):
+        '''
+        Reloads a region's dataset from its files, a region that is not loaded yet is only loaded
+        args:
+            region: optional str, region name, case insensitive, None for the default dataset
+        return:
+            DatasetSnapshot, the newly published snapshot
+        raises:
+            KeyError, if the region is unknown
+            RuntimeError, if the region's files could not be loaded, the region keeps serving its previous data
+        '''
+        with self.lock:
+            is_loaded = region is None or region.lower() in self.dataset_holders
+        dataset_holder = self.return_dataset_holder(region)
+        if not is_loaded:
+            return dataset_holder.snapshot
+
+        try:
+            return dataset_holder.reload()
+        except Exception as error:
+            raise RuntimeError(f"Region '{region or 'default'}' failed to reload: {error!r}") from error
+
+    def current(self, region=None):
+        '''
+        Returns the current snapshot of a region's dataset, see DatasetHolder.current
+        args:
+            region: optional str, region name, None for the default dataset
+        return:
+            DatasetSnapshot, the current snapshot
+        raises:
+            KeyError, if the region is unknown
+            RuntimeError, if the region's files could not be loaded
+        '''
+        return self.return_dataset_holder(region).current()
+
+    def stats(self):
+        '''
+        Returns the load and eviction counters
+        return:
+            dict, counter name to value
+        '''
+        with self.lock:
+            return {
+                "regions": list(self.dataset_holders),
+                "resident_bytes": sum(self.dataset_bytes.values()),
+                "memory_budget_bytes": self.memory_budget,
+                "pinned_regions": sum(1 for dataset_holder in self.dataset_holders.values()
+                                      if dataset_holder.writes_since_load),
+                "loads": self.loads,
+                "load_failures": self.load_failures,
+                "load_seconds": round(self.load_seconds, 6),
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,41 @@
+'''
+Registry of the interchangeable query engines. Every engine exposes the DataManager interface.
+'''
+from .bitmap_data_manager import BitmapDataManager
+from .data_manager import DataManager
+from .materialized_data_manager import MaterializedDataManager
+from .sharded_data_manager import ShardedDataManager
+
+DATA_MANAGER_ENGINES = {
+    "list": DataManager,
+    "bitmap": BitmapDataManager,
+    "materialized": MaterializedDataManager,
+    "sharded": ShardedDataManager,
+}
+
+# engines whose optional dependency is missing, mapped to the package to install
+UNAVAILABLE_ENGINES = {}
+
+try:
+    from .columnar_data_manager import ColumnarDataManager
+    DATA_MANAGER_ENGINES["columnar"] = ColumnarDataManager
+except ImportError:
+    UNAVAILABLE_ENGINES["columnar"] = "numpy"
+
+def create_data_manager(cuisine_csv_path=None, restaurant_csv_path=None, engine="list", snapshot_path=None):
+    '''
+    Builds a querier using the requested engine
+    args:
+        cuisine_csv_path: str, file path
+        restaurant_csv_path: str, file path
+        engine: optional str, key of DATA_MANAGER_ENGINES
+        snapshot_path: optional str, compiled snapshot to load instead of the csv files
+    return:
+        DataManager, ingested querier
+    '''
+    if engine in UNAVAILABLE_ENGINES:
+        raise ImportError(f"The '{engine}' engine requires the optional '{UNAVAILABLE_ENGINES[engine]}' package")
+    if engine not in DATA_MANAGER_ENGINES:
+        raise ValueError(f"Unknown data manager engine '{engine}', expected one of {sorted(DATA_MANAGER_ENGINES)}")
+
+    return DATA_MANAGER_ENGINES[engine](cuisine_csv_path, restaurant_csv_path, snapshot_path)
@@ -0,0 +1,143 @@
+'''
+Every restaurant's json object encoded once, so responses are assembled by joining bytes instead of
+building and serializing a dict per restaurant on every request.
+'''
+import json
+from array import array
+
+from .tables import OFFSET_TYPECODE
+
+# fields of a restaurant in a response, in the order they are encoded
+RESTAURANT_FIELDS = ("name", "cuisine", "rating", "distance", "price")
+# response field to the DataStorage column holding it, the name is encoded per restaurant
+FIELD_COLUMNS = {
+    "cuisine": "cuisine_column",
+    "rating": "rating_column",
+    "distance": "distance_column",
+    "price": "price_column",
+}
+
+class RestaurantFragments:
+    '''
+    Encoded json objects of the restaurants of a DataStorage, byte for byte what json.dumps gives
+    for the dicts of DataManager.return_restaurant_information
+    '''
+
+    def __init__(self, data_storage):
+        '''
+        args:
+            data_storage: DataStorage, restaurants to encode, restaurants written later are encoded when requested
+        '''
+        self.data_storage = data_storage
+        # encoded field value to its '"key": value' member, the few distinct values are encoded once
+        self.member_cache = {field: {} for field in FIELD_COLUMNS}
+        # restaurant id to its json object. Separate bytes objects cost about 40 bytes more per restaurant
+        # than one packed buffer but join several times faster than slices of it.
+        self.fragments = []
+        self.name_ends = array(OFFSET_TYPECODE) # restaurant id to the end of the name member in its fragment
+        for restaurant_id in range(data_storage.restaurant_count):
+            name_member = self.return_name_member(restaurant_id)
+            self.name_ends.append(1 + len(name_member))
+            self.fragments.append(self.encode_restaurant(restaurant_id, name_member))
+
+    def return_name_member(self, restaurant_id):
+        '''
+        return:
+            bytes, the encoded '"name": value' member of a restaurant
+        '''
+        return b'"name": ' + json.dumps(self.data_storage.names[restaurant_id]).encode()
+
+    def return_member(self, field, restaurant_id):
+        '''
+        args:
+            field: str, key of FIELD_COLUMNS
+            restaurant_id: int, restaurant's corresponding id value
+        return:
+            bytes, the encoded '"key": value' member of a restaurant
+        '''
+        # read through the storage, a first write may swap a snapshot's columns for growable copies
+        value = getattr(self.data_storage, FIELD_COLUMNS[field])[restaurant_id]
+        members = self.member_cache[field]
+        if value not in members:
+            # values are sent as strings, the way they are written in the csv
+            text = self.data_storage.cuisine_ids[value] if field == "cuisine" else str(value)
+            members[value] = json.dumps(field).encode() + b': ' + json.dumps(text).encode()
+
+        return members[value]
+
+    def encode_restaurant(self, restaurant_id, name_member=None):
+        '''
+        args:
+            restaurant_id: int, restaurant's corresponding id value
+            name_member: optional bytes, the already encoded name member
+        return:
+            bytes, the restaurant's json object
+        '''
+        members = [name_member or self.return_name_member(restaurant_id)]
+        members.extend(self.return_member(field, restaurant_id) for field in RESTAURANT_FIELDS[1:])
+
+        return b'{' + b', '.join(members) + b'}'
+
+    def return_fragment(self, restaurant_id, fields=None, distance=None):
+        '''
+        args:
+            restaurant_id: int, restaurant's corresponding id value
+            fields: optional tuple, RESTAURANT_FIELDS to include, all of them if None
+            distance: optional str, distance to send instead of the stored one, ie: computed from a location
+        return:
+            bytes, the restaurant's json object
+        '''
+        if distance is not None and fields is None:
+            fields = RESTAURANT_FIELDS
+        if restaurant_id >= len(self.fragments):
+            # written after the fragments were built
+            if fields is None:
+                return self.encode_restaurant(restaurant_id)
+            name_member = self.return_name_member(restaurant_id)
+        elif fields is None:
+            return self.fragments[restaurant_id]
+        else:
+            name_member = self.fragments[restaurant_id][1:self.name_ends[restaurant_id]]
+
+        members = []
+        for field in fields:
+            if field == "name":
+                members.append(name_member)
+            elif field == "distance" and distance is not None:
+                members.append(b'"distance": ' + json.dumps(distance).encode())
+            else:
+                members.append(self.return_member(field, restaurant_id))
+        return b'{' + b', '.join(members) + b'}'
+
+    def return_json_array(self, restaurant_ids, fields=None, distances=None):
+        '''
+        args:
+            restaurant_ids: list[int], restaurants ids
+            fields: optional tuple, RESTAURANT_FIELDS to include in their usual order, all of them if None
+            distances: optional list[str], distance of every restaurant to send instead of the stored ones
+        return:
+            bytes, json array of the restaurants' objects
+        '''
+        fragments = self.fragments
+        fragment_count = len(fragments)
+        if distances is not None:
+            fragments = [self.return_fragment(id, fields, distance) for id, distance in zip(restaurant_ids, distances)]
+        elif restaurant_ids and max(restaurant_ids) >= fragment_count:
+            fragments = [self.return_fragment(id, fields) for id in restaurant_ids]
+        elif fields is None:
+            fragments = [fragments[id] for id in restaurant_ids]
+        else:
+            # columns and encoded members are looked up once rather than per restaurant
+            field_members = [(getattr(self.data_storage, FIELD_COLUMNS[field]), self.member_cache[field], field)
+                             for field in fields if field != "name"]
+            name_ends = self.name_ends if "name" in fields else None
+            projected_fragments = []
+            for id in restaurant_ids:
+                members = [fragments[id][1:name_ends[id]]] if name_ends else []
+                for column, encoded_members, field in field_members:
+                    member = encoded_members.get(column[id])
+                    members.append(member if member is not None else self.return_member(field, id))
+                projected_fragments.append(b'{' + b', '.join(members) + b'}')
+            fragments = projected_fragments
+
+        return b'[' + b', '.join(fragments) + b']'
@@ -0,0 +1,216 @@
+'''
+Restaurant coordinates and the grid index that finds the restaurants near a point without scanning every restaurant.
+'''
+import math
+from array import array
+
+from .tables import ID_TYPECODE
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+MICRODEGREES = 1000000 # coordinates are stored as whole millionths of a degree, about 11cm
+MISSING_COORDINATE = -(1 << 31) # stored for restaurants without a location, outside every valid coordinate
+# csv header to its coordinate and the largest absolute value it takes
+GEO_CSV_COLUMNS = {
+    "latitude": 90,
+    "longitude": 180,
+}
+GRID_CELL_DEGREES = 0.01 # about 1.1km of latitude per grid cell
+
+def parse_coordinate(key, text):
+    '''
+    Converts a csv or request coordinate to its stored form
+    args:
+        key: str, "latitude" or "longitude"
+        text: str or float, coordinate in degrees, blank for a restaurant without a location
+    return:
+        int, coordinate in microdegrees, MISSING_COORDINATE if blank
+    raises:
+        ValueError, if the coordinate is not a number or out of range
+    '''
+    if isinstance(text, str) and not text.strip():
+        return MISSING_COORDINATE
+    degrees = float(text)
+    if not -GEO_CSV_COLUMNS[key] <= degrees <= GEO_CSV_COLUMNS[key]:
+        raise ValueError(f'{key} {text} is out of range')
+
+    return round(degrees * MICRODEGREES)
+
+def return_distance_km(latitude, longitude, other_latitude, other_longitude):
+    '''
+    Great circle distance between two points, haversine formula
+    args:
+        latitude, longitude, other_latitude, other_longitude: float, degrees
+    return:
+        float, kilometres
+    '''
+    latitude, other_latitude = math.radians(latitude), math.radians(other_latitude)
+    half_chord = (math.sin((other_latitude - latitude) / 2) ** 2
+                  + math.cos(latitude) * math.cos(other_latitude) * math.sin(math.radians(other_longitude - longitude) / 2) ** 2)
+
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1, math.sqrt(half_chord)))
+
+def return_distance_unit(distance_km):
+    '''
+    Rounds a computed distance up to the whole units the ranking compares, like the distance column of the csv
+    args:
+        distance_km: float, kilometres
+    return:
+        int, distance unit, at least 1
+    '''
+    return max(1, math.ceil(distance_km))
+
+class GeoGrid:
+    '''
+    Buckets restaurant ids by the latitude/longitude cell they are in. A lookup walks rings of cells outwards
+    from the cell of the point, so it only reads the cells near the point.
+    Longitudes are not wrapped around the antimeridian, a city never spans it.
+    '''
+
+    def __init__(self, cell_degrees=GRID_CELL_DEGREES):
+        '''
+        args:
+            cell_degrees: optional float, height and width of a cell in degrees
+        '''
+        self.cell_degrees = cell_degrees
+        self.cells = {} # (row, column) to the ascending ids of the restaurants in the cell
+        self.restaurant_count = 0
+        # smallest and largest row and column holding restaurants, rings past them are empty
+        self.row_bounds = None
+        self.column_bounds = None
+
+    def return_cell(self, latitude, longitude):
+        '''
+        args:
+            latitude, longitude: float, degrees
+        return:
+            tuple, (row, column) of the cell holding the point
+        '''
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    def add(self, restaurant_id, latitude, longitude):
+        '''
+        Indexes a restaurant, ids are expected in ascending order
+        args:
+            restaurant_id: int, restaurant's corresponding id value
+            latitude, longitude: int, microdegrees
+        '''
+        row, column = self.return_cell(latitude / MICRODEGREES, longitude / MICRODEGREES)
+        if (row, column) not in self.cells:
+            self.cells[(row, column)] = array(ID_TYPECODE)
+        self.cells[(row, column)].append(restaurant_id)
+        self.restaurant_count += 1
+
+        if self.row_bounds is None:
+            self.row_bounds = (row, row)
+            self.column_bounds = (column, column)
+        else:
+            self.row_bounds = (min(self.row_bounds[0], row), max(self.row_bounds[1], row))
+            self.column_bounds = (min(self.column_bounds[0], column), max(self.column_bounds[1], column))
+
+    def load_cells(self, cells):
+        '''
+        Replaces the grid with cells that were already bucketed, ie: read from a snapshot
+        args:
+            cells: dict, (row, column) to the ascending ids of the restaurants in the cell
+        '''
+        self.cells = cells
+        self.restaurant_count = sum(len(restaurant_ids) for restaurant_ids in cells.values())
+        if cells:
+            rows = [row for row, _ in cells]
+            columns = [column for _, column in cells]
+            self.row_bounds = (min(rows), max(rows))
+            self.column_bounds = (min(columns), max(columns))
+        else:
+            self.row_bounds = None
+            self.column_bounds = None
+
+    def return_last_ring(self, center_cell):
+        '''
+        args:
+            center_cell: tuple, (row, column) lookups start from
+        return:
+            int, the furthest ring around center_cell that still holds a cell with restaurants, -1 if there are none
+        '''
+        if self.row_bounds is None:
+            return -1
+        row, column = center_cell
+        return max(abs(row - self.row_bounds[0]), abs(row - self.row_bounds[1]),
+                   abs(column - self.column_bounds[0]), abs(column - self.column_bounds[1]))
+
+    def return_ring_ids(self, center_cell, ring):
+        '''
+        args:
+            center_cell: tuple, (row, column) the ring is around
+            ring: int, cells this many rows or columns away from center_cell, 0 is the center cell itself
+        output:
+            array, restaurant ids of every non empty cell of the ring
+        '''
+        row, column = center_cell
+        if ring == 0:
+            ring_cells = [center_cell]
+        else:
+            ring_cells = [(row - ring, column + offset) for offset in range(-ring, ring + 1)]
+            ring_cells += [(row + ring, column + offset) for offset in range(-ring, ring + 1)]
+            ring_cells += [(row + offset, column - ring) for offset in range(-ring + 1, ring)]
+            ring_cells += [(row + offset, column + ring) for offset in range(-ring + 1, ring)]
+
+        for cell in ring_cells:
+            restaurant_ids = self.cells.get(cell)
+            if restaurant_ids is not None:
+                yield restaurant_ids
+
+    def return_ring_bound_km(self, latitude, ring):
+        '''
+        A lower bound of the distance from a point in the center cell to any cell past the given ring
+        args:
+            latitude: float, degrees, latitude of the point
+            ring: int, rings already read
+        return:
+            float, kilometres
+        '''
+        # a cell is narrowest at the latitude furthest from the equator the next ring reaches
+        furthest_latitude = min(90, abs(latitude) + (ring + 2) * self.cell_degrees)
+        cell_km = self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(furthest_latitude))
+
+        # shaved by 1%, the great circle between two points is a little shorter than the parallel through them
+        return ring * cell_km * 0.99
+
+    def return_radius_ring(self, latitude, radius_km):
+        '''
+        args:
+            latitude: float, degrees, latitude of the point
+            radius_km: float, kilometres
+        return:
+            int, the furthest ring that may hold a restaurant within radius_km of the point
+        '''
+        ring = 0
+        while self.return_ring_bound_km(latitude, ring) <= radius_km and ring < 180 / self.cell_degrees:
+            ring += 1
+        return ring
+
+    def return_rings(self, center_cell, last_ring):
+        '''
+        Groups the restaurants around a cell by ring, closest ring first
+        args:
+            center_cell: tuple, (row, column) the rings are around
+            last_ring: int, furthest ring to read
+        output:
+            tuple, (ring, list of id arrays of the ring's non empty cells) for every ring holding restaurants
+        '''
+        # walking the rings looks up every cell, over a sparse area grouping the non empty cells is fewer lookups
+        if (2 * last_ring + 1) ** 2 <= len(self.cells):
+            for ring in range(last_ring + 1):
+                ring_ids = list(self.return_ring_ids(center_cell, ring))
+                if ring_ids:
+                    yield ring, ring_ids
+            return
+
+        row, column = center_cell
+        rings = {}
+        for (cell_row, cell_column), restaurant_ids in self.cells.items():
+            ring = max(abs(cell_row - row), abs(cell_column - column))
+            if ring <= last_ring:
+                rings.setdefault(ring, []).append(restaurant_ids)
+        for ring in sorted(rings):
+            yield ring, rings[ring]
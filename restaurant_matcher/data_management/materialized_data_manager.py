@@ -0,0 +1,251 @@
+'''
+Querier that precomputes the ranked answer of every cuisine, rating, distance and price combination at load time.
+The request params only take a few thousand distinct values so every query without a name is answered by merging
+the ranked runs of the exact combinations in its range, each restaurant is stored in a single run.
+'''
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from heapq import merge
+from itertools import chain
+
+from .data_manager import RANGE_BOUND_PARAMS, DataManager
+from .tables import ID_TYPECODE
+from .trigrams import normalize_name
+
+# combinations: int, (cuisine, rating, distance, price) queries answered off the table, cuisine may be left out
+# stored_ids: int, rank positions held by the runs, at most one per restaurant
+# table_bytes: int, memory held by the position and distance end arrays
+# build_seconds: float, time taken to build the table
+AnswerTableReport = namedtuple('AnswerTableReport', ['combinations', 'stored_ids', 'table_bytes', 'build_seconds'])
+
+class MaterializedDataManager(DataManager):
+
+    # the table is built once at load time, writes need a reload
+    supports_writes = False
+
+    def __init__(self, cuisine_csv_path=None, restaurant_csv_path=None, snapshot_path=None):
+        super().__init__(cuisine_csv_path, restaurant_csv_path, snapshot_path)
+
+        # (cuisine name, rating, price) to a run holding the rank positions of the restaurants with exactly those
+        # values and their ends per distance, every restaurant is stored in one run only. The ranking is distance
+        # first, so the part of a run within a smaller distance is a prefix of it.
+        # Position n of the ends is the number of positions within distance self.answer_distances[n].
+        self.runs = {}
+        # (cuisine name or None, rating, price) to the runs in range of it, their merge is the answer of the params
+        self.answer_runs = {}
+        self.answer_ratings = self.return_rating_range()
+        self.answer_distances = self.return_distance_range()
+        self.answer_prices = self.return_price_range()
+        self.answer_table_report = None
+        self.build_answer_table()
+
+    def build_answer_table(self):
+        '''
+        Walks the ranking once to split it into runs, then lists the runs every answer merges
+        '''
+        start = time.perf_counter()
+        storage = self.data_storage
+        in_range_distances = set(self.answer_distances)
+        in_range_ratings = set(self.answer_ratings)
+        in_range_prices = set(self.answer_prices)
+        run_positions = {}
+        for position, restaurant_id in enumerate(storage.ranked_ids):
+            rating = storage.rating_column[restaurant_id]
+            price = storage.price_column[restaurant_id]
+            if (storage.distance_column[restaurant_id] not in in_range_distances or rating not in in_range_ratings
+                    or price not in in_range_prices):
+                continue
+            key = (storage.cuisine_ids[storage.cuisine_column[restaurant_id]], rating, price)
+            if key not in run_positions:
+                run_positions[key] = array(ID_TYPECODE)
+            run_positions[key].append(position)
+
+        for key, positions in run_positions.items():
+            distances = [storage.distance_column[storage.ranked_ids[position]] for position in positions]
+            distance_ends = array(ID_TYPECODE, [bisect_right(distances, distance) for distance in self.answer_distances])
+            self.runs[key] = (positions, distance_ends)
+
+        for cuisine_name in [None] + list(storage.cuisines):
+            for rating in self.answer_ratings:
+                for price in self.answer_prices:
+                    self.answer_runs[(cuisine_name, rating, price)] = []
+        for (cuisine_name, rating, price), run in self.runs.items():
+            for answer_cuisine_name in (None, cuisine_name):
+                for answer_rating in self.answer_ratings:
+                    for answer_price in self.answer_prices:
+                        if answer_rating <= rating and answer_price >= price:
+                            self.answer_runs[(answer_cuisine_name, answer_rating, answer_price)].append(run)
+
+        stored_ids = sum(len(positions) for positions, _ in self.runs.values())
+        table_bytes = sum(positions.itemsize * len(positions) + distance_ends.itemsize * len(distance_ends)
+                          for positions, distance_ends in self.runs.values())
+        self.answer_table_report = AnswerTableReport(len(self.answer_runs) * len(self.answer_distances), stored_ids,
+                                                     table_bytes, time.perf_counter() - start)
+
+    def return_answer_slices(self, params):
+        '''
+        Looks up the runs answering every param except the name
+        args:
+            params: dict, hashed version of request args
+        return:
+            list[tuple], (ranked rank positions, end) per run in range of the params, the answer merges
+                positions[:end] of them all, None if the params are outside the table and need filtering
+        '''
+        # located queries rank by the distance from their location, the table only holds the default ranking
+        # and ranges open at the default end
+        if "lat" in params or "sort" in params or any(key in params for key in RANGE_BOUND_PARAMS.values()):
+            return None
+        try:
+            rating_range = self.return_rating_range(params.get("rating", self.answer_ratings[-1]))
+            distance_range = self.return_distance_range(params.get("distance", self.answer_distances[-1]))
+            price_range = self.return_price_range(params.get("price", self.answer_prices[-1]))
+        except ValueError:
+            return None
+        # values between two stored ones share the answer of the last stored value in range
+        if (not rating_range or rating_range[-1] not in self.answer_ratings or not distance_range
+                or distance_range[-1] not in self.answer_distances or not price_range
+                or price_range[-1] not in self.answer_prices):
+            return None
+        rating = rating_range[-1]
+        price = price_range[-1]
+        distance_index = self.answer_distances.index(distance_range[-1])
+
+        cuisine_names = [None]
+        if "cuisine" in params:
+            cuisine_names = self.return_matching_cuisine_names(params["cuisine"])
+            if len(cuisine_names) == len(self.data_storage.cuisines):
+                cuisine_names = [None]
+
+        return [(positions, distance_ends[distance_index])
+                for cuisine_name in cuisine_names
+                for positions, distance_ends in self.answer_runs[(cuisine_name, rating, price)]
+                if distance_ends[distance_index]]
+
+    def return_answer(self, answer_slices):
+        '''
+        args:
+            answer_slices: list[tuple], see return_answer_slices
+        return:
+            list[int], ranked restaurant ids
+        '''
+        ranked_ids = self.data_storage.ranked_ids
+        if len(answer_slices) == 1:
+            positions, end = answer_slices[0]
+            return [ranked_ids[position] for position in positions[:end]]
+
+        # each run is already sorted so this is a merge
+        positions = sorted(chain.from_iterable(positions[:end] for positions, end in answer_slices))
+        return [ranked_ids[position] for position in positions]
+
+    def is_name_first(self, params, answer_slices):
+        '''
+        Whether a name is rarer than the answer of the other params, the query is then planned like
+        on the list engine, which looks the name up first
+        args:
+            params: dict, hashed version of request args
+            answer_slices: list[tuple], see return_answer_slices
+        return:
+            bool
+        '''
+        answer_count = sum(end for _, end in answer_slices)
+        return "name" in params and self.estimate_matching_rows("name", params["name"]) < answer_count
+
+    def return_query_plan(self, params):
+        '''
+        Every param except the name is answered off the table, the name is checked against the answer
+        args:
+            params: dict, hashed version of request args
+        return:
+            list[PlanStep], steps in evaluation order
+        '''
+        answer_slices = self.return_answer_slices(params)
+        if answer_slices is None or self.is_name_first(params, answer_slices):
+            return super().return_query_plan(params)
+
+        predicates = [(predicate, value, "lookup") for predicate, value in self.return_query_predicates(params)
+                      if predicate != "name"]
+        if "name" in params:
+            predicates.append(("name", params["name"], "scan"))
+
+        return self.return_plan(predicates)
+
+    def return_filtered_results(self, params, memo=None, version=None, trace=None, stage_timer=None):
+        '''
+        Provides logical filtering and sorting based on provided parameters, read off the answer table
+        args:
+            params: dict, hashed version of request args
+            memo: optional dict, intermediate results shared by the queries of a batch, see return_batch_filtered_results
+            version: optional int, unused, this engine can not be written to
+            trace: optional list, gets the number of restaurants left after every step, see explain_query
+            stage_timer: optional StageTimer, marks the end of the filter and order stages, see match_service.metrics
+        returns:
+            list[int], an ordered array of restaurant ids
+        '''
+        answer_slices = self.return_answer_slices(params)
+        if answer_slices is None or self.is_name_first(params, answer_slices):
+            return super().return_filtered_results(params, memo, version, trace, stage_timer)
+
+        restaurant_ids = self.return_answer(answer_slices)
+        if trace is not None:
+            # the lookup applies every param but the name at once
+            lookup_steps = len(self.return_query_predicates(params)) - ("name" in params)
+            trace.extend([len(restaurant_ids)] * lookup_steps)
+        if "name" in params and restaurant_ids:
+            # keeps the ranked order of the answer
+            restaurant_ids = self.return_filtered_restaurant_names(params["name"], restaurant_ids)
+            if trace is not None:
+                trace.append(len(restaurant_ids))
+        # the answer is already ranked, there is no order stage
+        if stage_timer is not None:
+            stage_timer.mark("filter")
+
+        return restaurant_ids
+
+    def return_facet_value_counts(self, params, version=None):
+        '''
+        Counts the answer read off the table, it is already ranked so nothing is spent on ordering
+        args:
+            params: dict, hashed version of request args
+            version: optional int, unused, this engine can not be written to
+        return:
+            list[dict], cuisine id, rating, distance and price counts, value to number of matching restaurants
+        '''
+        if self.return_answer_slices(params) is None:
+            return super().return_facet_value_counts(params, version)
+
+        return self.count_facets(self.return_filtered_results(params))
+
+    def return_top_results(self, params, limit, start_position=0):
+        '''
+        Pages through the answer of the params, the name is only checked up to the end of the page
+        args:
+            params: dict, hashed version of request args
+            limit: int, maximum number of restaurant ids to return
+            start_position: optional int, position in the ranking to resume from
+        returns:
+            list[int], ordered array of at most limit restaurant ids
+            int, position to resume from for the next page, None if there are no more results
+        '''
+        answer_slices = self.return_answer_slices(params)
+        if answer_slices is None:
+            return super().return_top_results(params, limit, start_position)
+        # every run from its first position at or past start_position, merged lazily up to the end of the page
+        runs = [memoryview(positions)[bisect_left(positions, start_position, 0, end):end]
+                for positions, end in answer_slices]
+        answer_positions = runs[0] if len(runs) == 1 else merge(*runs)
+
+        ranked_ids = self.data_storage.ranked_ids
+        ranked_count = len(ranked_ids)
+        name = normalize_name(params["name"]) if "name" in params else None
+        normalized_names = self.data_storage.normalized_names
+        restaurant_ids = []
+        for position in answer_positions:
+            restaurant_id = ranked_ids[position]
+            if name is None or name in normalized_names[restaurant_id]:
+                restaurant_ids.append(restaurant_id)
+                if len(restaurant_ids) == limit:
+                    return restaurant_ids, position + 1 if position + 1 < ranked_count else None
+
+        return restaurant_ids, None
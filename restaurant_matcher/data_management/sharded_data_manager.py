@@ -0,0 +1,242 @@
+'''
+Querier that partitions the restaurants by id range into shards, each searched by its own worker process,
+so a heavy query uses several cores. The coordinator fans a query out to every shard and merges their
+ranked matches, paged queries only keep the top of each shard.
+'''
+import multiprocessing
+import os
+import threading
+import weakref
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+
+from .data_manager import DataManager
+from .data_storage import DataStorage
+from .tables import COLUMN_TYPECODES, ID_TYPECODE
+
+def serve_shard(connection, cuisine_ids, names, columns, global_rank_positions):
+    '''
+    Worker process loop, builds one shard and answers the coordinator's queries until it sends None.
+    Matches are sent back as their positions in the ranking of the whole dataset, ascending, so the
+    coordinator merges plain ints and maps them to ids once. Facets are sent back as the shard's value counts.
+    args:
+        connection: multiprocessing Connection, to the coordinator
+        cuisine_ids: dict, cuisine id to cuisine name
+        names: list[str], names of the shard's restaurants
+        columns: dict, restaurant_details key to the shard's values
+        global_rank_positions: bytes, packed ID_TYPECODE array, shard restaurant id to its position in the whole ranking
+    '''
+    data_storage = DataStorage()
+    data_storage.ingest_rows(cuisine_ids, names, columns)
+    data_manager = DataManager(data_storage=data_storage)
+    rank_positions = array(ID_TYPECODE, global_rank_positions)
+    # the shard's ranking keeps the order of the whole ranking, so these are ascending
+    ranked_positions = array(ID_TYPECODE, [rank_positions[id] for id in data_storage.ranked_ids])
+    connection.send((None, None))
+
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        operation, params, limit, start_position = request
+        try:
+            if operation == "facets":
+                connection.send((None, data_manager.return_facet_value_counts(params)))
+                continue
+            if limit is None:
+                restaurant_ids = data_manager.return_filtered_results(params)
+            else:
+                local_start = bisect_left(ranked_positions, start_position)
+                restaurant_ids, _ = data_manager.return_top_results(params, limit, local_start)
+            positions = array(ID_TYPECODE, [rank_positions[id] for id in restaurant_ids])
+            connection.send((None, positions.tobytes()))
+        except Exception as error:
+            connection.send((repr(error), None))
+
+def stop_shard_workers(connections, processes):
+    '''
+    Asks every worker to exit, kills the ones that do not
+    '''
+    for connection in connections:
+        try:
+            connection.send(None)
+        except (OSError, ValueError):
+            pass
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+
+class ShardedDataManager(DataManager):
+
+    # the shards are built once at load time, writes need a reload
+    supports_writes = False
+
+    def __init__(self, cuisine_csv_path=None, restaurant_csv_path=None, snapshot_path=None, shard_count=None):
+        '''
+        The whole dataset is also ingested here, it ranks the merged matches, encodes responses and explains queries
+        args:
+            shard_count: optional int, worker processes, one per core by default
+        '''
+        super().__init__(cuisine_csv_path, restaurant_csv_path, snapshot_path)
+
+        storage = self.data_storage
+        self.shard_count = max(1, min(shard_count or os.cpu_count() or 1, storage.restaurant_count))
+        # shard n holds the restaurant ids shard_starts[n] to shard_starts[n + 1]
+        self.shard_starts = [storage.restaurant_count * shard // self.shard_count for shard in range(self.shard_count + 1)]
+        # a shard answers one query at a time, concurrent requests take turns
+        self.shard_lock = threading.Lock()
+        self.connections = []
+        processes = []
+
+        # spawned rather than forked, forking a threaded server process can deadlock the child
+        context = multiprocessing.get_context("spawn")
+        rank_positions = array(ID_TYPECODE, storage.rank_positions)
+        for start, end in zip(self.shard_starts, self.shard_starts[1:]):
+            # copied into plain arrays and lists, columns of a mapped snapshot can not be sent to a process
+            columns = {key: array(COLUMN_TYPECODES[key], column[start:end])
+                       for key, column in storage.return_columns().items()}
+            names = [storage.names[restaurant_id] for restaurant_id in range(start, end)]
+            coordinator_connection, worker_connection = context.Pipe()
+            process = context.Process(target=serve_shard, daemon=True,
+                                      args=(worker_connection, storage.cuisine_ids, names,
+                                            columns, rank_positions[start:end].tobytes()))
+            process.start()
+            worker_connection.close()
+            self.connections.append(coordinator_connection)
+            processes.append(process)
+        # stops the workers once the manager is garbage collected, ie: after a reload once no request holds it
+        self.stop_workers = weakref.finalize(self, stop_shard_workers, self.connections, processes)
+
+        # shards build in parallel, wait for all of them so no query pays for it
+        for shard, (connection, process) in enumerate(zip(self.connections, processes)):
+            try:
+                # a worker that dies before reading its end of the pipe would leave recv waiting forever
+                while not connection.poll(0.1):
+                    if not process.is_alive():
+                        raise EOFError
+                connection.recv()
+            except EOFError:
+                self.stop_workers()
+                process.join()
+                raise RuntimeError(f'Shard {shard} worker exited with code {process.exitcode} while loading')
+
+    def return_shard_answers(self, operation, params, limit=None, start_position=0):
+        '''
+        Sends a query to every shard and gathers their answers
+        args:
+            operation: str, "positions" for the matches, "facets" for the value counts
+            params: dict, hashed version of request args
+            limit: optional int, most matches per shard, every match if None
+            start_position: optional int, position in the whole ranking to start from, only with a limit
+        return:
+            list, the answer of every shard
+        raises:
+            RuntimeError, if a shard failed to answer or its worker exited
+        '''
+        with self.shard_lock:
+            try:
+                for connection in self.connections:
+                    connection.send((operation, params, limit, start_position))
+                answers = [connection.recv() for connection in self.connections]
+            except (EOFError, OSError) as error:
+                raise RuntimeError('A shard worker exited, reload the dataset to restart the shards') from error
+
+        for error, _ in answers:
+            if error is not None:
+                raise RuntimeError(f'A shard failed to answer {params}: {error}')
+
+        return [answer for _, answer in answers]
+
+    def return_shard_positions(self, params, limit=None, start_position=0):
+        '''
+        args:
+            params: dict, hashed version of request args
+            limit: optional int, most matches per shard, every match if None
+            start_position: optional int, position in the whole ranking to start from, only with a limit
+        return:
+            list[array], per shard, the ranking positions of its matches in ascending order
+        '''
+        return [array(ID_TYPECODE, packed_positions)
+                for packed_positions in self.return_shard_answers("positions", params, limit, start_position)]
+
+    def return_facet_value_counts(self, params, version=None):
+        '''
+        Adds up the value counts of every shard
+        args:
+            params: dict, hashed version of request args
+            version: optional int, unused, this engine can not be written to
+        return:
+            list[Counter], cuisine id, rating, distance and price counts
+        '''
+        if "lat" in params:
+            return super().return_facet_value_counts(params, version)
+
+        facet_counts = [Counter(), Counter(), Counter(), Counter()]
+        for shard_facet_counts in self.return_shard_answers("facets", params):
+            for counts, shard_counts in zip(facet_counts, shard_facet_counts):
+                counts.update(shard_counts)
+
+        return facet_counts
+
+    def return_merged_positions(self, shard_positions):
+        '''
+        return:
+            list[int], the ranking positions of every shard in ascending order
+        '''
+        non_empty_positions = [positions for positions in shard_positions if positions]
+        if len(non_empty_positions) == 1:
+            return non_empty_positions[0].tolist()
+        # every shard's positions are an ascending run, sorting them is a merge
+        return sorted(chain.from_iterable(non_empty_positions))
+
+    def return_filtered_results(self, params, memo=None, version=None, trace=None, stage_timer=None):
+        '''
+        Provides logical filtering and sorting based on provided parameters, filtered by every shard at once
+        args:
+            params: dict, hashed version of request args
+            memo: optional dict, unused, the shards do not share intermediate results
+            version: optional int, unused, this engine can not be written to
+            trace: optional list, gets the number of restaurants left after every step, see explain_query
+            stage_timer: optional StageTimer, marks the end of the filter and order stages, see match_service.metrics
+        returns:
+            list[int], an ordered array of restaurant ids
+        '''
+        if trace is not None or "lat" in params or "sort" in params:
+            # explained on the whole dataset held here, with the plan a shard would follow.
+            # Located queries only read a few grid cells, they are answered here rather than fanned out.
+            # The shards send positions in the default ranking, other sort priorities are ranked here
+            return super().return_filtered_results(params, memo, version, trace, stage_timer)
+
+        shard_positions = self.return_shard_positions(params)
+        if stage_timer is not None:
+            stage_timer.mark("filter")
+        restaurant_ids = list(map(self.data_storage.ranked_ids.__getitem__, self.return_merged_positions(shard_positions)))
+        if stage_timer is not None:
+            stage_timer.mark("order")
+
+        return restaurant_ids
+
+    def return_top_results(self, params, limit, start_position=0):
+        '''
+        Keeps the best limit matches of the top limit matches of every shard
+        args:
+            params: dict, hashed version of request args
+            limit: int, maximum number of restaurant ids to return
+            start_position: optional int, position in the ranking to resume from
+        returns:
+            list[int], ordered array of at most limit restaurant ids
+            int, position to resume from for the next page, None if there are no more results
+        '''
+        if "lat" in params or "sort" in params:
+            return super().return_top_results(params, limit, start_position)
+
+        positions = self.return_merged_positions(self.return_shard_positions(params, limit, start_position))[:limit]
+        ranked_ids = self.data_storage.ranked_ids
+        restaurant_ids = [ranked_ids[position] for position in positions]
+        if len(restaurant_ids) == limit and positions[-1] + 1 < len(ranked_ids):
+            return restaurant_ids, positions[-1] + 1
+
+        return restaurant_ids, None
@@ -0,0 +1,291 @@
+'''
+Compiles the csv data into a versioned binary snapshot that DataStorage can memory map instead of parsing.
+
+Layout: MAGIC, format version and header length (HEADER_STRUCT), a json header, then 8 byte aligned
+sections of packed arrays. The header records where every section starts and how the indexes are laid
+out inside them, so loading only decodes the header and slices views over the mapped file.
+
+Compile from the repository root:
+    python -m restaurant_matcher.data_management.snapshot fixtures/cuisines.csv fixtures/restaurants.csv data.snapshot
+'''
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from .geo import MISSING_COORDINATE, GeoGrid
+from .tables import COLUMN_TYPECODES, GEO_TYPECODE, ID_TYPECODE, OFFSET_TYPECODE, NameTable
+
+MAGIC = b'RMSNAP\x00\x00'
+FORMAT_VERSION = 2
+HEADER_STRUCT = struct.Struct('<8sII') # magic, format version, header length
+SECTION_ALIGNMENT = 8
+
+# storage attribute to the key of its posting lists in the snapshot
+POSTING_INDEXES = {
+    "cuisines": "cuisines",
+    "ratings": "ratings",
+    "distances": "distances",
+    "prices": "prices",
+    "name_trigrams": "name_trigrams",
+}
+# storage attribute to the key of its bitmaps in the snapshot
+BITMAP_INDEXES = {
+    "cuisine_bitmaps": "cuisines",
+    "rating_bitmaps": "ratings",
+    "distance_bitmaps": "distances",
+    "price_bitmaps": "prices",
+}
+class SnapshotWriter:
+    '''
+    Accumulates aligned sections and writes them out behind the header
+    '''
+
+    def __init__(self):
+        self.chunks = []
+        self.sections = {} # section name to [offset, byte length, typecode]
+        self.size = 0
+
+    def add_section(self, name, data, typecode='B'):
+        '''
+        args:
+            name: str, unique section name
+            data: bytes-like, packed section content
+            typecode: optional str, array typecode the section is read back as
+        '''
+        data = bytes(data)
+        self.sections[name] = [self.size, len(data), typecode]
+        self.chunks.append(data)
+        self.size += len(data)
+
+        padding = -self.size % SECTION_ALIGNMENT
+        self.chunks.append(b'\x00' * padding)
+        self.size += padding
+
+    def add_postings(self, name, index):
+        '''
+        Packs every posting list of an index into one section
+        args:
+            name: str, section name
+            index: dict, value to restaurant ids
+        return:
+            list, [value, start, count] inside the section for every value
+        '''
+        packed = array(ID_TYPECODE)
+        layout = []
+        for value, restaurant_ids in index.items():
+            layout.append([value, len(packed), len(restaurant_ids)])
+            packed.extend(restaurant_ids)
+
+        self.add_section(name, packed.tobytes(), ID_TYPECODE)
+        return layout
+
+    def add_names(self, name, names, restaurant_count):
+        '''
+        Packs restaurant names into an offsets section and a utf-8 section
+        '''
+        offsets = array(OFFSET_TYPECODE, [0])
+        blob = bytearray()
+        for restaurant_id in range(restaurant_count):
+            blob.extend(names[restaurant_id].encode('utf-8'))
+            offsets.append(len(blob))
+
+        self.add_section(f'{name}.offsets', offsets.tobytes(), OFFSET_TYPECODE)
+        self.add_section(f'{name}.blob', blob)
+
+    def write(self, path, header):
+        '''
+        Writes the snapshot next to path and renames it into place, so processes that
+        still map a previous snapshot at path keep reading their own unchanged copy
+        '''
+        header = dict(header, sections=self.sections)
+        header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        prefix_length = HEADER_STRUCT.size + len(header_bytes)
+        padding = -prefix_length % SECTION_ALIGNMENT
+
+        directory = os.path.dirname(os.path.abspath(path))
+        file_descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as write_obj:
+                write_obj.write(HEADER_STRUCT.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+                write_obj.write(header_bytes)
+                write_obj.write(b'\x00' * padding)
+                for chunk in self.chunks:
+                    write_obj.write(chunk)
+            # mkstemp creates the file owner-only, snapshots are read by the service user
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+def write_snapshot(data_storage, path):
+    '''
+    Writes an ingested DataStorage out as a binary snapshot
+    args:
+        data_storage: DataStorage, ingested storage
+        path: str, file path of the snapshot
+    '''
+    restaurant_count = data_storage.restaurant_count
+    writer = SnapshotWriter()
+
+    for key, column in data_storage.return_columns().items():
+        writer.add_section(f'column.{key}', column, COLUMN_TYPECODES[key])
+    for key, column in data_storage.return_geo_columns().items():
+        writer.add_section(f'column.{key}', column, GEO_TYPECODE)
+
+    writer.add_names('names', data_storage.names, restaurant_count)
+    writer.add_names('normalized_names', data_storage.normalized_names, restaurant_count)
+    writer.add_section('ranked_ids', array(ID_TYPECODE, data_storage.ranked_ids).tobytes(), ID_TYPECODE)
+    writer.add_section('rank_positions', array(ID_TYPECODE, data_storage.rank_positions).tobytes(), ID_TYPECODE)
+
+    postings = {}
+    for attribute, key in POSTING_INDEXES.items():
+        postings[key] = writer.add_postings(f'postings.{key}', getattr(data_storage, attribute))
+
+    # the grid is stored like the postings above, with the (row, column) of every cell in its own section
+    geo_grid = data_storage.geo_grid
+    geo_cells = array(GEO_TYPECODE)
+    for (row, column), start, count in writer.add_postings('geo_grid.ids', geo_grid.cells):
+        geo_cells.extend((row, column, start, count))
+    writer.add_section('geo_grid.cells', geo_cells.tobytes(), GEO_TYPECODE)
+
+    bitmap_length = (restaurant_count + 7) // 8
+    bitmaps = {}
+    for attribute, key in BITMAP_INDEXES.items():
+        index_bitmaps = getattr(data_storage, attribute)
+        bitmaps[key] = list(index_bitmaps)
+        packed = b''.join(bitmap.to_bytes(bitmap_length, 'little') for bitmap in index_bitmaps.values())
+        writer.add_section(f'bitmaps.{key}', packed)
+
+    writer.write(path, {
+        "byteorder": sys.byteorder,
+        "restaurant_count": restaurant_count,
+        "cuisine_ids": list(data_storage.cuisine_ids.items()),
+        "postings": postings,
+        "bitmaps": bitmaps,
+        "geo_cell_degrees": geo_grid.cell_degrees,
+    })
+
+def read_snapshot(path):
+    '''
+    Memory maps a snapshot and returns views over its sections, nothing is parsed per restaurant
+    args:
+        path: str, file path of the snapshot
+    return:
+        dict, DataStorage attribute names to their loaded values
+    raises:
+        ValueError, if the file is not a snapshot this version can read
+    '''
+    with open(path, 'rb') as read_obj:
+        snapshot_mmap = mmap.mmap(read_obj.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(snapshot_mmap)
+    if len(view) < HEADER_STRUCT.size:
+        raise ValueError(f'{path} is not a restaurant snapshot')
+
+    magic, format_version, header_length = HEADER_STRUCT.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a restaurant snapshot')
+    if format_version != FORMAT_VERSION:
+        raise ValueError(f'{path} is snapshot format {format_version}, expected {FORMAT_VERSION}, recompile it')
+
+    header = json.loads(str(view[HEADER_STRUCT.size:HEADER_STRUCT.size + header_length], 'utf-8'))
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError(f'{path} was compiled on a {header["byteorder"]} endian machine, recompile it')
+
+    prefix_length = HEADER_STRUCT.size + header_length
+    data_start = prefix_length + (-prefix_length % SECTION_ALIGNMENT)
+
+    def section(name):
+        offset, length, typecode = header["sections"][name]
+        return view[data_start + offset:data_start + offset + length].cast(typecode)
+
+    restaurant_count = header["restaurant_count"]
+    loaded = {
+        "snapshot_mmap": snapshot_mmap,
+        "restaurant_count": restaurant_count,
+        "cuisine_ids": dict(header["cuisine_ids"]),
+        "cuisine_column": section('column.cuisine_id'),
+        "rating_column": section('column.rating'),
+        "distance_column": section('column.distance'),
+        "price_column": section('column.price'),
+        "names": NameTable(section('names.offsets'), section('names.blob')),
+        "normalized_names": NameTable(section('normalized_names.offsets'), section('normalized_names.blob')),
+        "ranked_ids": section('ranked_ids'),
+        "rank_positions": section('rank_positions'),
+        "all_restaurants_bitmap": (1 << restaurant_count) - 1,
+    }
+
+    # snapshots compiled before restaurants had coordinates have no located restaurants
+    for key in ("latitude", "longitude"):
+        if f'column.{key}' in header["sections"]:
+            loaded[f'{key}_column'] = section(f'column.{key}')
+        else:
+            loaded[f'{key}_column'] = array(GEO_TYPECODE, [MISSING_COORDINATE]) * restaurant_count
+
+    for attribute, key in POSTING_INDEXES.items():
+        packed = section(f'postings.{key}')
+        loaded[attribute] = {value: packed[start:start + count] for value, start, count in header["postings"][key]}
+
+    # snapshots compiled before the grid was stored leave it to DataStorage.load_snapshot to build
+    if 'geo_grid.cells' in header["sections"]:
+        packed = section('geo_grid.ids')
+        geo_cells = section('geo_grid.cells')
+        loaded["geo_grid"] = GeoGrid(header["geo_cell_degrees"])
+        loaded["geo_grid"].load_cells({
+            (geo_cells[index], geo_cells[index + 1]): packed[geo_cells[index + 2]:geo_cells[index + 2] + geo_cells[index + 3]]
+            for index in range(0, len(geo_cells), 4)
+        })
+
+    bitmap_length = (restaurant_count + 7) // 8
+    for attribute, key in BITMAP_INDEXES.items():
+        packed = section(f'bitmaps.{key}')
+        loaded[attribute] = {value: int.from_bytes(packed[index * bitmap_length:(index + 1) * bitmap_length], 'little')
+                             for index, value in enumerate(header["bitmaps"][key])}
+
+    return loaded
+
+def print_progress(ingest_progress):
+    '''
+    Prints how far a csv ingest is, on one line that is rewritten after every chunk
+    args:
+        ingest_progress: IngestProgress
+    '''
+    percent = 100 * ingest_progress.bytes_read // max(ingest_progress.total_bytes, 1)
+    print(f'\r{percent}% {ingest_progress.rows_accepted} restaurants, {ingest_progress.rows_rejected} rejected',
+          end='', file=sys.stderr, flush=True)
+
+def main(argv=None):
+    '''
+    Command line entry point, compiles csv files into a snapshot
+    '''
+    from .csv_ingest import DEFAULT_CHUNK_SIZE
+    from .data_storage import DataStorage
+
+    parser = argparse.ArgumentParser(description='Compiles the restaurant csv files into a binary snapshot')
+    parser.add_argument('cuisine_csv_path')
+    parser.add_argument('restaurant_csv_path')
+    parser.add_argument('snapshot_path')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='restaurant rows parsed at once')
+    parser.add_argument('--quiet', action='store_true', help='do not report progress')
+    args = parser.parse_args(argv)
+
+    data_storage = DataStorage()
+    progress_callback = None if args.quiet else print_progress
+    data_storage.ingest(args.cuisine_csv_path, args.restaurant_csv_path, args.chunk_size, progress_callback)
+    if not args.quiet:
+        print(file=sys.stderr)
+    for rejected_row in data_storage.rejected_rows:
+        print(f'rejected line {rejected_row.line_number}: {rejected_row.reason}', file=sys.stderr)
+
+    write_snapshot(data_storage, args.snapshot_path)
+    print(f'Wrote {data_storage.restaurant_count} restaurants to {args.snapshot_path}, '
+          f'rejected {data_storage.ingest_progress.rows_rejected} rows')
+
+if __name__ == '__main__':
+    main()
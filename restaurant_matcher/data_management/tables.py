@@ -0,0 +1,66 @@
+'''
+Compact typed storage shared by DataStorage and the snapshot files, plus read-only views over it
+'''
+from collections.abc import Mapping
+
+# restaurant_details key to the array typecode of its column
+COLUMN_TYPECODES = {
+    "cuisine_id": "h",
+    "rating": "b",
+    "distance": "h",
+    "price": "h",
+}
+ID_TYPECODE = "i" # restaurant ids in posting lists and rankings
+GEO_TYPECODE = "i" # latitude and longitude columns, in microdegrees
+OFFSET_TYPECODE = "I" # byte offsets into packed names
+
+class NameTable(Mapping):
+    '''
+    Read-only restaurant id to name mapping over packed utf-8 names
+    '''
+
+    def __init__(self, offsets, blob):
+        '''
+        args:
+            offsets: memoryview[int], name n spans blob[offsets[n]:offsets[n+1]]
+            blob: memoryview[bytes], every name encoded back to back
+        '''
+        self.offsets = offsets
+        self.blob = blob
+
+    def __getitem__(self, restaurant_id):
+        if not isinstance(restaurant_id, int) or not 0 <= restaurant_id < len(self):
+            raise KeyError(restaurant_id)
+
+        return str(self.blob[self.offsets[restaurant_id]:self.offsets[restaurant_id + 1]], 'utf-8')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+class DetailsTable(Mapping):
+    '''
+    Read-only restaurant id to restaurant details mapping over typed columns,
+    the details have the same string values as the restaurants csv
+    '''
+
+    def __init__(self, columns):
+        '''
+        args:
+            columns: dict, restaurant_details key to its column, see COLUMN_TYPECODES
+        '''
+        self.columns = columns
+
+    def __getitem__(self, restaurant_id):
+        if not isinstance(restaurant_id, int) or not 0 <= restaurant_id < len(self):
+            raise KeyError(restaurant_id)
+
+        return {key: str(column[restaurant_id]) for key, column in self.columns.items()}
+
+    def __len__(self):
+        return len(self.columns["rating"])
+
+    def __iter__(self):
+        return iter(range(len(self)))
@@ -0,0 +1,27 @@
+'''
+Helpers for the restaurant name trigram index
+'''
+
+TRIGRAM_LENGTH = 3
+
+def normalize_name(name):
+    '''
+    Normalizes a name so stored names and queries compare case insensitively
+    args:
+        name: str, restaurant name or name query
+    return:
+        str, normalized name
+    '''
+    return name.lower()
+
+def return_trigrams(normalized_name):
+    '''
+    Returns every distinct run of three characters in a normalized name
+    ie: "chow" -> {"cho", "how"}
+    args:
+        normalized_name: str, output of normalize_name
+    return:
+        set[str], trigrams, empty if the name is shorter than a trigram
+    '''
+    return {normalized_name[index:index + TRIGRAM_LENGTH]
+            for index in range(len(normalized_name) - TRIGRAM_LENGTH + 1)}
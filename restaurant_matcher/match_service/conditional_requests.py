@@ -0,0 +1,40 @@
+'''
+HTTP validators for search responses. A response only changes with the dataset snapshot or the query,
+so its ETag is derived from those and a client or proxy revalidating it is answered before any filtering.
+'''
+import hashlib
+from email.utils import formatdate
+
+from .query_cache import QueryCache
+
+# seconds a client or proxy may reuse a response before revalidating it, a write or reload only shows up after this
+DEFAULT_MAX_AGE = 5
+
+def make_etag(snapshot, loaded_params):
+    '''
+    Derives the entity tag of a search response, the same for equivalent queries against the same snapshot
+    ie: ?cuisine=Thai&rating=3 and ?rating=3&cuisine=thai share a tag until the next write or reload
+    args:
+        snapshot: DatasetSnapshot, snapshot the request is pinned to
+        loaded_params: dict, params as loaded by MatchServiceSchema
+    return:
+        str, strong entity tag without its quotes
+    '''
+    # loaded_at tells apart the versions of separate loads, a restarted process counts versions from 1 again
+    identity = repr((snapshot.version, snapshot.loaded_at, QueryCache.make_key(loaded_params)))
+    return hashlib.sha256(identity.encode()).hexdigest()[:32]
+
+def return_cache_headers(snapshot, etag, max_age=DEFAULT_MAX_AGE):
+    '''
+    args:
+        snapshot: DatasetSnapshot, snapshot the response was computed from
+        etag: str, entity tag made by make_etag
+        max_age: optional int, seconds the response may be reused without revalidating
+    return:
+        dict, ETag, Cache-Control and Last-Modified response headers
+    '''
+    return {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={max_age}",
+        "Last-Modified": formatdate(snapshot.modified_at, usegmt=True),
+    }
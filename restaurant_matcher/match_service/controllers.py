@@ -1,35 +1,503 @@
 '''
 Holds the main data logic for the match restaurant match api.
 '''
+import json
+from collections import namedtuple
 
+from flask import Response
 from flask_restful import Resource, request
-from .validators import MatchServiceSchema
-from restaurant_matcher.data_management.data_manager import DataManager
+from marshmallow import ValidationError
+from .conditional_requests import DEFAULT_MAX_AGE, make_etag, return_cache_headers
+from .metrics import StageTimer
+from .pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+from restaurant_matcher.data_management.data_storage import SharedRestaurantName
+from restaurant_matcher.data_management.dataset_holder import WritesNotSupported
+from restaurant_matcher.data_management.fragments import RESTAURANT_FIELDS
+from restaurant_matcher.data_management.geo import parse_coordinate
+from .validators import MatchServiceSchema, RestaurantSchema
 
-class Skeleton(Resource):
-    def __init__(self):
+# request args that control paging rather than filtering
+PAGINATION_PARAMS = ("limit", "cursor")
+# request args that shape the response rather than filtering
+RESPONSE_PARAMS = ("explain", "facets", "fields")
+# request args that pick the dataset rather than filtering
+DATASET_PARAMS = ("region",)
+# most queries a single batch request may hold
+MAX_BATCH_QUERIES = 100
+
+# restaurant_ids: list[int], ordered ids of the returned restaurants
+# next_position: int, ranking position the next page starts at, None if there is no next page
+# restaurants_data: bytes, json array of the restaurants, None if it was not kept in the cache
+QueryResult = namedtuple('QueryResult', ['restaurant_ids', 'next_position', 'restaurants_data'])
+
+class QueryResource(Resource):
+    '''
+    Shared plumbing of the resources that answer match queries
+    '''
+    def __init__(self, dataset_registry, query_cache=None, metrics=None):
         self.schema = MatchServiceSchema()
-        self.data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+        self.dataset_registry = dataset_registry
+        self.query_cache = query_cache
+        self.metrics = metrics
 
-    def get(self):
-        errors = self.schema.validate(request.args)
+    def record_request(self, endpoint, stage_timer, outcome, result_size=None, params=None):
+        '''
+        Reports a finished request to the metrics, a no-op if metrics are disabled
+        '''
+        if self.metrics is not None:
+            self.metrics.record_request(endpoint, stage_timer, outcome, result_size, params)
 
-        if errors:
-            return errors
+    def return_cached_result(self, snapshot, loaded_params):
+        '''
+        Looks a query up in the cache
+        args:
+            snapshot: DatasetSnapshot, snapshot the request is pinned to
+            loaded_params: dict, validated request params
+        return:
+            tuple, (cache key, None if caching is disabled) and (QueryResult, None on a miss)
+        '''
+        if self.query_cache is None:
+            return None, None
 
-        request_params = request.args.to_dict()
-        matching_restaurants = self.return_relevant_restaurants(request_params)
+        cache_key = self.query_cache.make_key(loaded_params)
+        return cache_key, self.query_cache.get(snapshot.version, cache_key, return_region(loaded_params))
 
-        return matching_restaurants
+    def cache_result(self, snapshot, cache_key, query_result, region=None):
+        '''
+        Stores a freshly computed query result, a no-op if caching is disabled
+        '''
+        if cache_key is not None:
+            cached_data = query_result.restaurants_data if self.query_cache.store_payloads else None
+            self.query_cache.put(snapshot.version, cache_key, query_result._replace(restaurants_data=cached_data), region)
 
-    def return_relevant_restaurants(self, supplied_filters):
+    def return_restaurants_data(self, data_manager, query_result, response_fields, location=None):
+        '''
+        Returns the response payload of a query result, rebuilding it if the cache only kept the ids
+        '''
+        if query_result.restaurants_data is None:
+            return data_manager.return_restaurant_json(query_result.restaurant_ids, response_fields, location)
+
+        return query_result.restaurants_data
+
+    def return_restaurant_page(self, data_manager, supplied_filters, pagination, response_fields, stage_timer,
+                               location=None):
+        '''
+        Returns only the requested page of relevant restaurants
+        args:
+            data_manager: DataManager, snapshot to query against
+            supplied_filters: dict, key val of api request params
+            pagination: dict, the limit and/or cursor request params
+            response_fields: tuple, restaurant fields to return, all of them if None
+            stage_timer: StageTimer, times the filter and serialize stages
+            location: optional tuple, latitude and longitude of a located query, see return_location
+        return:
+            QueryResult, the page and where the next one starts
+        '''
+        limit = int(pagination.get("limit", DEFAULT_PAGE_SIZE))
+        start_position = decode_cursor(pagination["cursor"]) if "cursor" in pagination else 0
+
+        # the ranking is walked in order, a page has no separate order stage
+        restaurant_ids, next_position = data_manager.return_top_results(supplied_filters, limit, start_position)
+        stage_timer.mark("filter")
+        restaurants_data = data_manager.return_restaurant_json(restaurant_ids, response_fields, location)
+        stage_timer.mark("serialize")
+
+        return QueryResult(restaurant_ids, next_position, restaurants_data)
+
+    def return_relevant_restaurants(self, data_manager, supplied_filters, response_fields, stage_timer, location=None):
         '''
         Takes the given filter keys & values and applies them to return
         a list of relevant restaurants
         args:
+            data_manager: DataManager, snapshot to query against
             supplied_filters: dict, key val of api request params
+            response_fields: tuple, restaurant fields to return, all of them if None
+            stage_timer: StageTimer, times the filter, order and serialize stages
+            location: optional tuple, latitude and longitude of a located query, see return_location
+        return:
+            QueryResult, every relevant restaurant
+        '''
+        relevant_restaurants_ids = data_manager.return_filtered_results(supplied_filters, stage_timer=stage_timer)
+        # the engine marks the filter and order stages, this only catches an early return with no results
+        stage_timer.mark("filter")
+        restaurants_data = data_manager.return_restaurant_json(relevant_restaurants_ids, response_fields, location)
+        stage_timer.mark("serialize")
+
+        return QueryResult(relevant_restaurants_ids, None, restaurants_data)
+
+def split_pagination(request_params):
+    '''
+    Separates the paging params from the filters, response params are neither
+    args:
+        request_params: dict, request params as strings
+    return:
+        tuple, filter params and pagination params
+    '''
+    filters = {key: value for key, value in request_params.items()
+               if key not in PAGINATION_PARAMS and key not in RESPONSE_PARAMS and key not in DATASET_PARAMS}
+    pagination = {key: value for key, value in request_params.items() if key in PAGINATION_PARAMS}
+
+    return filters, pagination
+
+def return_region(params):
+    '''
+    args:
+        params: dict, request params
+    return:
+        str, lowercased region of the request, None for the default dataset
+    '''
+    return params["region"].lower() if params.get("region") is not None else None
+
+def return_unknown_region_response(region):
+    '''
+    return:
+        tuple, error message and 404 status
+    '''
+    return {"message": f"Unknown region '{region}'"}, 404
+
+def return_unavailable_region_response(error):
+    '''
+    args:
+        error: RuntimeError, raised by the DatasetRegistry when a region's files could not be loaded
+    return:
+        tuple, error message and 503 status
+    '''
+    return {"message": str(error)}, 503
+
+def return_read_only_response():
+    '''
+    return:
+        tuple, error message and 405 status, for a write or reload sent to an app built read only
+    '''
+    return {"message": "Writes and reloads are disabled on this server, update the source files instead"}, 405
+
+def return_response_fields(loaded_params):
+    '''
+    args:
+        loaded_params: dict, validated request params
+    return:
+        tuple, the RESTAURANT_FIELDS of a fields projection in their usual order, None to return every field
+    '''
+    if "response_fields" not in loaded_params:
+        return None
+
+    requested_fields = loaded_params["response_fields"].split(",")
+    return tuple(field for field in RESTAURANT_FIELDS if field in requested_fields)
+
+def return_location(loaded_params):
+    '''
+    args:
+        loaded_params: dict, validated request params
+    return:
+        tuple, latitude and longitude in degrees of a located query, whose restaurants are sent with the distance
+            computed from it, None if the query is not located
+    '''
+    if "lat" not in loaded_params:
+        return None
+
+    return loaded_params["lat"], loaded_params["lng"]
+
+def return_json_response(body, headers=None):
+    '''
+    Sends an already encoded json body as is, skipping flask_restful's serialization
+    args:
+        body: bytes, json document
+        headers: optional dict, extra response headers
+    return:
+        Response
+    '''
+    return Response(body + b'\n', mimetype='application/json', headers=headers)
+
+class Skeleton(QueryResource):
+    def __init__(self, dataset_registry, query_cache=None, metrics=None, max_age=DEFAULT_MAX_AGE):
+        '''
+        args:
+            max_age: optional int, seconds a client or proxy may reuse a response before revalidating it
+        '''
+        super().__init__(dataset_registry, query_cache, metrics)
+        self.max_age = max_age
+
+    def get(self):
+        stage_timer = StageTimer()
+        try:
+            loaded_params = self.schema.load(request.args)
+        except ValidationError as error:
+            self.record_request("search", stage_timer, "invalid", params=request.args.to_dict())
+            return error.messages
+        stage_timer.mark("validate")
+
+        # pin the snapshot for the whole request, a reload only affects later requests
+        region = return_region(loaded_params)
+        try:
+            snapshot = self.dataset_registry.current(region)
+        except KeyError:
+            self.record_request("search", stage_timer, "unknown_region", params=request.args.to_dict())
+            return return_unknown_region_response(region)
+        except RuntimeError as error:
+            self.record_request("search", stage_timer, "unavailable_region", params=request.args.to_dict())
+            return return_unavailable_region_response(error)
+        data_manager = snapshot.data_manager
+        request_params, pagination = split_pagination(request.args.to_dict())
+        # a client already holding the response of this query against this snapshot gets no body
+        etag = make_etag(snapshot, loaded_params)
+        cache_headers = return_cache_headers(snapshot, etag, self.max_age)
+        if request.if_none_match.contains_weak(etag):
+            self.record_request("search", stage_timer, "not_modified", params=request_params)
+            return Response(status=304, headers=cache_headers)
+
+        if loaded_params.get("explain"):
+            # the plan of the whole query, bypassing the cache and pagination
+            explanation = data_manager.explain_query(request_params)
+            self.record_request("search", stage_timer, "explain", params=request_params)
+            return explanation, 200, cache_headers
+        if loaded_params.get("facets"):
+            # counts over every match of the query, bypassing the cache and pagination, no restaurant is serialized
+            facets = data_manager.return_facet_counts(request_params)
+            stage_timer.mark("filter")
+            restaurant_count = sum(facets["ratings"].values())
+            self.record_request("search", stage_timer, "facets", restaurant_count, request_params)
+            return {"restaurant_count": restaurant_count, "facets": facets}, 200, cache_headers
+
+        response_fields = return_response_fields(loaded_params)
+        location = return_location(loaded_params)
+
+        cache_key, query_result = self.return_cached_result(snapshot, loaded_params)
+        stage_timer.mark("cache")
+        if query_result is None:
+            if pagination:
+                query_result = self.return_restaurant_page(data_manager, request_params, pagination, response_fields,
+                                                           stage_timer, location)
+            else:
+                query_result = self.return_relevant_restaurants(data_manager, request_params, response_fields,
+                                                                stage_timer, location)
+            self.cache_result(snapshot, cache_key, query_result, region)
+
+        headers = dict(cache_headers)
+        if pagination and query_result.next_position is not None:
+            headers["X-Next-Cursor"] = encode_cursor(query_result.next_position)
+
+        restaurants_data = self.return_restaurants_data(data_manager, query_result, response_fields, location)
+        stage_timer.mark("serialize")
+        self.record_request("search", stage_timer, "ok", len(query_result.restaurant_ids), request.args.to_dict())
+
+        return return_json_response(restaurants_data, headers)
+
+class Batch(QueryResource):
+    def __init__(self, dataset_registry, query_cache=None, metrics=None):
+        super().__init__(dataset_registry, query_cache, metrics)
+        self.batch_schema = MatchServiceSchema(many=True)
+
+    def post(self):
+        '''
+        Answers a json list of queries, each taking the same params as a search, in one request.
+        Every query reads the same snapshot and queries share intermediate results, so they are all for one region.
+        '''
+        stage_timer = StageTimer()
+        batch = request.get_json(silent=True)
+        if not isinstance(batch, list) or not 1 <= len(batch) <= MAX_BATCH_QUERIES:
+            self.record_request("batch", stage_timer, "invalid")
+            return {"message": f"Expected a json list of 1 to {MAX_BATCH_QUERIES} queries"}, 400
+        try:
+            loaded_batch = self.batch_schema.load(batch)
+        except ValidationError as error:
+            self.record_request("batch", stage_timer, "invalid", params=batch)
+            return error.messages, 400
+        # a batch answers restaurant lists only, an explain or facets query would silently get one too
+        if any(loaded_params.get("explain") or loaded_params.get("facets") for loaded_params in loaded_batch):
+            self.record_request("batch", stage_timer, "invalid", params=batch)
+            return {"message": "explain and facets are not supported in a batch, send them as a search"}, 400
+        regions = {return_region(loaded_params) for loaded_params in loaded_batch}
+        if len(regions) > 1:
+            self.record_request("batch", stage_timer, "invalid", params=batch)
+            return {"message": "Every query of a batch must be for the same region"}, 400
+        stage_timer.mark("validate")
+
+        region = regions.pop()
+        try:
+            snapshot = self.dataset_registry.current(region)
+        except KeyError:
+            self.record_request("batch", stage_timer, "unknown_region", params=batch)
+            return return_unknown_region_response(region)
+        except RuntimeError as error:
+            self.record_request("batch", stage_timer, "unavailable_region", params=batch)
+            return return_unavailable_region_response(error)
+        data_manager = snapshot.data_manager
+        query_results = [None] * len(batch)
+        paginations = []
+        all_response_fields = []
+        locations = []
+        uncached_queries = [] # (index, cache key, filters) of the unpaged queries to run together
+
+        for index, (params, loaded_params) in enumerate(zip(batch, loaded_batch)):
+            # the engines take params as strings, the way they arrive in a query string
+            request_params, pagination = split_pagination({key: str(value) for key, value in params.items()})
+            response_fields = return_response_fields(loaded_params)
+            paginations.append(pagination)
+            all_response_fields.append(response_fields)
+            locations.append(return_location(loaded_params))
+
+            cache_key, query_results[index] = self.return_cached_result(snapshot, loaded_params)
+            if query_results[index] is not None:
+                continue
+            if pagination:
+                query_results[index] = self.return_restaurant_page(data_manager, request_params, pagination, response_fields,
+                                                                   stage_timer, locations[index])
+                self.cache_result(snapshot, cache_key, query_results[index], region)
+            else:
+                uncached_queries.append((index, cache_key, request_params))
+
+        stage_timer.mark("cache")
+        # filtering and ordering are not told apart within a batch
+        batch_restaurant_ids = data_manager.return_batch_filtered_results([query[2] for query in uncached_queries])
+        stage_timer.mark("filter")
+        for (index, cache_key, _), restaurant_ids in zip(uncached_queries, batch_restaurant_ids):
+            restaurants_data = data_manager.return_restaurant_json(restaurant_ids, all_response_fields[index], locations[index])
+            query_results[index] = QueryResult(restaurant_ids, None, restaurants_data)
+            self.cache_result(snapshot, cache_key, query_results[index], region)
+
+        answers = []
+        for query_result, pagination, response_fields, location in zip(query_results, paginations, all_response_fields,
+                                                                        locations):
+            answer = b'{"restaurants": ' + self.return_restaurants_data(data_manager, query_result, response_fields,
+                                                                        location)
+            if pagination and query_result.next_position is not None:
+                answer += b', "next_cursor": ' + json.dumps(encode_cursor(query_result.next_position)).encode()
+            answers.append(answer + b'}')
+        stage_timer.mark("serialize")
+        result_size = sum(len(query_result.restaurant_ids) for query_result in query_results)
+        self.record_request("batch", stage_timer, "ok", result_size, batch)
+
+        return return_json_response(b'[' + b', '.join(answers) + b']')
+
+class Reload(Resource):
+    def __init__(self, dataset_registry, query_cache=None, metrics=None, read_only=False):
+        self.dataset_registry = dataset_registry
+        self.read_only = read_only
+
+    def post(self):
+        '''
+        Admin trigger to rebuild the dataset snapshot, of the region given in the url args, from its source files
+        '''
+        if self.read_only:
+            return return_read_only_response()
+        region = return_region(request.args)
+        try:
+            snapshot = self.dataset_registry.reload(region)
+        except KeyError:
+            return return_unknown_region_response(region)
+        except RuntimeError as error:
+            return return_unavailable_region_response(error)
+        response = {"version": snapshot.version}
+
+        # csv rows that could not be stored, not known for datasets loaded from a compiled snapshot
+        ingest_progress = snapshot.data_manager.data_storage.ingest_progress
+        if ingest_progress is not None:
+            response["rows_rejected"] = ingest_progress.rows_rejected
+
+        return response
+
+class CacheStats(Resource):
+    def __init__(self, dataset_registry, query_cache=None, metrics=None):
+        self.query_cache = query_cache
+
+    def get(self):
+        '''
+        Returns the query cache hit/miss/eviction counters
+        '''
+        if self.query_cache is None:
+            return {"enabled": False}
+
+        return dict(self.query_cache.stats(), enabled=True)
+
+class RegionStats(Resource):
+    def __init__(self, dataset_registry, query_cache=None, metrics=None):
+        self.dataset_registry = dataset_registry
+
+    def get(self):
+        '''
+        Returns the loaded regions and the load and eviction counters
+        '''
+        return self.dataset_registry.stats()
+
+class MetricsPage(Resource):
+    def __init__(self, dataset_registry, query_cache=None, metrics=None):
+        self.dataset_registry = dataset_registry
+        self.query_cache = query_cache
+        self.metrics = metrics
+
+    def get(self):
+        '''
+        Returns the request metrics in the Prometheus text format
+        '''
+        if self.metrics is None:
+            return {"enabled": False}
+
+        return Response(self.metrics.render(self.query_cache, self.dataset_registry),
+                        mimetype='text/plain; version=0.0.4')
+
+class Restaurant(Resource):
+    def __init__(self, dataset_registry, query_cache=None, metrics=None, read_only=False):
+        self.schema = RestaurantSchema()
+        self.dataset_registry = dataset_registry
+        self.read_only = read_only
+
+    def put(self, restaurant_name):
+        '''
+        Adds a restaurant, or updates the given fields of the restaurant with this name,
+        in the region given in the url args
+        '''
+        if self.read_only:
+            return return_read_only_response()
+        try:
+            loaded_fields = self.schema.load(request.get_json(silent=True) or {})
+        except ValidationError as error:
+            return error.messages, 400
+        region = return_region(request.args)
+        try:
+            dataset_holder = self.dataset_registry.return_dataset_holder(region)
+        except KeyError:
+            return return_unknown_region_response(region)
+        except RuntimeError as error:
+            return return_unavailable_region_response(error)
+
+        values = {key: value for key, value in loaded_fields.items() if key != "cuisine"}
+        # coordinates are stored in microdegrees
+        for key in ("latitude", "longitude"):
+            if key in values:
+                values[key] = parse_coordinate(key, values[key])
+        if "cuisine" in loaded_fields:
+            data_storage = dataset_holder.current().data_manager.data_storage
+            values["cuisine_id"] = data_storage.return_cuisine_id(loaded_fields["cuisine"])
+            if values["cuisine_id"] is None:
+                return {"cuisine": [f"Unknown cuisine '{loaded_fields['cuisine']}'"]}, 400
+
+        try:
+            snapshot = dataset_holder.upsert_restaurant(restaurant_name, values)
+        except (WritesNotSupported, SharedRestaurantName) as error:
+            return {"message": str(error)}, 409
+        except ValueError as error:
+            return {"message": str(error)}, 400
+
+        return {"version": snapshot.version}
+
+    def delete(self, restaurant_name):
+        '''
+        Removes the restaurant with this name, from the region given in the url args
         '''
-        relevant_restaurants_ids = self.data_manager.return_filtered_results(supplied_filters)
-        restaurants_data = self.data_manager.return_restaurant_information(relevant_restaurants_ids)
+        if self.read_only:
+            return return_read_only_response()
+        region = return_region(request.args)
+        try:
+            dataset_holder = self.dataset_registry.return_dataset_holder(region)
+        except KeyError:
+            return return_unknown_region_response(region)
+        except RuntimeError as error:
+            return return_unavailable_region_response(error)
+        try:
+            snapshot = dataset_holder.delete_restaurant(restaurant_name)
+        except (WritesNotSupported, SharedRestaurantName) as error:
+            return {"message": str(error)}, 409
+        except KeyError:
+            return {"message": f"No restaurant named '{restaurant_name}'"}, 404
 
-        return restaurants_data
+        return {"version": snapshot.version}
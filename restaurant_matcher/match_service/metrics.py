@@ -0,0 +1,193 @@
+'''
+Low overhead request instrumentation. Every request times its stages, the timings feed histograms and counters
+rendered in the Prometheus text format, and requests over a threshold are written to the slow query log.
+'''
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+# upper bounds in seconds of the latency histogram buckets, a +Inf bucket is always added
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+# upper bounds of the restaurants per response histogram buckets
+RESULT_SIZE_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+# QueryCache.stats counters exported as Prometheus counters, the rest are gauges
+CACHE_COUNTERS = ("hits", "misses", "evictions", "expirations", "invalidations")
+# DatasetRegistry.stats counters exported as Prometheus counters, the other numbers are gauges
+REGION_COUNTERS = ("loads", "load_failures", "load_seconds", "evictions")
+
+slow_query_logger = logging.getLogger(__name__)
+
+class StageTimer:
+    '''
+    Times the consecutive stages of one request, each mark closes the stage that ran since the previous mark
+    ie: validate -> cache -> filter -> order -> serialize
+    '''
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.last_mark = self.started_at
+        self.stages = {} # stage name to seconds, in the order the stages first ran
+
+    def mark(self, stage):
+        '''
+        Adds the time since the previous mark to a stage, a stage marked twice adds up
+        args:
+            stage: str, name of the stage that just finished
+        '''
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0) + now - self.last_mark
+        self.last_mark = now
+
+    def return_elapsed(self):
+        '''
+        return:
+            float, seconds since the timer started
+        '''
+        return time.perf_counter() - self.started_at
+
+class Histogram:
+    '''
+    Cumulative buckets, sum and count of observed values, in the Prometheus histogram layout
+    '''
+
+    def __init__(self, buckets):
+        '''
+        args:
+            buckets: tuple, sorted upper bounds of the buckets
+        '''
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1) # per bucket, not cumulative, the last one is +Inf
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        '''
+        args:
+            value: int or float, value to count
+        '''
+        # a value equal to a bound belongs to that bound's bucket
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels):
+        '''
+        args:
+            name: str, metric name
+            labels: str, rendered labels shared by every line, ie: 'endpoint="search"'
+        return:
+            list[str], the bucket, sum and count lines
+        '''
+        separator = ',' if labels else ''
+        lines = []
+        cumulative_count = 0
+        for bound, bucket_count in zip(self.buckets + ('+Inf',), self.bucket_counts):
+            cumulative_count += bucket_count
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative_count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.total}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+
+        return lines
+
+class Metrics:
+
+    def __init__(self, slow_query_seconds=0.5):
+        '''
+        args:
+            slow_query_seconds: optional float, requests taking at least this long are logged, None disables the log
+        '''
+        self.slow_query_seconds = slow_query_seconds
+        # recording a request is a few dict lookups and additions under one short lock
+        self.lock = threading.Lock()
+        self.request_counts = {} # (endpoint, outcome) to requests
+        self.request_seconds = {} # endpoint to Histogram
+        self.stage_seconds = {} # (endpoint, stage) to Histogram
+        self.result_sizes = {} # endpoint to Histogram of restaurants per response
+        self.slow_queries = 0
+
+    def record_request(self, endpoint, stage_timer, outcome="ok", result_size=None, params=None):
+        '''
+        Counts a finished request and its stage timings, logs it if it was slow
+        args:
+            endpoint: str, ie: "search" or "batch"
+            stage_timer: StageTimer, started when the request came in
+            outcome: optional str, ie: "ok", "invalid" or "explain"
+            result_size: optional int, restaurants returned
+            params: optional dict or list, request params, only used by the slow query log
+        '''
+        elapsed = stage_timer.return_elapsed()
+        is_slow = self.slow_query_seconds is not None and elapsed >= self.slow_query_seconds
+        with self.lock:
+            self.request_counts[(endpoint, outcome)] = self.request_counts.get((endpoint, outcome), 0) + 1
+            if endpoint not in self.request_seconds:
+                self.request_seconds[endpoint] = Histogram(LATENCY_BUCKETS)
+                self.result_sizes[endpoint] = Histogram(RESULT_SIZE_BUCKETS)
+            self.request_seconds[endpoint].observe(elapsed)
+            for stage, seconds in stage_timer.stages.items():
+                if (endpoint, stage) not in self.stage_seconds:
+                    self.stage_seconds[(endpoint, stage)] = Histogram(LATENCY_BUCKETS)
+                self.stage_seconds[(endpoint, stage)].observe(seconds)
+            if result_size is not None:
+                self.result_sizes[endpoint].observe(result_size)
+            if is_slow:
+                self.slow_queries += 1
+
+        if is_slow:
+            stage_breakdown = ', '.join(f'{stage}={seconds * 1000:.1f}ms' for stage, seconds in stage_timer.stages.items())
+            slow_query_logger.warning('Slow %s request took %.1fms (%s) params=%s', endpoint, elapsed * 1000,
+                                      stage_breakdown, params)
+
+    def render(self, query_cache=None, dataset_registry=None):
+        '''
+        Renders every metric in the Prometheus text exposition format
+        args:
+            query_cache: optional QueryCache, its counters are exported too
+            dataset_registry: optional DatasetRegistry, its region load and eviction counters are exported too
+        return:
+            str, metrics page
+        '''
+        lines = [
+            '# HELP match_service_requests_total Requests answered, by endpoint and outcome',
+            '# TYPE match_service_requests_total counter',
+        ]
+        with self.lock:
+            for (endpoint, outcome), count in sorted(self.request_counts.items()):
+                lines.append(f'match_service_requests_total{{endpoint="{endpoint}",outcome="{outcome}"}} {count}')
+
+            lines += ['# HELP match_service_request_seconds Time taken by a request',
+                      '# TYPE match_service_request_seconds histogram']
+            for endpoint, histogram in sorted(self.request_seconds.items()):
+                lines += histogram.render('match_service_request_seconds', f'endpoint="{endpoint}"')
+
+            lines += ['# HELP match_service_stage_seconds Time taken by a stage of a request',
+                      '# TYPE match_service_stage_seconds histogram']
+            for (endpoint, stage), histogram in sorted(self.stage_seconds.items()):
+                lines += histogram.render('match_service_stage_seconds', f'endpoint="{endpoint}",stage="{stage}"')
+
+            lines += ['# HELP match_service_result_restaurants Restaurants returned by a request',
+                      '# TYPE match_service_result_restaurants histogram']
+            for endpoint, histogram in sorted(self.result_sizes.items()):
+                lines += histogram.render('match_service_result_restaurants', f'endpoint="{endpoint}"')
+
+            lines += ['# HELP match_service_slow_queries_total Requests written to the slow query log',
+                      '# TYPE match_service_slow_queries_total counter',
+                      f'match_service_slow_queries_total {self.slow_queries}']
+
+        if query_cache is not None:
+            for name, value in query_cache.stats().items():
+                if value is None:
+                    continue
+                metric_type = "counter" if name in CACHE_COUNTERS else "gauge"
+                metric_name = f'match_service_cache_{name}' + ('_total' if metric_type == "counter" else '')
+                lines += [f'# TYPE {metric_name} {metric_type}', f'{metric_name} {value}']
+
+        if dataset_registry is not None:
+            for name, value in dataset_registry.stats().items():
+                if value is None or isinstance(value, list):
+                    continue
+                metric_type = "counter" if name in REGION_COUNTERS else "gauge"
+                metric_name = f'match_service_regions_{name}' + ('_total' if metric_type == "counter" else '')
+                lines += [f'# TYPE {metric_name} {metric_type}', f'{metric_name} {value}']
+
+        return '\n'.join(lines) + '\n'
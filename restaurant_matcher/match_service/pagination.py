@@ -0,0 +1,40 @@
+'''
+Opaque pagination cursors. A cursor marks where in the precomputed ranking the next page starts.
+'''
+import base64
+import binascii
+
+# page size used when a cursor is given without a limit
+DEFAULT_PAGE_SIZE = 10
+
+CURSOR_PREFIX = 'rank:'
+
+def encode_cursor(rank_position):
+    '''
+    Wraps a ranking position into an opaque cursor
+    args:
+        rank_position: int, position in the ranking to resume from
+    return:
+        str, url safe cursor
+    '''
+    return base64.urlsafe_b64encode(f'{CURSOR_PREFIX}{rank_position}'.encode()).decode()
+
+def decode_cursor(cursor):
+    '''
+    Unwraps a cursor made by encode_cursor
+    args:
+        cursor: str, url safe cursor
+    return:
+        int, position in the ranking to resume from
+    raises:
+        ValueError, if the cursor was not made by encode_cursor
+    '''
+    try:
+        decoded = base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (binascii.Error, UnicodeDecodeError) as error:
+        raise ValueError('Invalid cursor') from error
+
+    if not decoded.startswith(CURSOR_PREFIX) or not decoded[len(CURSOR_PREFIX):].isdigit():
+        raise ValueError('Invalid cursor')
+
+    return int(decoded[len(CURSOR_PREFIX):])
@@ -0,0 +1,128 @@
+'''
+In-process LRU cache of query results, bounded by entry count and age, scoped to a dataset version.
+Datasets of separate regions each have their own versions, a new version of one only drops that region's entries.
+'''
+import threading
+import time
+from collections import OrderedDict
+
+# params matched case insensitively, so their case does not make a query distinct
+CASE_INSENSITIVE_PARAMS = ("name", "cuisine", "region", "sort")
+
+class QueryCache:
+
+    def __init__(self, max_entries=1024, ttl=300, store_payloads=True):
+        '''
+        args:
+            max_entries: optional int, least recently used entries are evicted past this count
+            ttl: optional int, seconds an entry stays valid, None keeps entries until evicted
+            store_payloads: optional bool, whether to keep the response payload next to the ordered ids
+        '''
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store_payloads = store_payloads
+        self.entries = OrderedDict() # cache key to (expires_at, scope, value), least recently used first
+        self.versions = {} # scope to the dataset version its entries belong to
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(loaded_params):
+        '''
+        Canonicalizes validated request params so equivalent queries share an entry
+        ie: {'cuisine': 'Thai', 'rating': 3} and {'rating': '3', 'cuisine': 'thai'} give the same key
+        args:
+            loaded_params: dict, params as loaded by MatchServiceSchema
+        return:
+            tuple, hashable cache key
+        '''
+        return tuple(sorted((key, value.lower() if key in CASE_INSENSITIVE_PARAMS else value)
+                            for key, value in loaded_params.items()))
+
+    def get(self, version, key, scope=None):
+        '''
+        Returns the cached value for a query against the given dataset version
+        args:
+            version: int, dataset snapshot version the query runs against
+            key: tuple, output of make_key
+            scope: optional str, region of the dataset, None for the default dataset
+        return:
+            the cached value, None on a miss
+        '''
+        with self.lock:
+            self.check_version(version, scope)
+            # a request still reading a replaced snapshot must not get results of the newer one
+            entry = self.entries.get(key) if version == self.versions[scope] else None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, _, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, version, key, value, scope=None):
+        '''
+        Caches the value of a query against the given dataset version
+        args:
+            version: int, dataset snapshot version the value was computed from
+            key: tuple, output of make_key
+            value: any, result to cache
+            scope: optional str, region of the dataset, None for the default dataset
+        '''
+        with self.lock:
+            self.check_version(version, scope)
+            if version != self.versions[scope]:
+                # computed from a snapshot that has since been replaced
+                return
+
+            expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+            self.entries[key] = (expires_at, scope, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def check_version(self, version, scope=None):
+        '''
+        Drops every entry of a scope once a newer dataset version shows up, expects self.lock to be held
+        args:
+            version: int, dataset snapshot version of the current request
+            scope: optional str, region of the dataset, None for the default dataset
+        '''
+        if scope not in self.versions or version > self.versions[scope]:
+            stale_keys = [key for key, (_, entry_scope, _) in self.entries.items() if entry_scope == scope]
+            for key in stale_keys:
+                del self.entries[key]
+            if stale_keys:
+                self.invalidations += 1
+            self.versions[scope] = version
+
+    def stats(self):
+        '''
+        Returns the cache counters
+        return:
+            dict, counter name to value
+        '''
+        with self.lock:
+            return {
+                "version": self.versions.get(None),
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
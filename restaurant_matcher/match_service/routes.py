@@ -4,9 +4,36 @@ Registers url endpoints and maps it to classes in controllers
 
 from flask import Blueprint
 from flask_restful import Api
-from .controllers import Skeleton
+from .conditional_requests import DEFAULT_MAX_AGE
+from .controllers import Batch, CacheStats, MetricsPage, RegionStats, Reload, Restaurant, Skeleton
 
-match_service_blueprint = Blueprint('match_service', __name__, url_prefix='/match_service')
-match_service_api = Api(match_service_blueprint)
+def create_match_service_blueprint(dataset_registry, query_cache=None, metrics=None, max_age=DEFAULT_MAX_AGE,
+                                   read_only=False):
+    '''
+    Builds the match service blueprint with its resources bound to the shared dataset
+    args:
+        dataset_registry: DatasetRegistry, process wide dataset snapshots of the default dataset and of every region
+        query_cache: optional QueryCache, caches query results, None disables caching
+        metrics: optional Metrics, request timings and counters, None disables them
+        max_age: optional int, seconds a client or proxy may reuse a search response before revalidating it
+        read_only: optional bool, answer writes and reloads with a 405, for apps whose requests are spread
+                   over several processes that would each change only their own copy of the dataset
+    return:
+        Blueprint, ready to be registered on the app
+    '''
+    match_service_blueprint = Blueprint('match_service', __name__, url_prefix='/match_service')
+    match_service_api = Api(match_service_blueprint)
+    resource_kwargs = {"dataset_registry": dataset_registry, "query_cache": query_cache, "metrics": metrics}
 
-match_service_api.add_resource(Skeleton, '/', endpoint="match_service")
+    match_service_api.add_resource(Skeleton, '/', endpoint="match_service",
+                                   resource_class_kwargs=dict(resource_kwargs, max_age=max_age))
+    match_service_api.add_resource(Batch, '/batch', endpoint="batch", resource_class_kwargs=resource_kwargs)
+    match_service_api.add_resource(Reload, '/reload', endpoint="reload",
+                                   resource_class_kwargs=dict(resource_kwargs, read_only=read_only))
+    match_service_api.add_resource(CacheStats, '/cache', endpoint="cache", resource_class_kwargs=resource_kwargs)
+    match_service_api.add_resource(RegionStats, '/regions', endpoint="regions", resource_class_kwargs=resource_kwargs)
+    match_service_api.add_resource(MetricsPage, '/metrics', endpoint="metrics", resource_class_kwargs=resource_kwargs)
+    match_service_api.add_resource(Restaurant, '/restaurants/<string:restaurant_name>', endpoint="restaurant",
+                                   resource_class_kwargs=dict(resource_kwargs, read_only=read_only))
+
+    return match_service_blueprint
@@ -1,7 +1,49 @@
 '''
 URL parameter validators
 '''
-from marshmallow import Schema, fields, validate
+from marshmallow import Schema, ValidationError, fields, validate, validates_schema
+
+from restaurant_matcher.data_management.data_storage import DEFAULT_RANK_PRIORITY
+from restaurant_matcher.data_management.dataset_registry import REGION_PATTERN
+from restaurant_matcher.data_management.fragments import RESTAURANT_FIELDS
+from .pagination import decode_cursor
+
+def validate_cursor(cursor):
+    '''
+    Rejects cursors that were not handed out by the api
+    '''
+    try:
+        decode_cursor(cursor)
+    except ValueError as error:
+        raise ValidationError(str(error)) from error
+
+def validate_response_fields(response_fields):
+    '''
+    Rejects projections naming fields a restaurant does not have
+    '''
+    unknown_fields = [field for field in response_fields.split(",") if field not in RESTAURANT_FIELDS]
+    if unknown_fields:
+        raise ValidationError(f'Unknown fields {", ".join(unknown_fields)}, expected a comma separated subset of '
+                              f'{", ".join(RESTAURANT_FIELDS)}')
+
+def validate_region(region):
+    '''
+    Rejects region names that can not be a region's directory
+    '''
+    if not REGION_PATTERN.fullmatch(region.lower()):
+        raise ValidationError('Expected a region name of up to 64 letters, digits, "-" and "_"')
+
+def validate_sort(sort):
+    '''
+    Rejects sort priorities naming a param the results can not be ranked by, or one param twice
+    '''
+    sort_keys = sort.lower().split(",")
+    unknown_keys = [key for key in sort_keys if key not in DEFAULT_RANK_PRIORITY]
+    if unknown_keys:
+        raise ValidationError(f'Unknown sort keys {", ".join(unknown_keys)}, expected a comma separated ordering of '
+                              f'{", ".join(DEFAULT_RANK_PRIORITY)}')
+    if len(set(sort_keys)) != len(sort_keys):
+        raise ValidationError('Expected every sort key at most once')
 
 class MatchServiceSchema(Schema):
     '''
@@ -11,4 +53,63 @@ class MatchServiceSchema(Schema):
     rating = fields.Int(required=False, validate=validate.Range(min=1, max=5))
     distance = fields.Int(required=False, validate=validate.Range(min=1, max=10))
     price = fields.Int(required=False, validate=validate.Range(min=10, max=50))
+    # the other end of the rating, distance and price ranges
+    rating_max = fields.Int(required=False, validate=validate.Range(min=1, max=5))
+    distance_min = fields.Int(required=False, validate=validate.Range(min=1, max=10))
+    price_min = fields.Int(required=False, validate=validate.Range(min=10, max=50))
+    # ranks by these params first, ie: price,rating, the others follow in the default distance, rating, price order
+    sort = fields.Str(required=False, validate=validate_sort)
     cuisine = fields.Str(required=False)
+    limit = fields.Int(required=False, validate=validate.Range(min=1, max=100))
+    cursor = fields.Str(required=False, validate=validate_cursor)
+    explain = fields.Bool(required=False)
+    facets = fields.Bool(required=False)
+    response_fields = fields.Str(required=False, data_key="fields", validate=validate_response_fields)
+    # a location ranks by the distance from it, the distance param then caps that distance in km like radius
+    lat = fields.Float(required=False, validate=validate.Range(min=-90, max=90))
+    lng = fields.Float(required=False, validate=validate.Range(min=-180, max=180))
+    radius = fields.Float(required=False, validate=validate.Range(min=0, min_inclusive=False))
+    # picks the dataset to search, the default one without it
+    region = fields.Str(required=False, validate=validate_region)
+
+    @validates_schema
+    def validate_location(self, data, **kwargs):
+        '''
+        Rejects a location missing one of its coordinates, a radius without a location
+        and a minimum distance with one
+        '''
+        if ("lat" in data) != ("lng" in data):
+            raise ValidationError('lat and lng must be given together', "lng" if "lat" in data else "lat")
+        if "radius" in data and "lat" not in data:
+            raise ValidationError('radius needs a lat and lng', "radius")
+        if "distance_min" in data and "lat" in data:
+            raise ValidationError('distance_min can not be combined with a location', "distance_min")
+
+    @validates_schema
+    def validate_ranges(self, data, **kwargs):
+        '''
+        Rejects ranges whose lower bound is above their upper bound
+        '''
+        for low_key, high_key in [("rating", "rating_max"), ("distance_min", "distance"), ("price_min", "price")]:
+            if low_key in data and high_key in data and data[low_key] > data[high_key]:
+                raise ValidationError(f'{low_key} must not be above {high_key}', high_key)
+
+class RestaurantSchema(Schema):
+    '''
+    Validates the json body of a restaurant write, left out fields keep the restaurant's current values
+    '''
+    cuisine = fields.Str(required=False)
+    rating = fields.Int(required=False, validate=validate.Range(min=1, max=5))
+    distance = fields.Int(required=False, validate=validate.Range(min=1, max=10))
+    price = fields.Int(required=False, validate=validate.Range(min=10, max=50))
+    latitude = fields.Float(required=False, validate=validate.Range(min=-90, max=90))
+    longitude = fields.Float(required=False, validate=validate.Range(min=-180, max=180))
+
+    @validates_schema
+    def validate_location(self, data, **kwargs):
+        '''
+        Rejects a location missing one of its coordinates
+        '''
+        if ("latitude" in data) != ("longitude" in data):
+            raise ValidationError('latitude and longitude must be given together',
+                                  "longitude" if "latitude" in data else "latitude")
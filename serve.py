@@ -0,0 +1,192 @@
+'''
+Production entry point, a pre-fork server. The master process loads the dataset once, then forks the workers,
+which share the dataset's memory pages copy-on-write instead of each loading their own.
+The dataset's objects are moved out of the garbage collector's reach before forking, a collection in a worker
+would otherwise write to every object it visits and copy the pages they are on.
+Only the master watches the default dataset's files. After it reloads them it forks a fresh set of workers and
+stops the previous ones, rather than every worker reloading into its own private memory.
+Configured by the same MATCH_SERVICE_* environment variables as app.py.
+Run from the repository root: python serve.py [--workers 4] [--host 0.0.0.0] [--port 8000] [--check-interval 5]
+'''
+import argparse
+import gc
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from app import create_app
+
+# seconds a stopping worker waits for the requests it already accepted, ie: idle keep-alive connections are dropped after
+WORKER_STOP_SECONDS = 10
+
+def wait_for_requests(timeout):
+    '''
+    Waits for the request threads of a stopping worker to finish
+    args:
+        timeout: float, seconds to wait at most for all of them
+    '''
+    deadline = time.monotonic() + timeout
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread():
+            thread.join(max(0, deadline - time.monotonic()))
+
+def run_worker(server, freeze):
+    '''
+    Worker process loop, answers requests off the listening socket shared with the other workers until stopped.
+    SIGTERM stops it accepting connections and lets the requests in flight finish before it exits.
+    args:
+        server: BaseWSGIServer, bound in the master
+        freeze: bool, whether the master froze the dataset out of the garbage collector
+    '''
+    def stop_serving(signal_number, frame):
+        # shutdown waits for serve_forever to return, which this handler interrupted, so it runs on its own thread
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop_serving)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    if freeze:
+        # objects allocated from here on are collected as usual, the frozen ones are never visited
+        gc.enable()
+    try:
+        server.serve_forever()
+        wait_for_requests(WORKER_STOP_SECONDS)
+    finally:
+        os._exit(0)
+
+def fork_worker(server, freeze):
+    '''
+    return:
+        int, pid of the new worker
+    '''
+    pid = os.fork()
+    if pid == 0:
+        run_worker(server, freeze)
+
+    return pid
+
+def terminate_workers(worker_pids):
+    '''
+    Asks the workers to stop once their requests in flight are answered, see run_worker
+    '''
+    for pid in worker_pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+def stop_workers(worker_pids):
+    '''
+    Stops the workers and waits for them to exit
+    '''
+    terminate_workers(worker_pids)
+    for pid in worker_pids:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+def reload_dataset(dataset_holder, freeze):
+    '''
+    Reloads the dataset in the master if its files changed
+    args:
+        dataset_holder: DatasetHolder, default dataset of the app
+        freeze: bool, whether the dataset is frozen out of the garbage collector
+    return:
+        bool, whether a new snapshot was loaded, the workers then have to be forked again
+    '''
+    try:
+        if not dataset_holder.reload_if_changed():
+            return False
+    except Exception as error:
+        # ie: a file caught halfway through being rewritten, the workers keep serving the previous snapshot
+        print(f'Reloading the dataset failed, still serving the previous one: {error!r}', file=sys.stderr, flush=True)
+        return False
+
+    if freeze:
+        # the previous snapshot was frozen too, it is only collected once it is back in the collector's reach
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+    return True
+
+def raise_system_exit(signal_number, frame):
+    raise SystemExit(0)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--no-freeze', dest='freeze', action='store_false',
+                        help='leave the dataset to the garbage collector, only to measure what freezing saves')
+    parser.add_argument('--quiet', action='store_true', help='do not log every request')
+    parser.add_argument('--check-interval', type=float, default=5,
+                        help='seconds between checks of the dataset files by the master, 0 disables reloading')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if os.environ.get('MATCH_SERVICE_ENGINE') == 'sharded':
+        # the shard pipes and their lock would be shared by every worker
+        parser.error('the sharded engine runs its own worker processes, serve it with python -m flask run')
+    if args.quiet:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    if args.freeze:
+        # nothing the dataset allocates is collected before it is frozen, so no collection dirties its objects
+        gc.disable()
+    # the workers never check the files themselves, the master reloads and forks them again
+    # a write or reload would only change the copy of the worker that received it, so they are refused
+    app = create_app(check_interval=None, read_only=True)
+    dataset_holder = app.extensions["dataset_registry"].default_dataset_holder
+    # bound once here, every worker accepts connections off the same socket
+    server = make_server(args.host, args.port, app, threaded=True)
+    if args.freeze:
+        gc.freeze()
+
+    worker_pids = set()
+    stopping_pids = set() # workers replaced by a reload that are still answering their last requests
+    signal.signal(signal.SIGTERM, raise_system_exit)
+    try:
+        for _ in range(args.workers):
+            worker_pids.add(fork_worker(server, args.freeze))
+        print(f'Serving on http://{args.host}:{args.port} with {args.workers} workers, master pid {os.getpid()}',
+              file=sys.stderr, flush=True)
+
+        next_check = time.monotonic() + args.check_interval
+        while True:
+            # a worker that dies is replaced, the dataset is still in the master's memory
+            pid, status = os.waitpid(-1, os.WNOHANG if args.check_interval else 0)
+            if pid in worker_pids:
+                worker_pids.remove(pid)
+                print(f'Worker {pid} exited with status {status}, restarting it', file=sys.stderr, flush=True)
+                worker_pids.add(fork_worker(server, args.freeze))
+                continue
+            stopping_pids.discard(pid)
+            if pid != 0 or not args.check_interval:
+                continue
+
+            time.sleep(min(1, args.check_interval))
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + args.check_interval
+                if reload_dataset(dataset_holder, args.freeze):
+                    # the new workers accept connections off the same socket before the previous ones stop,
+                    # which finish the requests they already accepted and are reaped above once they exit
+                    previous_worker_pids = worker_pids
+                    worker_pids = {fork_worker(server, args.freeze) for _ in range(args.workers)}
+                    terminate_workers(previous_worker_pids)
+                    stopping_pids.update(previous_worker_pids)
+                    print(f'Reloaded the dataset, version {dataset_holder.snapshot.version}, '
+                          f'restarted the workers', file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_workers(worker_pids | stopping_pids)
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
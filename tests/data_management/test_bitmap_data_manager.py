@@ -0,0 +1,95 @@
+import itertools
+import pytest
+from restaurant_matcher.data_management.bitmap_data_manager import BitmapDataManager
+from restaurant_matcher.data_management.bitmaps import bitmap_to_ids, ids_to_bitmap
+from restaurant_matcher.data_management.data_manager import DataManager
+
+@pytest.fixture
+def return_bitmap_data_manager():
+    return BitmapDataManager('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+
+def test_bitmap_round_trip():
+    '''
+    Tests ids packed into a bitmap unpack to the same ascending ids
+    '''
+    bitmap = ids_to_bitmap([9, 0, 3, 17], 20)
+    assert bitmap == 0b100000001000001001
+    assert bitmap_to_ids(bitmap) == [0, 3, 9, 17]
+    assert bitmap_to_ids(0) == []
+
+def test_return_filtered_results(return_bitmap_data_manager):
+    '''
+    Tests return_filtered_results method to return filtered in-order restaurant_ids
+    '''
+    # single filter
+    filtered_results = return_bitmap_data_manager.return_filtered_results({'name': 'applebees'})
+    assert filtered_results == [0, 1, 2, 3, 4, 7, 5]
+    # multiple filters
+    filtered_results = return_bitmap_data_manager.return_filtered_results({'name': 'applebees', 'rating': '2'})
+    assert filtered_results == [1, 2, 3, 4, 7]
+    # all filters
+    filtered_results = return_bitmap_data_manager.return_filtered_results({'name': 'applebees', 'rating': '2',
+                                                                           'distance': '10', 'price': '35',
+                                                                           'cuisine': 'american'})
+    assert filtered_results == [1, 2]
+    # no results
+    filtered_results = return_bitmap_data_manager.return_filtered_results({'rating': '5', 'distance': '1'})
+    assert filtered_results == []
+
+def test_matches_list_engine():
+    '''
+    Tests the bitmap engine returns exactly what the list engine returns on the full fixture data
+    '''
+    list_data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    bitmap_data_manager = BitmapDataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+
+    for rating, distance, price, cuisine in itertools.product(['1', '3', '5'], ['1', '4', '10'],
+                                                              ['10', '25', '50'], [None, 'an', 'Thai', 'Klingon']):
+        params = {'rating': rating, 'distance': distance, 'price': price}
+        if cuisine:
+            params['cuisine'] = cuisine
+
+        assert bitmap_data_manager.return_filtered_results(params) == list_data_manager.return_filtered_results(params)
+
+    for params in [{'name': 'Delicious'}, {'name': 'hotspot'}, {'name': 'HOTSPOT', 'rating': '3', 'cuisine': 'an'},
+                   {'rating_max': '3', 'distance_min': '4', 'price_min': '25'}, {'sort': 'price,rating', 'cuisine': 'an'}]:
+        assert bitmap_data_manager.return_filtered_results(params) == list_data_manager.return_filtered_results(params)
+
+def test_matches_list_engine_after_writes():
+    '''
+    Tests the bitmap engine keeps returning what the list engine returns after upserts and deletes
+    '''
+    list_data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    bitmap_data_manager = BitmapDataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    names = list_data_manager.data_storage.names[:40]
+
+    for data_manager in [list_data_manager, bitmap_data_manager]:
+        for index, name in enumerate(names):
+            if index % 3 == 0:
+                data_manager.data_storage.delete_restaurant(name)
+            else:
+                data_manager.data_storage.upsert_restaurant(name, {'rating': index % 5 + 1, 'price': 10 + index % 9 * 5})
+        data_manager.data_storage.upsert_restaurant('Delicious Newcomer', {'cuisine_id': 1, 'rating': 3, 'distance': 2, 'price': 15})
+
+    for params in [{}, {'rating': '3', 'price': '25'}, {'cuisine': 'an', 'distance': '4'}, {'name': 'delicious'}]:
+        assert bitmap_data_manager.return_filtered_results(params) == list_data_manager.return_filtered_results(params)
+
+def test_return_batch_filtered_results(return_bitmap_data_manager):
+    '''
+    Tests a batch answers every query like a single query
+    '''
+    params_list = [{'name': 'applebees', 'rating': rating} for rating in ['1', '2', '3']]
+    params_list += [{'cuisine': 'american', 'price': '35'}, {'name': 'APPLEBEES', 'rating': '2'}, {'rating': '5', 'distance': '1'}]
+
+    expected = [return_bitmap_data_manager.return_filtered_results(params) for params in params_list]
+    assert return_bitmap_data_manager.return_batch_filtered_results(params_list) == expected
+
+def test_explain_query(return_bitmap_data_manager):
+    '''
+    Tests explain reports the bitmap engine's fixed filter order with the restaurants left after every filter
+    '''
+    explanation = return_bitmap_data_manager.explain_query({'cuisine': 'american', 'rating': '3'})
+
+    assert [step['predicate'] for step in explanation['plan']] == ['cuisine', 'distance', 'rating', 'price']
+    assert [step['actual_rows'] for step in explanation['plan']] == [4, 4, 2, 2]
+    assert explanation['result_rows'] == 2
@@ -0,0 +1,80 @@
+import itertools
+import pytest
+from restaurant_matcher.data_management.data_manager import DataManager
+
+np = pytest.importorskip('numpy')
+from restaurant_matcher.data_management.columnar_data_manager import ColumnarDataManager
+
+@pytest.fixture
+def return_columnar_data_manager():
+    return ColumnarDataManager('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+
+def test_columns_built_on_ingestion(return_columnar_data_manager):
+    '''
+    Tests the columns hold the typed values per restaurant id
+    '''
+    storage = return_columnar_data_manager.data_storage
+
+    assert storage.rating_column.dtype == np.int8
+    assert storage.rating_column.tolist() == [1, 2, 3, 4, 5, 1, 3, 4]
+    assert storage.distance_column.tolist() == [1, 2, 3, 4, 5, 6, 7, 5]
+    assert storage.price_column.tolist() == [10, 20, 30, 40, 50, 35, 45, 45]
+    assert storage.cuisine_column.tolist() == [1, 1, 1, 1, 2, 3, 2, 3]
+
+def test_return_filtered_results(return_columnar_data_manager):
+    '''
+    Tests return_filtered_results method to return filtered in-order restaurant_ids
+    '''
+    # single filter
+    filtered_results = return_columnar_data_manager.return_filtered_results({'name': 'applebees'})
+    assert filtered_results == [0, 1, 2, 3, 4, 7, 5]
+    # all filters
+    filtered_results = return_columnar_data_manager.return_filtered_results({'name': 'applebees', 'rating': '2',
+                                                                             'distance': '10', 'price': '35',
+                                                                             'cuisine': 'american'})
+    assert filtered_results == [1, 2]
+    # no results
+    filtered_results = return_columnar_data_manager.return_filtered_results({'name': 'toronto'})
+    assert filtered_results == []
+
+def test_matches_list_engine():
+    '''
+    Tests the columnar engine returns exactly what the list engine returns on the full fixture data
+    '''
+    list_data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    columnar_data_manager = ColumnarDataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+
+    for rating, distance, price, cuisine in itertools.product(['1', '3', '5'], ['1', '4', '10'],
+                                                              ['10', '25', '50'], [None, 'an', 'Klingon']):
+        params = {'rating': rating, 'distance': distance, 'price': price}
+        if cuisine:
+            params['cuisine'] = cuisine
+
+        expected = list_data_manager.return_filtered_results(params)
+        assert columnar_data_manager.return_filtered_results(params) == expected
+
+    for params in [{'name': 'Delicious', 'rating': '3'}, {'name': 'hotspot'}, {'name': 'HOTSPOT', 'rating': '3', 'cuisine': 'an'},
+                   {'rating_max': '3', 'distance_min': '4', 'price_min': '25'}, {'sort': 'price,rating', 'cuisine': 'an'}]:
+        assert columnar_data_manager.return_filtered_results(params) == list_data_manager.return_filtered_results(params)
+
+def test_return_top_results_matches_list_engine():
+    '''
+    Tests the chunked ranking scan returns the same pages as the list engine
+    '''
+    list_data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    columnar_data_manager = ColumnarDataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+
+    for params in [{}, {'rating': '4', 'distance': '6'}, {'cuisine': 'an', 'price': '30'}, {'sort': 'rating', 'price_min': '20'}]:
+        for limit, start_position in [(1, 0), (10, 0), (10, 57), (500, 0)]:
+            expected = list_data_manager.return_top_results(params, limit, start_position)
+            assert columnar_data_manager.return_top_results(params, limit, start_position) == expected
+
+def test_return_batch_filtered_results(return_columnar_data_manager):
+    '''
+    Tests a batch answers every query like a single query
+    '''
+    params_list = [{'name': 'applebees', 'rating': rating} for rating in ['1', '2', '3']]
+    params_list += [{'cuisine': 'american', 'price': '35'}, {'name': 'APPLEBEES', 'rating': '2'}, {'name': 'toronto'}]
+
+    expected = [return_columnar_data_manager.return_filtered_results(params) for params in params_list]
+    assert return_columnar_data_manager.return_batch_filtered_results(params_list) == expected
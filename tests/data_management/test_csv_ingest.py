@@ -0,0 +1,96 @@
+import pytest
+from restaurant_matcher.data_management.csv_ingest import RejectedRow
+from restaurant_matcher.data_management.data_storage import DataStorage
+from restaurant_matcher.data_management.geo import MISSING_COORDINATE
+
+@pytest.fixture
+def return_data_storage():
+    return DataStorage()
+
+def test_malformed_rows_rejected(return_data_storage):
+    '''
+    Tests rows that can not be stored are skipped and reported instead of failing the ingest
+    '''
+    return_data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_malformed_restaurants.csv')
+
+    assert return_data_storage.names == ['applebees1', 'applebees2', 'thai, quoted']
+    assert return_data_storage.price_column.tolist() == [10, 20, 45]
+    assert return_data_storage.rejected_rows == [
+        RejectedRow(3, 'cuisine_id 9 is unknown'),
+        RejectedRow(6, "rating '' is not an integer"),
+        RejectedRow(7, 'expected 5 fields, got 6'),
+        RejectedRow(8, 'name is empty'),
+        RejectedRow(9, 'price 99999 is out of range'),
+    ]
+    assert return_data_storage.ingest_progress.rows_read == 8
+    assert return_data_storage.ingest_progress.rows_accepted == 3
+    assert return_data_storage.ingest_progress.rows_rejected == 5
+
+def test_out_of_range_values_rejected(return_data_storage, tmp_path):
+    '''
+    Tests rows whose rating, distance or price no restaurant can have are rejected, though their columns could hold them
+    '''
+    restaurant_csv_path = tmp_path / 'restaurants.csv'
+    restaurant_csv_path.write_text('name,customer_rating,distance,price,cuisine_id\n'
+                                   'applebees1,1,1,10,1\n'
+                                   'too many stars,100,1,10,1\n'
+                                   'no stars,0,1,10,1\n'
+                                   'negative distance,3,-5,10,1\n'
+                                   'negative price,3,1,-3,1\n'
+                                   'applebees2,5,10,50,1\n')
+    return_data_storage.ingest('tests/fixtures/test_cuisines.csv', restaurant_csv_path)
+
+    assert return_data_storage.names == ['applebees1', 'applebees2']
+    assert return_data_storage.rejected_rows == [
+        RejectedRow(3, 'rating 100 is out of range'),
+        RejectedRow(4, 'rating 0 is out of range'),
+        RejectedRow(5, 'distance -5 is out of range'),
+        RejectedRow(6, 'price -3 is out of range'),
+    ]
+    assert return_data_storage.ingest_progress.rows_rejected == 4
+
+def test_chunked_ingest(return_data_storage):
+    '''
+    Tests ingesting in small chunks builds the same data as one chunk and reports progress after each chunk
+    '''
+    whole_storage = DataStorage()
+    whole_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+    progress = []
+    return_data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv',
+                               chunk_size=3, progress_callback=progress.append)
+
+    assert return_data_storage.names == whole_storage.names
+    assert return_data_storage.return_columns() == whole_storage.return_columns()
+    assert return_data_storage.ranked_ids == whole_storage.ranked_ids
+    assert return_data_storage.name_trigrams == whole_storage.name_trigrams
+    assert [ingest_progress.rows_accepted for ingest_progress in progress] == [3, 6, 8]
+    assert progress[-1].bytes_read == progress[-1].total_bytes
+
+def test_missing_csv_column(return_data_storage, tmp_path):
+    '''
+    Tests a restaurants csv without a required column is refused outright
+    '''
+    restaurant_csv_path = tmp_path / 'restaurants.csv'
+    restaurant_csv_path.write_text('name,customer_rating,distance,cuisine_id\napplebees1,1,1,1\n')
+
+    with pytest.raises(ValueError):
+        return_data_storage.ingest('tests/fixtures/test_cuisines.csv', restaurant_csv_path)
+
+def test_invalid_coordinates_rejected(return_data_storage, tmp_path):
+    '''
+    Tests rows with a coordinate out of range or only one of the two coordinates are rejected
+    '''
+    restaurant_csv_path = tmp_path / 'restaurants.csv'
+    restaurant_csv_path.write_text('name,customer_rating,distance,price,cuisine_id,latitude,longitude\n'
+                                   'located,1,1,10,1,40.7,-73.9\n'
+                                   'unlocated,1,1,10,1,,\n'
+                                   'off the map,1,1,10,1,95,-73.9\n'
+                                   'half located,1,1,10,1,40.7,\n')
+    return_data_storage.ingest('tests/fixtures/test_cuisines.csv', restaurant_csv_path)
+
+    assert return_data_storage.names == ['located', 'unlocated']
+    assert return_data_storage.latitude_column.tolist() == [40700000, MISSING_COORDINATE]
+    assert return_data_storage.rejected_rows == [
+        RejectedRow(4, "latitude '95' is not a coordinate in range"),
+        RejectedRow(5, 'latitude and longitude must both be set or both be blank'),
+    ]
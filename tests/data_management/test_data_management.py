@@ -1,3 +1,4 @@
+import itertools
 import pytest
 from restaurant_matcher.data_management.data_manager import DataManager
 
@@ -70,17 +71,76 @@ def test_return_filtered_restaurant_names(return_data_manager):
     filtered_answer = return_data_manager.return_filtered_restaurant_names("applebees", [1,2,3])
     assert filtered_answer == [1, 2, 3]
 
+    # With mixed case
+    filtered_answer = return_data_manager.return_filtered_restaurant_names("Red LOBSTER")
+    assert filtered_answer == [6, 7]
+
+    # Too short for the trigram index
+    filtered_answer = return_data_manager.return_filtered_restaurant_names("d l", [5, 6, 7])
+    assert filtered_answer == [6, 7]
+
+    # Trigrams all present but not as a substring
+    filtered_answer = return_data_manager.return_filtered_restaurant_names("applebees lobster")
+    assert filtered_answer == []
+
+def legacy_order_results(unique_restaurant_ids, ranked_results, existing_sort_params):
+    '''
+    The tier by tier recursive ordering order_results replaced, kept as the reference for regression tests
+    '''
+    if not existing_sort_params:
+        return list(unique_restaurant_ids)
+
+    relevance_order = []
+    while unique_restaurant_ids and existing_sort_params:
+        key = existing_sort_params[0]
+        for depth in ranked_results[key]:
+            found_in_level = unique_restaurant_ids & set(depth)
+            unique_restaurant_ids = unique_restaurant_ids - found_in_level
+            if len(found_in_level) > 1:
+                found_in_level = legacy_order_results(set(found_in_level), ranked_results, existing_sort_params[1:])
+            relevance_order = relevance_order + list(found_in_level)
+
+    return relevance_order
+
 def test_order_results(return_data_manager):
     '''
     Tests order_results method to return restaurant_ids in order based on applied business logic
     '''
-    ranked_results = {'distance': [[0], [1], [2], [3], [4, 7], [5], [6]],
-                      'rating': [[4], [3, 7], [2, 6], [1], [0, 5]],
-                      'price': [[0], [1], [2], [5], [3], [6, 7], [4]]}
-
-    ordered_ids = return_data_manager.order_results(set([0, 1, 2, 3, 4, 7, 5]), ranked_results, ["distance", "rating", "price"])
+    ordered_ids = return_data_manager.order_results(set([0, 1, 2, 3, 4, 7, 5]))
     assert ordered_ids == [0, 1, 2, 3, 4, 7, 5]
 
+    # full ties are broken by ascending id
+    ordered_ids = return_data_manager.order_results(set([6, 7, 4]))
+    assert ordered_ids == [4, 7, 6]
+
+def test_order_results_matches_legacy_ordering():
+    '''
+    Tests the precomputed ranking orders every query like the recursive tier ordering did.
+    The legacy ordering left full ties in set iteration order, so those are compared by ascending id.
+    '''
+    data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    details = data_manager.data_storage.restaurant_details
+    def sort_key(id):
+        return (int(details[id]['distance']), -int(details[id]['rating']), int(details[id]['price']))
+
+    for rating, distance, price in itertools.product(['1', '2', '4'], ['2', '6', '10'], ['20', '35', '50']):
+        ranked_results = {
+            'distance': data_manager.return_filtered_distances([], distance),
+            'rating': data_manager.return_filtered_ratings([], rating),
+            'price': data_manager.return_filtered_prices([], price),
+        }
+        unique_restaurant_ids = set.intersection(*[set(id for tier in tiers for id in tier)
+                                                   for tiers in ranked_results.values()])
+        legacy_order = legacy_order_results(set(unique_restaurant_ids), ranked_results, ['distance', 'rating', 'price'])
+        # keep the legacy order of the tie groups, ascending id within each group
+        group_positions = {}
+        for position, id in enumerate(legacy_order):
+            group_positions.setdefault(sort_key(id), position)
+        legacy_order = sorted(legacy_order, key=lambda id: (group_positions[sort_key(id)], id))
+
+        assert data_manager.order_results(unique_restaurant_ids) == legacy_order
+        assert data_manager.return_filtered_results({'rating': rating, 'distance': distance, 'price': price}) == legacy_order
+
 def test_return_filtered_results(return_data_manager):
     '''
     Tests return_filtered_results method to return filtered in-order restaurant_ids
@@ -109,3 +169,187 @@ def test_return_restaurant_information(return_data_manager):
                            {'name': 'applebees2', 'cuisine': 'American', 'rating': '2', 'distance': '2', 'price': '20'},
                            {'name': 'applebees3', 'cuisine': 'American', 'rating': '3', 'distance': '3', 'price': '30'},
                            {'name': 'applebees4', 'cuisine': 'American', 'rating': '4', 'distance': '4', 'price': '40'}]
+
+def test_return_top_results(return_data_manager):
+    '''
+    Tests return_top_results method to return pages of the same ordering as return_filtered_results
+    '''
+    # first page stops early and points at the next ranking position
+    restaurant_ids, next_position = return_data_manager.return_top_results({'name': 'applebees'}, 3)
+    assert restaurant_ids == [0, 1, 2]
+    assert next_position == 3
+    # resuming from the cursor position
+    restaurant_ids, next_position = return_data_manager.return_top_results({'name': 'applebees'}, 3, 3)
+    assert restaurant_ids == [3, 4, 7]
+    # last page
+    restaurant_ids, next_position = return_data_manager.return_top_results({'name': 'applebees'}, 3, 6)
+    assert restaurant_ids == [5]
+    assert next_position is None
+
+def test_return_top_results_matches_filtered_results():
+    '''
+    Tests paging through return_top_results yields exactly the return_filtered_results ordering
+    '''
+    data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+
+    for params in [{}, {'rating': '4', 'distance': '6'}, {'cuisine': 'an', 'price': '30'}, {'name': 'delicious'},
+                   {'sort': 'price'}, {'sort': 'rating,price', 'distance_min': '3', 'price': '30'}]:
+        paged_ids = []
+        next_position = 0
+        while next_position is not None:
+            restaurant_ids, next_position = data_manager.return_top_results(params, 7, next_position)
+            paged_ids.extend(restaurant_ids)
+
+        assert paged_ids == data_manager.return_filtered_results(params)
+
+def test_selective_name_matched_first():
+    '''
+    Tests a rare name is applied before the other filters and gives the same results as a post filter
+    '''
+    data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    assert data_manager.is_selective_name('Hotspot')
+    assert not data_manager.is_selective_name('grill')
+    assert not data_manager.is_selective_name('ch')
+
+    for params in [{'name': 'HotSpot'}, {'name': 'hotspot', 'cuisine': 'an', 'rating': '2'}, {'name': 'grill', 'distance': '4'}]:
+        data_manager.selective_name_ratio = 0.05
+        filtered_results = data_manager.return_filtered_results(params)
+        # forces every name to be a post filter
+        data_manager.selective_name_ratio = -1
+        assert filtered_results == data_manager.return_filtered_results(params)
+        assert filtered_results
+
+def test_upsert_and_delete_restaurants(return_data_manager):
+    '''
+    Tests written restaurants are filtered, ordered and paged like ingested ones
+    '''
+    data_storage = return_data_manager.data_storage
+    # an update replaces the row, a new restaurant is appended
+    assert data_storage.upsert_restaurant('applebees2', {'price': 45}) == 8
+    assert data_storage.upsert_restaurant('olive garden', {'cuisine_id': 1, 'rating': 5, 'distance': 1, 'price': 10}) == 9
+    data_storage.delete_restaurant('applebees1')
+
+    assert return_data_manager.return_filtered_results({'name': 'applebees'}) == [8, 2, 3, 4, 7, 5]
+    assert return_data_manager.return_filtered_results({'price': '35'}) == [9, 2, 5]
+    assert return_data_manager.return_filtered_results({'cuisine': 'american'}) == [9, 8, 2, 3]
+    assert return_data_manager.return_restaurant_information([8]) == [
+        {'name': 'applebees2', 'cuisine': 'American', 'rating': '2', 'distance': '2', 'price': '45'}]
+
+    for params in [{}, {'name': 'applebees'}, {'rating': '2'}, {'sort': 'price,rating'}]:
+        for limit in [1, 2, 3]:
+            paged_ids = []
+            next_position = 0
+            while next_position is not None:
+                restaurant_ids, next_position = return_data_manager.return_top_results(params, limit, next_position)
+                paged_ids.extend(restaurant_ids)
+
+            assert paged_ids == return_data_manager.return_filtered_results(params)
+
+def test_readers_pin_data_version(return_data_manager):
+    '''
+    Tests a reader pinned before a write keeps seeing the data as it was
+    '''
+    data_storage = return_data_manager.data_storage
+    data_storage.upsert_restaurant('applebees2', {'price': 45})
+    data_storage.delete_restaurant('red lobster')
+
+    assert data_storage.data_version == 2
+    assert return_data_manager.return_visible_ids({1, 6, 8}, 0) == {1, 6}
+    assert return_data_manager.return_visible_ids({1, 6, 8}, 1) == {6, 8}
+    assert return_data_manager.return_visible_ids({1, 6, 8}, 2) == {8}
+    matches = return_data_manager.return_match_predicate({'name': 'applebees2'}, 0)
+    assert matches(1) and not matches(8)
+
+def test_return_batch_filtered_results():
+    '''
+    Tests a batch answers every query like a single query while computing shared stages once
+    '''
+    data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    params_list = [{'cuisine': 'an', 'distance': '4', 'rating': rating} for rating in ['1', '2', '3', '4', '5']]
+    params_list += [{'cuisine': 'AN', 'distance': '4', 'rating': '3'}, {'name': 'delicious', 'price': '30'}, {}]
+    expected = [data_manager.return_filtered_results(params) for params in params_list]
+
+    step_count = sum(len(data_manager.return_query_plan(params)) for params in params_list)
+
+    applied_steps = []
+    apply_plan_step = data_manager.apply_plan_step
+    data_manager.apply_plan_step = lambda step, restaurant_ids: applied_steps.append(step) or apply_plan_step(step, restaurant_ids)
+
+    assert data_manager.return_batch_filtered_results(params_list) == expected
+    assert len(applied_steps) < step_count
+
+def test_query_plan(return_data_manager):
+    '''
+    Tests filters run cheapest first, default ranges every restaurant falls in are skipped
+    and explain reports the estimated and actual restaurants left after every step
+    '''
+    params = {'rating': '2', 'cuisine': 'thai', 'name': 'lobster'}
+    plan = return_data_manager.return_query_plan(params)
+    assert [(step.predicate, step.access, step.matching_rows) for step in plan] == [
+        ('name', 'index', 2), ('cuisine', 'scan', 2), ('rating', 'scan', 6)]
+    assert [step.predicate for step in return_data_manager.return_query_plan({'distance': '2'})] == ['distance']
+    assert return_data_manager.return_query_plan({}) == []
+
+    explanation = return_data_manager.explain_query(params)
+    assert [step['actual_rows'] for step in explanation['plan']] == [2, 1, 1]
+    assert explanation['result_rows'] == 1
+    assert return_data_manager.return_filtered_results(params) == [7]
+
+    # steps after one that leaves no restaurants do not run
+    explanation = return_data_manager.explain_query({'cuisine': 'chinese', 'name': 'applebees1'})
+    assert [step['actual_rows'] for step in explanation['plan']] == [1, 0]
+    explanation = return_data_manager.explain_query({'cuisine': 'korean', 'name': 'applebees'})
+    assert [step['actual_rows'] for step in explanation['plan']] == [0, None]
+
+def test_facet_counts(return_data_manager):
+    '''
+    Tests facets count the matching restaurants per value, ordered like the filters rank them
+    '''
+    assert return_data_manager.return_facet_counts({'cuisine': 'american'}) == {
+        'cuisines': {'American': 4},
+        'ratings': {'4': 1, '3': 1, '2': 1, '1': 1},
+        'distances': {'1': 1, '2': 1, '3': 1, '4': 1},
+        'prices': {'10': 1, '20': 1, '30': 1, '40': 1},
+    }
+    facets = return_data_manager.return_facet_counts({'rating': '3'})
+    assert facets['cuisines'] == {'American': 2, 'Chinese': 2, 'Thai': 1}
+    assert facets['ratings'] == {'5': 1, '4': 2, '3': 2}
+    assert return_data_manager.return_facet_counts({'name': 'zzz'}) == {'cuisines': {}, 'ratings': {}, 'distances': {},
+                                                                         'prices': {}}
+
+def test_range_bounds(return_data_manager):
+    '''
+    Tests both ends of the range filters and values between the usual steps
+    '''
+    assert return_data_manager.return_filtered_results({'rating': '3', 'rating_max': '4'}) == [2, 3, 7, 6]
+    assert return_data_manager.return_filtered_results({'price_min': '35', 'price': '45'}) == [3, 7, 5, 6]
+    assert return_data_manager.return_filtered_results({'distance_min': '5'}) == [4, 7, 5, 6]
+    plan = return_data_manager.return_query_plan({'price_min': '35', 'price': '45'})
+    assert [(step.predicate, step.value) for step in plan] == [('price', '35..45')]
+
+    # found by binary search in the sorted stored values, a price of 12 is between the 10 and 15 steps
+    assert return_data_manager.return_price_range('35') == [10, 20, 30, 35]
+    return_data_manager.data_storage.upsert_restaurant('olive garden', {'cuisine_id': 1, 'rating': 5, 'distance': 1, 'price': 12})
+    assert return_data_manager.return_filtered_results({'price': '20'}) == [8, 0, 1]
+    assert return_data_manager.return_filtered_results({'price_min': '11', 'price': '15'}) == [8]
+    assert return_data_manager.return_facet_counts({'price': '15'})['prices'] == {'10': 1, '12': 1}
+
+def test_sort_priority():
+    '''
+    Tests the sort param ranks by its params first, the others follow in the default order
+    '''
+    data_manager = DataManager('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+    assert data_manager.return_sort_priority({'sort': 'Price'}) == ('price', 'distance', 'rating')
+    assert data_manager.return_filtered_results({'sort': 'price'}) == [0, 1, 2, 5, 3, 7, 6, 4]
+    assert data_manager.return_filtered_results({'sort': 'rating,price'}) == [4, 3, 7, 2, 6, 1, 0, 5]
+    assert data_manager.return_filtered_results({'sort': 'rating,price', 'cuisine': 'thai'}) == [7, 5]
+
+    data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    storage = data_manager.data_storage
+    rank_values = {'distance': storage.distance_column.__getitem__, 'rating': lambda id: -storage.rating_column[id],
+                   'price': storage.price_column.__getitem__}
+    for sort in ['price', 'rating', 'price,rating', 'rating,distance', 'distance,price']:
+        priority = data_manager.return_sort_priority({'sort': sort})
+        expected = sorted(range(storage.restaurant_count),
+                          key=lambda id: tuple(rank_values[key](id) for key in priority) + (id,))
+        assert data_manager.return_filtered_results({'sort': sort}) == expected
@@ -1,20 +1,169 @@
 import pytest
-from restaurant_matcher.data_management.data_storage import DataStorage
+from restaurant_matcher.data_management.data_storage import RANK_KEY_ID_MASK, DataStorage, SharedRestaurantName
 
 @pytest.fixture
 def return_data_storage():
     return DataStorage()
 
+def return_index_lists(index):
+    return {value: list(restaurant_ids) for value, restaurant_ids in index.items()}
+
 def test_data_ingestion(return_data_storage):
     '''
     Happy case if all optional parameters are provided, no error logs
     '''
     return_data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
 
-    assert return_data_storage.cuisine_ids == {'1': 'American', '2': 'Chinese', '3': 'Thai'}
-    assert return_data_storage.ratings == {'1': [0, 5], '2': [1], '3': [2, 6], '4': [3, 7], '5': [4]}
-    assert return_data_storage.distances == {'1': [0], '2': [1], '3': [2], '4': [3], '5': [4, 7], '6': [5], '7': [6]}
-    assert return_data_storage.prices == {'10': [0], '20': [1], '30': [2], '40': [3], '50': [4], '35': [5], '45': [6, 7]}
-    assert return_data_storage.cuisines == {'American': [0, 1, 2, 3], 'Chinese': [4, 6], 'Thai': [5, 7]}
-    assert return_data_storage.names == {0: 'applebees1', 1: 'applebees2', 2: 'applebees3', 3: 'applebees4',
-                                         4: 'applebees5', 5: 'applebees6', 6: 'red lobster', 7: 'applebees red lobster'}
+    assert return_data_storage.cuisine_ids == {1: 'American', 2: 'Chinese', 3: 'Thai'}
+    assert return_index_lists(return_data_storage.ratings) == {1: [0, 5], 2: [1], 3: [2, 6], 4: [3, 7], 5: [4]}
+    assert return_index_lists(return_data_storage.distances) == {1: [0], 2: [1], 3: [2], 4: [3], 5: [4, 7], 6: [5], 7: [6]}
+    assert return_index_lists(return_data_storage.prices) == {10: [0], 20: [1], 30: [2], 40: [3], 50: [4], 35: [5], 45: [6, 7]}
+    assert return_index_lists(return_data_storage.cuisines) == {'American': [0, 1, 2, 3], 'Chinese': [4, 6], 'Thai': [5, 7]}
+    assert return_data_storage.names == ['applebees1', 'applebees2', 'applebees3', 'applebees4',
+                                         'applebees5', 'applebees6', 'red lobster', 'applebees red lobster']
+
+def test_typed_columns(return_data_storage):
+    '''
+    Tests restaurant properties are stored as integer columns indexed by restaurant id
+    '''
+    return_data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+
+    assert return_data_storage.rating_column.tolist() == [1, 2, 3, 4, 5, 1, 3, 4]
+    assert return_data_storage.distance_column.tolist() == [1, 2, 3, 4, 5, 6, 7, 5]
+    assert return_data_storage.price_column.tolist() == [10, 20, 30, 40, 50, 35, 45, 45]
+    assert return_data_storage.cuisine_column.tolist() == [1, 1, 1, 1, 2, 3, 2, 3]
+    assert return_data_storage.restaurant_details[7] == {'cuisine_id': '3', 'rating': '4', 'distance': '5', 'price': '45'}
+    # already normalized names are not stored twice
+    assert return_data_storage.normalized_names[6] is return_data_storage.names[6]
+
+def test_bitmaps_built_on_ingestion(return_data_storage):
+    '''
+    Tests every indexed value gets a bitmap with the same restaurant ids as its list
+    '''
+    return_data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+
+    assert return_data_storage.rating_bitmaps == {1: 0b100001, 2: 0b10, 3: 0b1000100, 4: 0b10001000, 5: 0b10000}
+    assert return_data_storage.cuisine_bitmaps == {'American': 0b1111, 'Chinese': 0b1010000, 'Thai': 0b10100000}
+    assert return_data_storage.all_restaurants_bitmap == 0b11111111
+
+def test_rankings_built_on_ingestion(return_data_storage):
+    '''
+    Tests restaurants are ranked closest distance -> highest rating -> cheapest price, ties by id
+    '''
+    return_data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+
+    assert list(return_data_storage.ranked_ids) == [0, 1, 2, 3, 4, 7, 5, 6]
+    assert list(return_data_storage.rank_positions) == [0, 1, 2, 3, 4, 6, 7, 5]
+
+    # other sort priorities are ranked on their first use, the restaurants written since are left out
+    return_data_storage.upsert_restaurant('olive garden', {'cuisine_id': 1, 'rating': 5, 'distance': 1, 'price': 10})
+    ranked_ids, rank_positions = return_data_storage.return_ranking(('price', 'rating', 'distance'))
+    assert list(ranked_ids) == [0, 1, 2, 5, 3, 7, 6, 4]
+    assert list(rank_positions) == [0, 1, 2, 4, 7, 3, 6, 5]
+    assert return_data_storage.return_ranking(('price', 'rating', 'distance'))[0] is ranked_ids
+    assert return_data_storage.return_ranking()[0] is return_data_storage.ranked_ids
+
+def test_name_index_built_on_ingestion(return_data_storage):
+    '''
+    Tests names are normalized once and indexed by their trigrams
+    '''
+    return_data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+
+    assert return_data_storage.normalized_names[6] == 'red lobster'
+    assert list(return_data_storage.name_trigrams['lob']) == [6, 7]
+    assert list(return_data_storage.name_trigrams['es1']) == [0]
+    assert 'es9' not in return_data_storage.name_trigrams
+
+def test_upsert_restaurant(return_data_storage):
+    '''
+    Tests writes append a new row, keep left out values and mark the replaced row deleted
+    '''
+    return_data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+
+    restaurant_id = return_data_storage.upsert_restaurant('red lobster', {'rating': 5})
+    assert restaurant_id == 8
+    assert return_data_storage.restaurant_details[8] == {'cuisine_id': '2', 'rating': '5', 'distance': '7', 'price': '45'}
+    assert list(return_data_storage.ratings[5]) == [4, 8]
+    assert list(return_data_storage.name_trigrams['lob']) == [6, 7, 8]
+    # written restaurants are left out of the bitmaps
+    assert return_data_storage.rating_bitmaps[5] == 0b10000
+    assert return_data_storage.deleted_versions == {6: 1}
+    assert return_data_storage.created_versions == {8: 1}
+
+    # rank keys are kept in write order and sorted by the first reader after a write
+    return_data_storage.upsert_restaurant('applebees9', {'cuisine_id': 1, 'rating': 5, 'distance': 1, 'price': 10})
+    assert [rank_key & RANK_KEY_ID_MASK for rank_key in return_data_storage.extra_rank_keys] == [8, 9]
+    assert [rank_key & RANK_KEY_ID_MASK for rank_key in return_data_storage.return_extra_rank_keys()] == [9, 8]
+
+    return_data_storage.delete_restaurant('red lobster')
+    assert return_data_storage.deleted_versions == {6: 1, 8: 3}
+    assert not return_data_storage.is_visible(8, 3)
+    assert return_data_storage.is_visible(8, 2)
+
+def test_invalid_writes(return_data_storage):
+    '''
+    Tests writes that can not be stored are refused without changing anything
+    '''
+    return_data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+
+    with pytest.raises(ValueError):
+        return_data_storage.upsert_restaurant('olive garden', {'rating': 5})
+    with pytest.raises(ValueError):
+        return_data_storage.upsert_restaurant('applebees1', {'cuisine_id': 9})
+    with pytest.raises(KeyError):
+        return_data_storage.delete_restaurant('olive garden')
+
+    assert return_data_storage.restaurant_count == 8
+    assert return_data_storage.data_version == 0
+
+def test_shared_name_writes(return_data_storage):
+    '''
+    Tests writes to a name several restaurants have are refused, while the other names can still be written
+    '''
+    columns = {'cuisine_id': [1, 1, 2], 'rating': [4, 3, 5], 'distance': [1, 2, 3], 'price': [10, 20, 30]}
+    return_data_storage.ingest_rows({1: 'American', 2: 'Chinese'}, ['olive garden', 'olive garden', 'red lobster'], columns)
+
+    with pytest.raises(SharedRestaurantName):
+        return_data_storage.upsert_restaurant('olive garden', {'rating': 5})
+    with pytest.raises(SharedRestaurantName):
+        return_data_storage.delete_restaurant('olive garden')
+    assert return_data_storage.data_version == 0
+
+    assert return_data_storage.upsert_restaurant('red lobster', {'rating': 1}) == 3
+    return_data_storage.delete_restaurant('red lobster')
+    assert return_data_storage.upsert_restaurant('red lobster', {'cuisine_id': 2, 'rating': 2, 'distance': 1,
+                                                                 'price': 10}) == 4
+
+def test_statistics_kept_up_to_date(return_data_storage):
+    '''
+    Tests the per value restaurant counts are collected at ingest and follow writes
+    '''
+    return_data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+
+    assert return_data_storage.value_counts['cuisine'] == {'American': 4, 'Chinese': 2, 'Thai': 2}
+    assert return_data_storage.value_counts['rating'] == {1: 2, 2: 1, 3: 2, 4: 2, 5: 1}
+    assert return_data_storage.live_restaurant_count == 8
+
+    return_data_storage.upsert_restaurant('red lobster', {'rating': 5})
+    assert return_data_storage.value_counts['rating'] == {1: 2, 2: 1, 3: 1, 4: 2, 5: 2}
+    assert return_data_storage.live_restaurant_count == 8
+
+    return_data_storage.delete_restaurant('red lobster')
+    assert return_data_storage.value_counts['rating'][5] == 1
+    assert return_data_storage.value_counts['cuisine']['Chinese'] == 1
+    assert return_data_storage.live_restaurant_count == 7
+
+def test_sorted_values_kept_up_to_date(return_data_storage):
+    '''
+    Tests the stored values of every range param are sorted at ingest, follow writes and are found by their bounds
+    '''
+    return_data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+
+    assert return_data_storage.sorted_values['price'] == [10, 20, 30, 35, 40, 45, 50]
+    assert return_data_storage.return_values_between('price', 15, 40) == [20, 30, 35, 40]
+    assert return_data_storage.return_values_between('distance', 8, 10) == []
+
+    return_data_storage.upsert_restaurant('olive garden', {'cuisine_id': 1, 'rating': 5, 'distance': 9, 'price': 12})
+    assert return_data_storage.sorted_values['price'] == [10, 12, 20, 30, 35, 40, 45, 50]
+    assert return_data_storage.return_values_between('distance', 8, 10) == [9]
+    assert return_data_storage.sorted_values['rating'] == [1, 2, 3, 4, 5]
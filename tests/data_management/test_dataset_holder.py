@@ -0,0 +1,87 @@
+import os
+import shutil
+import pytest
+from restaurant_matcher.data_management.dataset_holder import DatasetHolder, WritesNotSupported
+
+@pytest.fixture
+def return_csv_paths(tmp_path):
+    cuisine_csv_path = str(tmp_path / 'cuisines.csv')
+    restaurant_csv_path = str(tmp_path / 'restaurants.csv')
+    shutil.copy('tests/fixtures/test_cuisines.csv', cuisine_csv_path)
+    shutil.copy('tests/fixtures/test_restaurants.csv', restaurant_csv_path)
+    return cuisine_csv_path, restaurant_csv_path
+
+def test_snapshot_shared_between_reads(return_csv_paths):
+    '''
+    Tests the dataset is loaded once and the same snapshot is handed to every reader
+    '''
+    dataset_holder = DatasetHolder(*return_csv_paths, check_interval=None)
+
+    assert dataset_holder.current() is dataset_holder.current()
+    assert dataset_holder.current().version == 1
+
+def test_reload_swaps_snapshot(return_csv_paths):
+    '''
+    Tests an admin reload publishes a new version while the old snapshot stays usable
+    '''
+    dataset_holder = DatasetHolder(*return_csv_paths, check_interval=None)
+    old_snapshot = dataset_holder.current()
+
+    new_snapshot = dataset_holder.reload()
+
+    assert new_snapshot.version == 2
+    assert dataset_holder.current() is new_snapshot
+    assert old_snapshot.data_manager.return_filtered_results({'name': 'red lobster'}) == [7, 6]
+
+def test_reload_on_file_change(return_csv_paths):
+    '''
+    Tests a change to the csv files is picked up in the background, the read that notices it gets the current snapshot
+    '''
+    cuisine_csv_path, restaurant_csv_path = return_csv_paths
+    dataset_holder = DatasetHolder(cuisine_csv_path, restaurant_csv_path, check_interval=0)
+    assert dataset_holder.current().version == 1
+
+    with open(restaurant_csv_path, 'a') as write_obj:
+        write_obj.write('olive garden,5,1,10,1\n')
+    stat = os.stat(restaurant_csv_path)
+    os.utime(restaurant_csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    assert dataset_holder.current().version == 1
+    # held by the check until it is done
+    with dataset_holder.reload_lock:
+        pass
+    snapshot = dataset_holder.current()
+    assert snapshot.version == 2
+    assert snapshot.data_manager.return_filtered_results({'name': 'olive'}) == [8]
+
+def test_writes_publish_versions(return_csv_paths):
+    '''
+    Tests every write publishes a new version over the same data and a reload drops the writes
+    '''
+    dataset_holder = DatasetHolder(*return_csv_paths, check_interval=None)
+    data_manager = dataset_holder.current().data_manager
+
+    loaded_snapshot = dataset_holder.current()
+    snapshot = dataset_holder.upsert_restaurant('olive garden', {'cuisine_id': 1, 'rating': 5, 'distance': 1, 'price': 10})
+    assert snapshot.version == 2
+    assert snapshot.data_manager is data_manager
+    assert snapshot.loaded_at == loaded_snapshot.loaded_at
+    assert snapshot.modified_at >= loaded_snapshot.modified_at
+    assert data_manager.return_filtered_results({'name': 'olive'}) == [8]
+
+    assert dataset_holder.delete_restaurant('olive garden').version == 3
+    assert data_manager.return_filtered_results({'name': 'olive'}) == []
+
+    dataset_holder.upsert_restaurant('olive garden', {'cuisine_id': 1, 'rating': 5, 'distance': 1, 'price': 10})
+    assert dataset_holder.reload().data_manager.return_filtered_results({'name': 'olive'}) == []
+
+def test_writes_need_a_writable_engine(return_csv_paths):
+    '''
+    Tests engines that can not be written to refuse writes
+    '''
+    pytest.importorskip('numpy')
+    dataset_holder = DatasetHolder(*return_csv_paths, check_interval=None, engine='columnar')
+
+    with pytest.raises(WritesNotSupported):
+        dataset_holder.delete_restaurant('applebees1')
+    assert dataset_holder.current().version == 1
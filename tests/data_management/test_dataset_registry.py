@@ -0,0 +1,155 @@
+import shutil
+import threading
+import pytest
+from restaurant_matcher.data_management.dataset_holder import DatasetHolder
+from restaurant_matcher.data_management.dataset_registry import DatasetRegistry, estimate_memory
+from restaurant_matcher.match_service.query_cache import QueryCache
+
+@pytest.fixture
+def return_regions_directory(tmp_path):
+    for region in ('nyc', 'sf'):
+        (tmp_path / region).mkdir()
+        shutil.copy('tests/fixtures/test_cuisines.csv', str(tmp_path / region / 'cuisines.csv'))
+        shutil.copy('tests/fixtures/test_restaurants.csv', str(tmp_path / region / 'restaurants.csv'))
+    return str(tmp_path)
+
+@pytest.fixture
+def return_default_dataset_holder():
+    return DatasetHolder('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv', check_interval=None)
+
+def test_lazy_region_load(return_default_dataset_holder, return_regions_directory):
+    '''
+    Tests a region is loaded on its first request only and requests without a region read the default dataset
+    '''
+    dataset_registry = DatasetRegistry(return_default_dataset_holder, return_regions_directory, check_interval=None)
+    assert dataset_registry.stats()['loads'] == 0
+    assert dataset_registry.return_dataset_holder() is return_default_dataset_holder
+
+    dataset_holder = dataset_registry.return_dataset_holder('NYC')
+    assert dataset_registry.return_dataset_holder('nyc') is dataset_holder
+    assert dataset_registry.current('nyc').data_manager.return_filtered_results({'name': 'red lobster'}) == [7, 6]
+    stats = dataset_registry.stats()
+    assert (stats['regions'], stats['loads']) == (['nyc'], 1)
+    assert stats['resident_bytes'] == estimate_memory(dataset_holder.current().data_manager) > 0
+
+def test_unknown_region(return_default_dataset_holder, return_regions_directory):
+    '''
+    Tests regions without files, or whose name is not a plain directory name, are unknown
+    '''
+    dataset_registry = DatasetRegistry(return_default_dataset_holder, return_regions_directory)
+    for region in ['paris', '..', 'nyc/../sf']:
+        with pytest.raises(KeyError):
+            dataset_registry.return_dataset_holder(region)
+    with pytest.raises(KeyError):
+        DatasetRegistry(return_default_dataset_holder).return_dataset_holder('nyc')
+
+def test_concurrent_requests_share_a_load(return_default_dataset_holder, return_regions_directory):
+    '''
+    Tests requests arriving for a region while it loads wait for that load rather than loading it again
+    '''
+    dataset_registry = DatasetRegistry(return_default_dataset_holder, return_regions_directory, check_interval=None)
+    barrier = threading.Barrier(8)
+    dataset_holders = []
+
+    def request_region():
+        barrier.wait()
+        dataset_holders.append(dataset_registry.return_dataset_holder('sf'))
+
+    threads = [threading.Thread(target=request_region) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(dataset_holders) == 8 and all(dataset_holder is dataset_holders[0] for dataset_holder in dataset_holders)
+    assert dataset_registry.stats()['loads'] == 1
+
+def test_eviction(return_default_dataset_holder, return_regions_directory):
+    '''
+    Tests the least recently used regions are evicted past the memory budget and loaded again on their next request
+    '''
+    dataset_registry = DatasetRegistry(return_default_dataset_holder, return_regions_directory, memory_budget=1,
+                                       check_interval=None)
+    nyc_dataset_holder = dataset_registry.return_dataset_holder('nyc')
+    dataset_registry.return_dataset_holder('sf')
+
+    stats = dataset_registry.stats()
+    assert (stats['regions'], stats['evictions']) == (['sf'], 1)
+    # requests still holding the evicted dataset keep reading it
+    assert nyc_dataset_holder.current().data_manager.return_filtered_results({'name': 'red lobster'}) == [7, 6]
+    assert dataset_registry.return_dataset_holder('nyc') is not nyc_dataset_holder
+    assert dataset_registry.stats()['loads'] == 3
+    assert dataset_registry.return_dataset_holder() is return_default_dataset_holder
+
+def test_written_regions_not_evicted(return_default_dataset_holder, return_regions_directory):
+    '''
+    Tests a region holding writes stays loaded past the memory budget until a reload drops its writes
+    '''
+    dataset_registry = DatasetRegistry(return_default_dataset_holder, return_regions_directory, memory_budget=1,
+                                       check_interval=None)
+    nyc_dataset_holder = dataset_registry.return_dataset_holder('nyc')
+    nyc_dataset_holder.upsert_restaurant('olive garden', {'cuisine_id': 1, 'rating': 5, 'distance': 1, 'price': 10})
+    dataset_registry.return_dataset_holder('sf')
+
+    stats = dataset_registry.stats()
+    assert (stats['regions'], stats['evictions'], stats['pinned_regions']) == (['nyc', 'sf'], 0, 1)
+    # the most recently used region always stays, the unwritten one is evicted once it is not
+    assert dataset_registry.return_dataset_holder('nyc') is nyc_dataset_holder
+    assert dataset_registry.stats()['regions'] == ['nyc']
+
+    nyc_dataset_holder.reload()
+    dataset_registry.return_dataset_holder('sf')
+    stats = dataset_registry.stats()
+    assert (stats['regions'], stats['evictions'], stats['pinned_regions']) == (['sf'], 2, 0)
+
+def test_reloaded_region_continues_versions(return_default_dataset_holder, return_regions_directory):
+    '''
+    Tests a region loaded again after its eviction gets versions past the evicted ones,
+    so results cached for the evicted dataset are not served for the new one
+    '''
+    dataset_registry = DatasetRegistry(return_default_dataset_holder, return_regions_directory, memory_budget=0,
+                                       check_interval=None)
+    query_cache = QueryCache()
+    nyc_dataset_holder = dataset_registry.return_dataset_holder('nyc')
+    for _ in range(3):
+        nyc_dataset_holder.reload()
+    snapshot = dataset_registry.current('nyc')
+    assert snapshot.version == 4
+    query_cache.put(snapshot.version, ('name', 'x'), [7, 6], 'nyc')
+
+    dataset_registry.return_dataset_holder('sf')
+    snapshot = dataset_registry.current('nyc')
+    assert snapshot.version == 5
+    assert query_cache.get(snapshot.version, ('name', 'x'), 'nyc') is None
+    query_cache.put(snapshot.version, ('name', 'x'), [], 'nyc')
+    assert query_cache.get(snapshot.version, ('name', 'x'), 'nyc') == []
+
+def test_failed_load(return_default_dataset_holder, return_regions_directory, tmp_path):
+    '''
+    Tests a region whose files can not be loaded fails its request and is tried again by the next one
+    '''
+    with open(str(tmp_path / 'nyc' / 'cuisines.csv'), 'w') as write_obj:
+        write_obj.write('not,a,cuisines,header\n1,2,3,4\n')
+    dataset_registry = DatasetRegistry(return_default_dataset_holder, return_regions_directory)
+
+    for failures in (1, 2):
+        with pytest.raises(RuntimeError):
+            dataset_registry.return_dataset_holder('nyc')
+        assert dataset_registry.stats()['load_failures'] == failures
+    assert dataset_registry.stats()['regions'] == []
+
+def test_reload(return_default_dataset_holder, return_regions_directory, tmp_path):
+    '''
+    Tests reloading a region that is not loaded yet loads it once, and a loaded region whose files
+    no longer load keeps its previous snapshot
+    '''
+    dataset_registry = DatasetRegistry(return_default_dataset_holder, return_regions_directory, check_interval=None)
+    assert dataset_registry.reload('nyc').version == 1
+    assert dataset_registry.stats()['loads'] == 1
+    assert dataset_registry.reload('nyc').version == 2
+
+    with open(str(tmp_path / 'nyc' / 'cuisines.csv'), 'w') as write_obj:
+        write_obj.write('not,a,cuisines,header\n1,2,3,4\n')
+    with pytest.raises(RuntimeError):
+        dataset_registry.reload('nyc')
+    assert dataset_registry.current('nyc').version == 2
@@ -0,0 +1,39 @@
+import json
+import pytest
+from restaurant_matcher.data_management.data_manager import DataManager
+
+@pytest.fixture
+def return_data_manager():
+    return DataManager('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+
+def test_fragments_match_restaurant_information(return_data_manager):
+    '''
+    Tests joined fragments are byte for byte the json of return_restaurant_information
+    '''
+    restaurant_ids = return_data_manager.return_filtered_results({})
+    expected = json.dumps(return_data_manager.return_restaurant_information(restaurant_ids)).encode()
+
+    assert return_data_manager.return_restaurant_json(restaurant_ids) == expected
+    assert return_data_manager.return_restaurant_json([]) == b'[]'
+
+def test_fields_projection(return_data_manager):
+    '''
+    Tests a projection keeps only the requested fields
+    '''
+    assert return_data_manager.return_restaurant_json([6, 0], ('name', 'price')) == \
+        b'[{"name": "red lobster", "price": "45"}, {"name": "applebees1", "price": "10"}]'
+    assert return_data_manager.return_restaurant_json([4], ('cuisine', 'rating')) == b'[{"cuisine": "Chinese", "rating": "5"}]'
+
+def test_fragments_of_written_restaurants(return_data_manager):
+    '''
+    Tests restaurants written after the fragments were built are encoded when requested
+    '''
+    return_data_manager.build_restaurant_fragments()
+    return_data_manager.data_storage.upsert_restaurant('olive "garden"', {'cuisine_id': 3, 'rating': 5, 'distance': 1, 'price': 10})
+
+    restaurant_ids = return_data_manager.return_filtered_results({'rating': '5'})
+    assert restaurant_ids == [8, 4]
+    expected = json.dumps(return_data_manager.return_restaurant_information(restaurant_ids)).encode()
+    assert return_data_manager.return_restaurant_json(restaurant_ids) == expected
+    assert return_data_manager.return_restaurant_json(restaurant_ids, ('name',)) == \
+        b'[{"name": "olive \\"garden\\""}, {"name": "applebees5"}]'
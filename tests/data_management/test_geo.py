@@ -0,0 +1,208 @@
+import json
+import random
+import pytest
+from restaurant_matcher.data_management.data_manager import DataManager
+from restaurant_matcher.data_management.data_storage import DataStorage
+from restaurant_matcher.data_management.engines import DATA_MANAGER_ENGINES
+from restaurant_matcher.data_management.geo import (MICRODEGREES, MISSING_COORDINATE, parse_coordinate, return_distance_km,
+                                                    return_distance_unit)
+from restaurant_matcher.data_management.snapshot import main
+
+UNION_SQUARE = {'lat': '40.7359', 'lng': '-73.9911'}
+
+@pytest.fixture
+def return_data_manager():
+    return DataManager('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_geo_restaurants.csv')
+
+def return_names(data_manager, restaurant_ids):
+    return [data_manager.data_storage.names[id] for id in restaurant_ids]
+
+def return_scanned_results(data_manager, params):
+    '''
+    Ranks every located restaurant without the grid, the answer a located query must give
+    '''
+    storage = data_manager.data_storage
+    latitude, longitude = float(params['lat']), float(params['lng'])
+    radius = data_manager.return_geo_radius(params)
+    matches = data_manager.return_match_predicate(params)
+    priority = data_manager.return_sort_priority(params)
+    rank_keys = []
+    for id in range(storage.restaurant_count):
+        if storage.latitude_column[id] == MISSING_COORDINATE or not matches(id):
+            continue
+        distance = return_distance_km(latitude, longitude, storage.latitude_column[id] / MICRODEGREES,
+                                      storage.longitude_column[id] / MICRODEGREES)
+        if radius is None or distance <= radius:
+            values = {'distance': return_distance_unit(distance), 'rating': -storage.rating_column[id],
+                      'price': storage.price_column[id]}
+            rank_keys.append(tuple(values[key] for key in priority) + (id,))
+
+    return [rank_key[-1] for rank_key in sorted(rank_keys)]
+
+def test_parse_coordinate():
+    '''
+    Tests coordinates are stored in microdegrees and blank ones as missing
+    '''
+    assert parse_coordinate('latitude', '40.735863') == 40735863
+    assert parse_coordinate('longitude', -73.991084) == -73991084
+    assert parse_coordinate('latitude', ' ') == MISSING_COORDINATE
+    for key, text in [('latitude', '90.5'), ('longitude', '-181'), ('latitude', 'north'), ('latitude', 'nan')]:
+        with pytest.raises(ValueError):
+            parse_coordinate(key, text)
+
+def test_distance():
+    '''
+    Tests the haversine distance and its rounding to ranking units
+    '''
+    assert return_distance_km(0, 0, 0, 1) == pytest.approx(111.195, abs=0.001)
+    assert return_distance_km(40.7359, -73.9911, 40.7359, -73.9911) == 0
+    assert [return_distance_unit(distance) for distance in (0, 0.2, 1, 1.01, 7.5)] == [1, 1, 1, 2, 8]
+
+def test_geo_ingestion(return_data_manager):
+    '''
+    Tests coordinates are ingested into their own columns and only located restaurants are in the grid
+    '''
+    storage = return_data_manager.data_storage
+    assert storage.latitude_column[0] == 40735863
+    assert storage.longitude_column[8] == MISSING_COORDINATE
+    assert storage.geo_grid.restaurant_count == 9
+    # coordinates are not part of a response
+    assert set(storage.restaurant_details[0]) == {'cuisine_id', 'rating', 'distance', 'price'}
+
+    data_storage = DataStorage()
+    data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+    assert data_storage.geo_grid.restaurant_count == 0
+    assert DataManager(data_storage=data_storage).return_filtered_results(UNION_SQUARE) == []
+
+def test_located_query(return_data_manager):
+    '''
+    Tests a located query ranks by the computed distance, then rating and price, and applies the radius and filters
+    '''
+    restaurant_ids = return_data_manager.return_filtered_results(dict(UNION_SQUARE, radius='2'))
+    assert return_names(return_data_manager, restaurant_ids) == [
+        'flatiron grill', 'noodle bar', 'union square diner', 'thai garden', 'chelsea wok', 'soho thai']
+
+    restaurant_ids = return_data_manager.return_filtered_results(dict(UNION_SQUARE, distance='1', rating='4'))
+    assert return_names(return_data_manager, restaurant_ids) == ['flatiron grill', 'noodle bar']
+    restaurant_ids = return_data_manager.return_filtered_results(dict(UNION_SQUARE, cuisine='thai'))
+    assert return_names(return_data_manager, restaurant_ids) == ['thai garden', 'soho thai']
+
+def test_located_distances(return_data_manager):
+    '''
+    Tests the restaurants of a located query are sent with the distance computed from the location, not the csv one
+    '''
+    location = (float(UNION_SQUARE['lat']), float(UNION_SQUARE['lng']))
+    restaurant_ids = return_data_manager.return_filtered_results(dict(UNION_SQUARE, radius='1'))
+    restaurants = return_data_manager.return_restaurant_information(restaurant_ids, location)
+
+    assert [restaurant['distance'] for restaurant in restaurants] == ['0.59', '0.43', '0.00', '0.90']
+    assert return_data_manager.return_restaurant_json(restaurant_ids, location=location) == json.dumps(restaurants).encode()
+    assert return_data_manager.return_restaurant_json(restaurant_ids[:1], ('name', 'distance'), location) == \
+        b'[{"name": "flatiron grill", "distance": "0.59"}]'
+    assert return_data_manager.return_restaurant_json(restaurant_ids[:1], ('price',), location) == b'[{"price": "40"}]'
+
+def test_grid_matches_scan():
+    '''
+    Tests the grid lookups return exactly what ranking every located restaurant would, for radius and k-nearest queries
+    '''
+    randomizer = random.Random(3)
+    names, columns = [], {'cuisine_id': [], 'rating': [], 'distance': [], 'price': [], 'latitude': [], 'longitude': []}
+    for index in range(3000):
+        names.append(f'restaurant {index}')
+        columns['cuisine_id'].append(randomizer.randint(1, 3))
+        columns['rating'].append(randomizer.randint(1, 5))
+        columns['distance'].append(randomizer.randint(1, 10))
+        columns['price'].append(randomizer.choice(range(10, 55, 5)))
+        located = randomizer.random() < 0.95
+        columns['latitude'].append(round(randomizer.uniform(40.6, 40.9) * MICRODEGREES) if located else MISSING_COORDINATE)
+        columns['longitude'].append(round(randomizer.uniform(-74.1, -73.8) * MICRODEGREES) if located else MISSING_COORDINATE)
+    data_storage = DataStorage()
+    data_storage.ingest_rows({1: 'American', 2: 'Chinese', 3: 'Thai'}, names, columns)
+    data_manager = DataManager(data_storage=data_storage)
+
+    for _ in range(20):
+        params = {'lat': str(randomizer.uniform(40.55, 40.95)), 'lng': str(randomizer.uniform(-74.15, -73.75))}
+        for extra_params in [{}, {'radius': '1.5'}, {'distance': '3', 'rating': '4'}, {'radius': '0.4', 'cuisine': 'thai'},
+                             {'radius': '2', 'sort': 'rating,price'}]:
+            query = dict(params, **extra_params)
+            scanned_ids = return_scanned_results(data_manager, query)
+            assert data_manager.return_filtered_results(query) == scanned_ids
+            for limit in (1, 10):
+                assert data_manager.return_geo_results(query, limit) == scanned_ids[:limit]
+                page_ids, next_position = data_manager.return_top_results(query, limit, 5)
+                assert page_ids == scanned_ids[5:5 + limit]
+                assert (next_position is not None) == (len(scanned_ids) >= 5 + limit)
+
+def test_located_writes(return_data_manager):
+    '''
+    Tests written restaurants are found at their new location and keep their location on updates
+    '''
+    storage = return_data_manager.data_storage
+    storage.upsert_restaurant('corner deli', {'cuisine_id': 1, 'rating': 5, 'distance': 9, 'price': 10,
+                                              'latitude': 40735900, 'longitude': -73991100})
+    storage.upsert_restaurant('union square diner', {'rating': 1})
+    storage.upsert_restaurant('unlocated bistro', {'cuisine_id': 1, 'rating': 5, 'distance': 1, 'price': 10})
+
+    restaurant_ids = return_data_manager.return_filtered_results(dict(UNION_SQUARE, distance='1'))
+    assert return_names(return_data_manager, restaurant_ids) == ['corner deli', 'flatiron grill', 'noodle bar',
+                                                                 'thai garden', 'union square diner']
+    assert storage.latitude_column[restaurant_ids[-1]] == 40735863
+
+def test_geo_engines(tmp_path):
+    '''
+    Tests every engine answers located queries, from csv files and from a snapshot
+    '''
+    snapshot_path = str(tmp_path / 'test.snapshot')
+    main(['tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_geo_restaurants.csv', snapshot_path, '--quiet'])
+    expected_data_manager = DataManager('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_geo_restaurants.csv')
+    queries = [UNION_SQUARE, dict(UNION_SQUARE, radius='3', price='30'), dict(UNION_SQUARE, name='thai')]
+
+    for engine, data_manager_class in DATA_MANAGER_ENGINES.items():
+        if engine == 'sharded':
+            continue
+        data_manager = data_manager_class(snapshot_path=snapshot_path)
+        for query in queries:
+            expected_ids = expected_data_manager.return_filtered_results(query)
+            assert data_manager.return_filtered_results(query) == expected_ids
+            assert data_manager.return_top_results(query, 2)[0] == expected_ids[:2]
+            assert data_manager.explain_query(query)['result_rows'] == len(expected_ids)
+
+def test_snapshot_geo_grid(tmp_path, monkeypatch):
+    '''
+    Tests a snapshot stores the grid, so loading it maps the cells instead of bucketing every restaurant again,
+    and a write to the loaded storage is still indexed in the grid
+    '''
+    snapshot_path = str(tmp_path / 'test.snapshot')
+    main(['tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_geo_restaurants.csv', snapshot_path, '--quiet'])
+    data_storage = DataStorage()
+    data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_geo_restaurants.csv')
+    monkeypatch.setattr(DataStorage, 'build_geo_index', None)
+    snapshot_storage = DataStorage()
+    snapshot_storage.load_snapshot(snapshot_path)
+
+    grid, snapshot_grid = data_storage.geo_grid, snapshot_storage.geo_grid
+    assert {cell: list(ids) for cell, ids in snapshot_grid.cells.items()} == {cell: list(ids) for cell, ids in grid.cells.items()}
+    assert (snapshot_grid.restaurant_count, snapshot_grid.row_bounds, snapshot_grid.column_bounds) == \
+        (grid.restaurant_count, grid.row_bounds, grid.column_bounds)
+
+    restaurant_id = snapshot_storage.upsert_restaurant('new deli', {'cuisine_id': 1, 'rating': 4, 'distance': 1, 'price': 10,
+                                                                    'latitude': 40735900, 'longitude': -73991100})
+    assert restaurant_id in snapshot_grid.cells[snapshot_grid.return_cell(40.7359, -73.9911)]
+
+def test_explain_located_query(return_data_manager):
+    '''
+    Tests a located query is explained as a grid read followed by the other filters
+    '''
+    explanation = return_data_manager.explain_query(dict(UNION_SQUARE, radius='2', rating='4'))
+
+    assert [(step['predicate'], step['access']) for step in explanation['plan']] == [('geo', 'grid'), ('rating', 'scan')]
+    assert [step['actual_rows'] for step in explanation['plan']] == [6, 4]
+    assert explanation['result_rows'] == 4
+
+def test_located_facet_counts(return_data_manager):
+    '''
+    Tests facets of a located query count the distances computed from the location
+    '''
+    facets = return_data_manager.return_facet_counts(dict(UNION_SQUARE, radius='2'))
+    assert facets['distances'] == {'1': 4, '2': 2}
+    assert sum(facets['cuisines'].values()) == 6
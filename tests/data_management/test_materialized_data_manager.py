@@ -0,0 +1,78 @@
+import itertools
+import pytest
+from restaurant_matcher.data_management.data_manager import DataManager
+from restaurant_matcher.data_management.materialized_data_manager import MaterializedDataManager
+
+@pytest.fixture
+def return_materialized_data_manager():
+    return MaterializedDataManager('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+
+def test_answer_table_built_on_load(return_materialized_data_manager):
+    '''
+    Tests every restaurant is stored in the one run of its exact values, shared across distances and answers,
+    and the build is reported
+    '''
+    data_manager = return_materialized_data_manager
+    # rank positions of the restaurants within each stored distance 1, 2, 3 ... 7
+    positions, distance_ends = data_manager.runs[('Chinese', 3, 45)]
+    assert (list(positions), list(distance_ends)) == ([7], [0, 0, 0, 0, 0, 0, 1])
+    assert len(data_manager.answer_runs[(None, 3, 50)]) == 5
+    assert data_manager.answer_runs[('Thai', 1, 35)] == [data_manager.runs[('Thai', 1, 35)]]
+    assert data_manager.return_answer(data_manager.return_answer_slices({'rating': '3', 'price': '50'})) == [2, 3, 4, 7, 6]
+
+    report = data_manager.answer_table_report
+    # only the stored values are combined, no restaurant costs 15 or 25
+    assert report.combinations == 4 * 5 * 7 * 7
+    assert report.stored_ids == data_manager.data_storage.restaurant_count
+    assert report.table_bytes > 0
+
+def test_return_filtered_results(return_materialized_data_manager):
+    '''
+    Tests lookups, names checked against an answer and params outside the table
+    '''
+    data_manager = return_materialized_data_manager
+    assert data_manager.return_filtered_results({'rating': '3', 'distance': '5'}) == [2, 3, 4, 7]
+    assert data_manager.return_filtered_results({'cuisine': 'an', 'price': '34'}) == [0, 1, 2]
+    assert data_manager.return_filtered_results({'name': 'applebees', 'rating': '2', 'price': '35',
+                                                 'cuisine': 'american'}) == [1, 2]
+    # past the lowest stored rating and price
+    assert data_manager.return_filtered_results({'rating': '0', 'distance': '1'}) == [0]
+    assert data_manager.return_filtered_results({'price': '5'}) == []
+
+def test_matches_list_engine():
+    '''
+    Tests the materialized engine returns and pages exactly like the list engine on the full fixture data
+    '''
+    list_data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    materialized_data_manager = MaterializedDataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    # a restaurant is stored once however many answers it is part of
+    assert materialized_data_manager.answer_table_report.stored_ids <= materialized_data_manager.data_storage.restaurant_count
+
+    for rating, distance, price, cuisine, name, extra_params in itertools.product(
+            [None, '1', '4'], [None, '3', '10'], [None, '25', '55'], [None, 'an', 'Klingon'], [None, 'grill', 'hotspot'],
+            [{}, {'sort': 'price'}, {'price_min': '20', 'rating_max': '4'}]):
+        params = {key: value for key, value in [('rating', rating), ('distance', distance), ('price', price),
+                                                ('cuisine', cuisine), ('name', name)] if value}
+        # filtered like the list engine, the table only holds the default ranking and ranges open at one end
+        params.update(extra_params)
+
+        expected = list_data_manager.return_filtered_results(params)
+        assert materialized_data_manager.return_filtered_results(params) == expected
+        paged_ids = []
+        next_position = 0
+        while next_position is not None:
+            page = materialized_data_manager.return_top_results(params, 3, next_position)
+            assert page == list_data_manager.return_top_results(params, 3, next_position)
+            restaurant_ids, next_position = page
+            paged_ids.extend(restaurant_ids)
+        assert paged_ids == expected
+
+def test_explain_query(return_materialized_data_manager):
+    '''
+    Tests explain reports the lookup and the name checked against its answer
+    '''
+    explanation = return_materialized_data_manager.explain_query({'cuisine': 'american', 'rating': '3', 'name': 'bees'})
+
+    assert [(step['predicate'], step['access']) for step in explanation['plan']] == [
+        ('cuisine', 'lookup'), ('distance', 'lookup'), ('rating', 'lookup'), ('price', 'lookup'), ('name', 'scan')]
+    assert [step['actual_rows'] for step in explanation['plan']] == [2, 2, 2, 2, 2]
@@ -0,0 +1,50 @@
+import itertools
+import pytest
+from restaurant_matcher.data_management.data_manager import DataManager
+from restaurant_matcher.data_management.sharded_data_manager import ShardedDataManager
+
+@pytest.fixture(scope="module")
+def return_sharded_data_manager():
+    return ShardedDataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv', shard_count=3)
+
+def test_shards_partition_ids(return_sharded_data_manager):
+    '''
+    Tests the shards split the restaurant ids into contiguous ranges
+    '''
+    data_manager = return_sharded_data_manager
+    assert data_manager.shard_count == 3
+    assert data_manager.shard_starts == [0, 66, 133, 200]
+
+def test_matches_list_engine(return_sharded_data_manager):
+    '''
+    Tests the merged shard results and pages are exactly those of the list engine
+    '''
+    list_data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    sharded_data_manager = return_sharded_data_manager
+
+    for rating, distance, price, cuisine, name, extra_params in itertools.product(
+            [None, '1', '4'], [None, '3', '10'], [None, '25'], [None, 'an'], [None, 'grill', 'zzz'],
+            [{}, {'sort': 'rating'}, {'distance_min': '2', 'rating_max': '4'}]):
+        params = {key: value for key, value in [('rating', rating), ('distance', distance), ('price', price),
+                                                ('cuisine', cuisine), ('name', name)] if value}
+        params.update(extra_params)
+
+        expected = list_data_manager.return_filtered_results(params)
+        assert sharded_data_manager.return_filtered_results(params) == expected
+        assert sharded_data_manager.return_facet_counts(params) == list_data_manager.return_facet_counts(params)
+        paged_ids = []
+        next_position = 0
+        while next_position is not None:
+            page = sharded_data_manager.return_top_results(params, 7, next_position)
+            assert page == list_data_manager.return_top_results(params, 7, next_position)
+            restaurant_ids, next_position = page
+            paged_ids.extend(restaurant_ids)
+        assert paged_ids == expected
+
+def test_explain_query(return_sharded_data_manager):
+    '''
+    Tests explain runs on the whole dataset held by the coordinator
+    '''
+    explanation = return_sharded_data_manager.explain_query({'cuisine': 'chinese', 'rating': '4'})
+    assert explanation['result_rows'] == len(return_sharded_data_manager.return_filtered_results({'cuisine': 'chinese',
+                                                                                                 'rating': '4'}))
@@ -0,0 +1,87 @@
+import itertools
+import pytest
+from restaurant_matcher.data_management.data_manager import DataManager
+from restaurant_matcher.data_management.data_storage import DataStorage
+from restaurant_matcher.data_management.engines import DATA_MANAGER_ENGINES
+from restaurant_matcher.data_management.snapshot import main, read_snapshot
+
+def return_index_lists(index):
+    return {value: list(restaurant_ids) for value, restaurant_ids in index.items()}
+
+@pytest.fixture
+def return_snapshot_path(tmp_path):
+    snapshot_path = str(tmp_path / 'test.snapshot')
+    main(['tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv', snapshot_path])
+    return snapshot_path
+
+def test_load_snapshot(return_snapshot_path):
+    '''
+    Tests a loaded snapshot holds the same data as a csv ingest
+    '''
+    data_storage = DataStorage()
+    data_storage.ingest('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv')
+    snapshot_storage = DataStorage()
+    snapshot_storage.load_snapshot(return_snapshot_path)
+
+    assert snapshot_storage.restaurant_count == 8
+    assert snapshot_storage.cuisine_ids == data_storage.cuisine_ids
+    for attribute in ['cuisines', 'ratings', 'distances', 'prices', 'name_trigrams']:
+        assert return_index_lists(getattr(snapshot_storage, attribute)) == return_index_lists(getattr(data_storage, attribute))
+    for attribute in ['cuisine_bitmaps', 'rating_bitmaps', 'distance_bitmaps', 'price_bitmaps', 'all_restaurants_bitmap']:
+        assert getattr(snapshot_storage, attribute) == getattr(data_storage, attribute)
+    assert list(snapshot_storage.names.values()) == data_storage.names
+    assert list(snapshot_storage.normalized_names.values()) == data_storage.normalized_names
+    assert dict(snapshot_storage.restaurant_details) == dict(data_storage.restaurant_details)
+    for column in ['cuisine_column', 'rating_column', 'distance_column', 'price_column']:
+        assert getattr(snapshot_storage, column).tolist() == getattr(data_storage, column).tolist()
+    assert list(snapshot_storage.ranked_ids) == list(data_storage.ranked_ids)
+    assert list(snapshot_storage.rank_positions) == list(data_storage.rank_positions)
+
+def test_invalid_snapshot(tmp_path):
+    '''
+    Tests files that are not snapshots are rejected
+    '''
+    not_a_snapshot = tmp_path / 'restaurants.csv'
+    not_a_snapshot.write_bytes(b'name,customer_rating,distance,price,cuisine_id\n')
+
+    with pytest.raises(ValueError):
+        read_snapshot(str(not_a_snapshot))
+
+def test_engines_match_on_snapshot(tmp_path):
+    '''
+    Tests every engine returns the same results from a snapshot as from the csv files
+    '''
+    snapshot_path = str(tmp_path / 'fixtures.snapshot')
+    main(['fixtures/cuisines.csv', 'fixtures/restaurants.csv', snapshot_path])
+
+    list_data_manager = DataManager('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+    for engine in DATA_MANAGER_ENGINES.values():
+        csv_data_manager = engine('fixtures/cuisines.csv', 'fixtures/restaurants.csv')
+        snapshot_data_manager = engine(snapshot_path=snapshot_path)
+
+        for rating, distance, cuisine, name in itertools.product(['1', '4'], ['3', '10'], [None, 'an'], [None, 'grill', 'hotspot']):
+            params = {'rating': rating, 'distance': distance}
+            if cuisine:
+                params['cuisine'] = cuisine
+            if name:
+                params['name'] = name
+
+            expected = csv_data_manager.return_filtered_results(params)
+            assert snapshot_data_manager.return_filtered_results(params) == expected
+            assert snapshot_data_manager.return_top_results(params, 5) == csv_data_manager.return_top_results(params, 5)
+            assert snapshot_data_manager.return_restaurant_information(expected) == csv_data_manager.return_restaurant_information(expected)
+            # every engine counts its own way
+            assert snapshot_data_manager.return_facet_counts(params) == list_data_manager.return_facet_counts(params)
+
+def test_write_to_loaded_snapshot(return_snapshot_path):
+    '''
+    Tests a storage loaded from a snapshot copies its data out of the mapped file on the first write
+    '''
+    data_storage = DataStorage()
+    data_storage.load_snapshot(return_snapshot_path)
+
+    assert data_storage.upsert_restaurant('red lobster', {'price': 20}) == 8
+    assert data_storage.names[8] == 'red lobster'
+    assert data_storage.price_column.tolist() == [10, 20, 30, 40, 50, 35, 45, 45, 20]
+    assert list(data_storage.prices[20]) == [1, 8]
+    assert data_storage.deleted_versions == {6: 1}
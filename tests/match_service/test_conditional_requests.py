@@ -0,0 +1,27 @@
+from restaurant_matcher.data_management.dataset_holder import DatasetSnapshot
+from restaurant_matcher.match_service.conditional_requests import make_etag, return_cache_headers
+
+SNAPSHOT = DatasetSnapshot(1, None, 1700000000.0, 1700000000.0)
+
+def test_make_etag():
+    '''
+    Tests equivalent queries against a snapshot share a tag, while another query, write or load does not
+    '''
+    etag = make_etag(SNAPSHOT, {'cuisine': 'Thai', 'rating': 3})
+
+    assert make_etag(SNAPSHOT, {'rating': 3, 'cuisine': 'thai'}) == etag
+    assert make_etag(SNAPSHOT, {'cuisine': 'Thai', 'rating': 3, 'limit': 5}) != etag
+    assert make_etag(SNAPSHOT._replace(version=2), {'cuisine': 'Thai', 'rating': 3}) != etag
+    assert make_etag(SNAPSHOT._replace(loaded_at=1700000001.0), {'cuisine': 'Thai', 'rating': 3}) != etag
+
+def test_cache_headers():
+    '''
+    Tests the validators and freshness lifetime sent with a response
+    '''
+    headers = return_cache_headers(SNAPSHOT._replace(modified_at=1700000060.5), 'abc', max_age=30)
+
+    assert headers == {
+        'ETag': '"abc"',
+        'Cache-Control': 'public, max-age=30',
+        'Last-Modified': 'Tue, 14 Nov 2023 22:14:20 GMT',
+    }
@@ -0,0 +1,74 @@
+import logging
+
+import pytest
+from restaurant_matcher.data_management.dataset_registry import DatasetRegistry
+from restaurant_matcher.match_service.metrics import Histogram, Metrics, StageTimer
+from restaurant_matcher.match_service.query_cache import QueryCache
+
+@pytest.fixture
+def return_metrics():
+    return Metrics(slow_query_seconds=None)
+
+def test_stage_timer():
+    '''
+    Tests every mark closes the stage since the previous mark and repeated stages add up
+    '''
+    stage_timer = StageTimer()
+    stage_timer.mark("validate")
+    stage_timer.mark("filter")
+    stage_timer.mark("filter")
+
+    assert list(stage_timer.stages) == ["validate", "filter"]
+    assert sum(stage_timer.stages.values()) <= stage_timer.return_elapsed()
+
+def test_histogram_buckets():
+    '''
+    Tests buckets are rendered cumulative with a value on a bound counted in that bound's bucket
+    '''
+    histogram = Histogram((1, 10))
+    for value in (0, 1, 5, 50):
+        histogram.observe(value)
+
+    assert histogram.render('sizes', 'endpoint="search"') == [
+        'sizes_bucket{endpoint="search",le="1"} 2',
+        'sizes_bucket{endpoint="search",le="10"} 3',
+        'sizes_bucket{endpoint="search",le="+Inf"} 4',
+        'sizes_sum{endpoint="search"} 56',
+        'sizes_count{endpoint="search"} 4',
+    ]
+
+def test_render(return_metrics):
+    '''
+    Tests requests, stages, result sizes and cache counters are exported
+    '''
+    stage_timer = StageTimer()
+    stage_timer.mark("validate")
+    stage_timer.mark("filter")
+    return_metrics.record_request("search", stage_timer, "ok", 3)
+    return_metrics.record_request("search", StageTimer(), "invalid")
+    query_cache = QueryCache()
+    query_cache.get(1, ('a',))
+
+    page = return_metrics.render(query_cache, DatasetRegistry(None))
+    assert 'match_service_requests_total{endpoint="search",outcome="ok"} 1' in page
+    assert 'match_service_requests_total{endpoint="search",outcome="invalid"} 1' in page
+    assert 'match_service_request_seconds_count{endpoint="search"} 2' in page
+    assert 'match_service_stage_seconds_count{endpoint="search",stage="filter"} 1' in page
+    assert 'match_service_result_restaurants_sum{endpoint="search"} 3' in page
+    assert 'match_service_cache_misses_total 1' in page
+    assert 'match_service_cache_entries 0' in page
+    assert 'match_service_regions_loads_total 0' in page
+    assert 'match_service_regions_resident_bytes 0' in page
+
+def test_slow_query_log(caplog):
+    '''
+    Tests requests over the threshold are logged with their params and stage breakdown
+    '''
+    metrics = Metrics(slow_query_seconds=0)
+    stage_timer = StageTimer()
+    stage_timer.mark("filter")
+    with caplog.at_level(logging.WARNING):
+        metrics.record_request("search", stage_timer, "ok", 0, {"name": "chow"})
+
+    assert "filter=" in caplog.text and "'name': 'chow'" in caplog.text
+    assert 'match_service_slow_queries_total 1' in metrics.render()
@@ -0,0 +1,17 @@
+import pytest
+from restaurant_matcher.match_service.pagination import decode_cursor, encode_cursor
+
+def test_cursor_round_trip():
+    '''
+    Tests a cursor decodes back to the ranking position it was made from
+    '''
+    for rank_position in [0, 10, 123456]:
+        assert decode_cursor(encode_cursor(rank_position)) == rank_position
+
+def test_invalid_cursor():
+    '''
+    Tests cursors not made by encode_cursor are rejected
+    '''
+    for cursor in ['', 'not a cursor', 'cmFuazo=', 'MTA=']:
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
@@ -0,0 +1,67 @@
+import pytest
+from restaurant_matcher.match_service.query_cache import QueryCache
+
+@pytest.fixture
+def return_query_cache():
+    return QueryCache(max_entries=2, ttl=None)
+
+def test_make_key():
+    '''
+    Tests equivalent queries share a key while distinct ones do not
+    '''
+    assert QueryCache.make_key({'cuisine': 'Thai', 'rating': 3}) == QueryCache.make_key({'rating': 3, 'cuisine': 'thai'})
+    assert QueryCache.make_key({'rating': 3}) != QueryCache.make_key({'rating': 4})
+    assert QueryCache.make_key({'cursor': 'cmFuazoy'}) != QueryCache.make_key({'cursor': 'CMFUAZOY'})
+
+def test_hits_misses_and_evictions(return_query_cache):
+    '''
+    Tests least recently used entries are evicted once the cache is full
+    '''
+    return_query_cache.put(1, ('a',), [1])
+    return_query_cache.put(1, ('b',), [2])
+    assert return_query_cache.get(1, ('a',)) == [1]
+    return_query_cache.put(1, ('c',), [3])
+
+    assert return_query_cache.get(1, ('b',)) is None
+    assert return_query_cache.get(1, ('c',)) == [3]
+    stats = return_query_cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (2, 1, 1)
+
+def test_expiry():
+    '''
+    Tests entries older than the ttl are not served
+    '''
+    query_cache = QueryCache(ttl=0)
+    query_cache.put(1, ('a',), [1])
+
+    assert query_cache.get(1, ('a',)) is None
+    assert query_cache.stats()['expirations'] == 1
+
+def test_version_invalidation(return_query_cache):
+    '''
+    Tests a new dataset version drops every entry, stale results are not cached
+    and requests still on an older version are not served the newer entries
+    '''
+    return_query_cache.put(1, ('a',), [1])
+    assert return_query_cache.get(2, ('a',)) is None
+    assert return_query_cache.stats()['invalidations'] == 1
+
+    # computed against version 1 after version 2 was seen
+    return_query_cache.put(1, ('b',), [2])
+    assert return_query_cache.get(2, ('b',)) is None
+
+    # started on version 1 before version 2 was seen
+    return_query_cache.put(2, ('c',), [3])
+    assert return_query_cache.get(1, ('c',)) is None
+    assert return_query_cache.get(2, ('c',)) == [3]
+
+def test_region_invalidation(return_query_cache):
+    '''
+    Tests a new dataset version of a region only drops that region's entries
+    '''
+    return_query_cache.put(1, ('a',), [1])
+    return_query_cache.put(5, ('b',), [2], scope='nyc')
+
+    assert return_query_cache.get(6, ('b',), scope='nyc') is None
+    assert return_query_cache.get(1, ('a',)) == [1]
+    assert return_query_cache.stats()['invalidations'] == 1
@@ -0,0 +1,219 @@
+import json
+import shutil
+import pytest
+from flask import Flask
+from restaurant_matcher.data_management.dataset_holder import DatasetHolder
+from restaurant_matcher.data_management.dataset_registry import DatasetRegistry
+from restaurant_matcher.match_service.query_cache import QueryCache
+from restaurant_matcher.match_service.routes import create_match_service_blueprint
+
+def return_client(dataset_registry):
+    app = Flask(__name__)
+    app.register_blueprint(create_match_service_blueprint(dataset_registry, QueryCache()))
+    return app.test_client()
+
+@pytest.fixture
+def return_regions_directory(tmp_path):
+    for region in ('nyc', 'sf'):
+        (tmp_path / region).mkdir()
+        shutil.copy('tests/fixtures/test_cuisines.csv', str(tmp_path / region / 'cuisines.csv'))
+        shutil.copy('tests/fixtures/test_restaurants.csv', str(tmp_path / region / 'restaurants.csv'))
+    return str(tmp_path)
+
+@pytest.fixture
+def return_test_client(return_regions_directory):
+    dataset_holder = DatasetHolder('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv',
+                                   check_interval=None)
+    return return_client(DatasetRegistry(dataset_holder, return_regions_directory, check_interval=None))
+
+def test_not_modified(return_test_client):
+    '''
+    Tests a search sent with the ETag of its previous response gets a bodiless 304 until the dataset changes
+    '''
+    response = return_test_client.get('/match_service/?rating=4')
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'public, max-age=5'
+
+    response = return_test_client.get('/match_service/?rating=4', headers={'If-None-Match': etag})
+    assert (response.status_code, response.data) == (304, b'')
+    assert response.headers['ETag'] == etag
+    # another query does not match the tag
+    response = return_test_client.get('/match_service/?rating=5', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+    return_test_client.put('/match_service/restaurants/applebees9', json={'cuisine': 'thai', 'rating': 4,
+                                                                         'distance': 1, 'price': 10})
+    response = return_test_client.get('/match_service/?rating=4', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert json.loads(response.data)[0]['name'] == 'applebees9'
+
+def test_batch(return_test_client):
+    '''
+    Tests a batch answers every query in order, each the same as its own search
+    '''
+    queries = [{'rating': 4}, {'name': 'red lobster', 'limit': 1}, {'cuisine': 'thai', 'fields': 'name', 'explain': False}]
+    response = return_test_client.post('/match_service/batch', json=queries)
+    answers = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert len(answers) == 3
+    assert answers[0]['restaurants'] == json.loads(return_test_client.get('/match_service/?rating=4').data)
+    assert [restaurant['name'] for restaurant in answers[1]['restaurants']] == ['applebees red lobster']
+    assert answers[1]['next_cursor']
+    assert answers[2] == {'restaurants': [{'name': 'applebees red lobster'}, {'name': 'applebees6'}]}
+
+@pytest.mark.parametrize('body', [
+    {'rating': 4},
+    [],
+    [{'rating': 4}] * 101,
+    [{'rating': 9}],
+    [{'rating': 4}, {'rating': 4, 'region': 'nyc'}],
+    [{'rating': 4}, {'rating': 4, 'explain': True}],
+    [{'rating': 4, 'facets': 'true'}],
+])
+def test_invalid_batch(return_test_client, body):
+    '''
+    Tests a batch that is not a list of 1 to 100 valid queries for one region, answered as restaurant lists, is rejected
+    '''
+    assert return_test_client.post('/match_service/batch', json=body).status_code == 400
+
+def test_restaurant_writes(return_test_client):
+    '''
+    Tests the status codes of adding, updating and removing restaurants
+    '''
+    new_restaurant = {'cuisine': 'thai', 'rating': 4, 'distance': 1, 'price': 10}
+    response = return_test_client.put('/match_service/restaurants/applebees9', json=new_restaurant)
+    assert (response.status_code, response.get_json()) == (200, {'version': 2})
+    assert return_test_client.put('/match_service/restaurants/applebees9', json={'price': 20}).status_code == 200
+    assert json.loads(return_test_client.get('/match_service/?name=applebees9').data)[0]['price'] == '20'
+
+    # incomplete new restaurant, invalid value and unknown cuisine
+    assert return_test_client.put('/match_service/restaurants/applebees10', json={'rating': 4}).status_code == 400
+    assert return_test_client.put('/match_service/restaurants/applebees9', json={'rating': 9}).status_code == 400
+    assert return_test_client.put('/match_service/restaurants/applebees9', json={'cuisine': 'greek'}).status_code == 400
+
+    assert return_test_client.delete('/match_service/restaurants/applebees9').status_code == 200
+    assert return_test_client.delete('/match_service/restaurants/applebees9').status_code == 404
+    assert json.loads(return_test_client.get('/match_service/?name=applebees9').data) == []
+
+def test_shared_name_writes(tmp_path):
+    '''
+    Tests writes to a name several restaurants have conflict with them
+    '''
+    restaurant_csv_path = str(tmp_path / 'restaurants.csv')
+    with open('tests/fixtures/test_restaurants.csv') as read_obj, open(restaurant_csv_path, 'w') as write_obj:
+        write_obj.write(read_obj.read() + 'red lobster,5,2,20,2\n')
+    test_client = return_client(DatasetRegistry(DatasetHolder('tests/fixtures/test_cuisines.csv', restaurant_csv_path,
+                                                              check_interval=None)))
+
+    assert test_client.put('/match_service/restaurants/red lobster', json={'price': 20}).status_code == 409
+    assert test_client.delete('/match_service/restaurants/red lobster').status_code == 409
+    assert test_client.delete('/match_service/restaurants/applebees1').status_code == 200
+
+def test_writes_not_supported():
+    '''
+    Tests writes to an engine that can not be written to conflict with it
+    '''
+    dataset_holder = DatasetHolder('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv',
+                                   engine='materialized', check_interval=None)
+    test_client = return_client(DatasetRegistry(dataset_holder))
+
+    assert test_client.put('/match_service/restaurants/applebees1', json={'price': 20}).status_code == 409
+    assert test_client.delete('/match_service/restaurants/applebees1').status_code == 409
+    assert dataset_holder.current().version == 1
+
+def test_read_only(return_regions_directory):
+    '''
+    Tests an app built read only, as under the pre-fork server, refuses writes and reloads but still searches
+    '''
+    dataset_holder = DatasetHolder('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_restaurants.csv',
+                                   check_interval=None)
+    app = Flask(__name__)
+    app.register_blueprint(create_match_service_blueprint(DatasetRegistry(dataset_holder, return_regions_directory,
+                                                                          check_interval=None), read_only=True))
+    test_client = app.test_client()
+
+    for response in [test_client.post('/match_service/reload'),
+                     test_client.post('/match_service/reload?region=nyc'),
+                     test_client.put('/match_service/restaurants/applebees9', json={'price': 20}),
+                     test_client.delete('/match_service/restaurants/applebees1')]:
+        assert response.status_code == 405
+    assert dataset_holder.current().version == 1
+    assert test_client.get('/match_service/?name=applebees1').status_code == 200
+
+def test_response_fields(return_test_client):
+    '''
+    Tests a fields projection is sent as the pre-encoded restaurant bytes, in the usual field order,
+    and answered the same from the cache
+    '''
+    expected = (b'[{"name": "applebees4", "price": "40"}, {"name": "applebees5", "price": "50"}, '
+                b'{"name": "applebees red lobster", "price": "45"}]\n')
+    for _ in range(2):
+        response = return_test_client.get('/match_service/?rating=4&fields=price,name')
+        assert (response.status_code, response.mimetype, response.data) == (200, 'application/json', expected)
+
+    response = return_test_client.get('/match_service/?rating=4&limit=1&fields=distance')
+    assert response.data == b'[{"distance": "4"}]\n'
+    assert 'X-Next-Cursor' in response.headers
+    assert 'fields' in return_test_client.get('/match_service/?fields=name,stars').get_json()
+
+def test_regions(return_test_client):
+    '''
+    Tests the region param picks the dataset of a request and unknown regions are not found
+    '''
+    return_test_client.put('/match_service/restaurants/applebees9?region=NYC', json={'cuisine': 'thai', 'rating': 4,
+                                                                                    'distance': 1, 'price': 10})
+    assert json.loads(return_test_client.get('/match_service/?name=applebees9&region=nyc').data)[0]['name'] == 'applebees9'
+    assert json.loads(return_test_client.get('/match_service/?name=applebees9').data) == []
+    assert json.loads(return_test_client.get('/match_service/?name=applebees9&region=sf').data) == []
+    assert return_test_client.post('/match_service/batch', json=[{'name': 'applebees9', 'region': 'nyc'}]).status_code == 200
+
+    for response in [return_test_client.get('/match_service/?region=paris'),
+                     return_test_client.post('/match_service/batch', json=[{'rating': 4, 'region': 'paris'}]),
+                     return_test_client.post('/match_service/reload?region=paris'),
+                     return_test_client.put('/match_service/restaurants/applebees9?region=paris', json={'price': 20}),
+                     return_test_client.delete('/match_service/restaurants/applebees9?region=paris')]:
+        assert (response.status_code, response.get_json()) == (404, {'message': "Unknown region 'paris'"})
+
+def test_region_reload(return_test_client):
+    '''
+    Tests reloading a region that is not loaded yet loads it once
+    '''
+    assert return_test_client.post('/match_service/reload?region=sf').get_json() == {'version': 1, 'rows_rejected': 0}
+    assert return_test_client.get('/match_service/regions').get_json()['loads'] == 1
+    assert return_test_client.post('/match_service/reload?region=sf').get_json()['version'] == 2
+
+def test_unavailable_region(return_test_client, return_regions_directory):
+    '''
+    Tests a region whose files do not load is unavailable rather than a server error
+    '''
+    with open(f'{return_regions_directory}/nyc/cuisines.csv', 'w') as write_obj:
+        write_obj.write('not,a,cuisines,header\n1,2,3,4\n')
+
+    for response in [return_test_client.get('/match_service/?region=nyc'),
+                     return_test_client.post('/match_service/batch', json=[{'rating': 4, 'region': 'nyc'}]),
+                     return_test_client.post('/match_service/reload?region=nyc'),
+                     return_test_client.put('/match_service/restaurants/applebees9?region=nyc', json={'price': 20}),
+                     return_test_client.delete('/match_service/restaurants/applebees9?region=nyc')]:
+        assert response.status_code == 503
+        assert response.get_json()['message'].startswith("Region 'nyc' failed to load")
+
+def test_located_distances():
+    '''
+    Tests located searches and batches send the distance computed from the location, also when answered from the cache
+    '''
+    dataset_holder = DatasetHolder('tests/fixtures/test_cuisines.csv', 'tests/fixtures/test_geo_restaurants.csv',
+                                   check_interval=None)
+    test_client = return_client(DatasetRegistry(dataset_holder))
+    query = '/match_service/?lat=40.7359&lng=-73.9911&radius=1'
+
+    for _ in range(2):
+        restaurants = json.loads(test_client.get(query).data)
+        assert [restaurant['distance'] for restaurant in restaurants] == ['0.59', '0.43', '0.00', '0.90']
+    assert test_client.get(query + '&limit=1&fields=distance').data == b'[{"distance": "0.59"}]\n'
+    response = test_client.post('/match_service/batch', json=[{'lat': 40.7359, 'lng': -73.9911, 'radius': 1}, {'rating': 5}])
+    answers = json.loads(response.data)
+    assert answers[0]['restaurants'] == restaurants
+    assert answers[1]['restaurants'][0]['distance'] == '1'
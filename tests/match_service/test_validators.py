@@ -1,5 +1,6 @@
 import pytest
-from restaurant_matcher.match_service.validators import MatchServiceSchema
+from restaurant_matcher.match_service.pagination import encode_cursor
+from restaurant_matcher.match_service.validators import MatchServiceSchema, RestaurantSchema
 
 @pytest.fixture
 def return_match_service_schema():
@@ -63,3 +64,76 @@ def test_invalid_parameters(return_match_service_schema):
     params = {'name': 1, 'rating': 111, 'distance': 12, 'price': 10, 'cuisine': 'test'}
     number_of_errors = 3
     assert len(return_match_service_schema.validate(params).keys()) == number_of_errors
+
+def test_pagination_parameters(return_match_service_schema):
+    '''
+    Tests limit must be in range and cursor must be one handed out by the api
+    '''
+    assert return_match_service_schema.validate({'limit': 10, 'cursor': encode_cursor(10)}) == {}
+    assert list(return_match_service_schema.validate({'limit': 0}).keys()) == ['limit']
+    assert list(return_match_service_schema.validate({'limit': 101}).keys()) == ['limit']
+    assert list(return_match_service_schema.validate({'cursor': 'abc'}).keys()) == ['cursor']
+
+def test_restaurant_write_fields():
+    '''
+    Tests restaurant writes accept any subset of fields within the search ranges
+    '''
+    restaurant_schema = RestaurantSchema()
+    assert restaurant_schema.validate({'cuisine': 'Thai', 'rating': 5, 'distance': 1, 'price': 10}) == {}
+    assert restaurant_schema.validate({'price': 45}) == {}
+    assert sorted(restaurant_schema.validate({'rating': 6, 'price': 'cheap'}).keys()) == ['price', 'rating']
+
+def test_batch_parameters():
+    '''
+    Tests a batch validates every query and reports errors by query index
+    '''
+    batch_schema = MatchServiceSchema(many=True)
+    assert batch_schema.validate([{'rating': 1}, {'name': 'test', 'limit': 10}]) == {}
+    assert batch_schema.validate([{'rating': 1}, {'rating': 6}]) == {1: {'rating': ['Must be greater than or equal to 1 and less than or equal to 5.']}}
+
+def test_explain_parameter(return_match_service_schema):
+    '''
+    Tests explain takes a boolean
+    '''
+    assert return_match_service_schema.validate({'explain': 'true', 'rating': 1}) == {}
+    assert 'explain' in return_match_service_schema.validate({'explain': 'maybe'})
+
+def test_fields_parameter(return_match_service_schema):
+    '''
+    Tests fields takes a comma separated subset of the restaurant fields
+    '''
+    assert return_match_service_schema.load({'fields': 'name,price'}) == {'response_fields': 'name,price'}
+    assert 'fields' in return_match_service_schema.validate({'fields': 'name,stars'})
+
+def test_location_parameters(return_match_service_schema):
+    '''
+    Tests a location needs both coordinates in range and a radius needs a location
+    '''
+    assert return_match_service_schema.validate({'lat': '40.7359', 'lng': '-73.9911', 'radius': '1.5'}) == {}
+    assert list(return_match_service_schema.validate({'lat': 91, 'lng': 0}).keys()) == ['lat']
+    assert list(return_match_service_schema.validate({'lat': 40.7}).keys()) == ['lng']
+    assert list(return_match_service_schema.validate({'radius': 2}).keys()) == ['radius']
+    assert list(return_match_service_schema.validate({'lat': 40.7, 'lng': -73.9, 'radius': 0}).keys()) == ['radius']
+    assert RestaurantSchema().validate({'latitude': 40.7, 'longitude': -73.9}) == {}
+    assert list(RestaurantSchema().validate({'latitude': 40.7}).keys()) == ['longitude']
+
+def test_region_parameter(return_match_service_schema):
+    '''
+    Tests a region is a plain name that can not reach outside the regions directory
+    '''
+    assert return_match_service_schema.validate({'region': 'New-York_2'}) == {}
+    for region in ['', '../secrets', 'new york', 'a' * 65]:
+        assert list(return_match_service_schema.validate({'region': region}).keys()) == ['region']
+
+def test_range_and_sort_parameters(return_match_service_schema):
+    '''
+    Tests both ends of a range must be in order and the sort param only names rankable params once
+    '''
+    assert return_match_service_schema.validate({'rating': 2, 'rating_max': 4, 'price_min': 20, 'price': 35}) == {}
+    assert return_match_service_schema.validate({'distance_min': 3, 'sort': 'Price,rating'}) == {}
+    assert list(return_match_service_schema.validate({'rating': 4, 'rating_max': 2}).keys()) == ['rating_max']
+    assert list(return_match_service_schema.validate({'distance_min': 5, 'distance': 3}).keys()) == ['distance']
+    assert list(return_match_service_schema.validate({'price_min': 5}).keys()) == ['price_min']
+    assert list(return_match_service_schema.validate({'distance_min': 2, 'lat': 40.7, 'lng': -73.9}).keys()) == ['distance_min']
+    assert list(return_match_service_schema.validate({'sort': 'price,stars'}).keys()) == ['sort']
+    assert list(return_match_service_schema.validate({'sort': 'price,Price'}).keys()) == ['sort']